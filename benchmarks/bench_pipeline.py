@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+部署流程基准测试
+
+在临时目录中生成可复现的合成数据（N个模组的workshop目录、M个存档快照的世界
+文件夹、不同大小的配置文件压缩包），用假的SteamCMD和假的服务器程序在无界面
+模式下对各步骤计时，结果写入JSON文件。指定--baseline时与之前的结果比较，
+中位数变慢超过阈值时以退出码1结束，便于在本地发现性能退化。
+
+用法：
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --mods 200 --sessions 20 --zip-sizes 1 16 64
+    python benchmarks/bench_pipeline.py --baseline benchmarks/results/base.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dst_pipeline
+from dst_pipeline import CLUSTER_NAME, DST_SERVER_APP_ID, DeployPipeline
+
+# 结果文件格式版本，格式不兼容时比较会被拒绝
+BENCH_SCHEMA_VERSION = 1
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 假的SteamCMD：输出与真实SteamCMD相同格式的进度行，并写入应用清单
+FAKE_STEAMCMD = '''
+import os, sys, time
+steps = 20
+for i in range(1, steps + 1):
+    print(f" Update state (0x61) downloading, progress: {i * 100 / steps:.2f} ({i} / {steps})", flush=True)
+    time.sleep(0.005)
+apps = os.path.join(os.path.dirname(os.path.abspath(__file__)), "steamapps")
+os.makedirs(apps, exist_ok=True)
+with open(os.path.join(apps, "appmanifest_%s.acf"), "w") as f:
+    f.write('"AppState"\\n{\\n\\t"appid"\\t\\t"%s"\\n\\t"buildid"\\t\\t"1"\\n}\\n')
+print("Success! App '%s' fully installed.", flush=True)
+''' % (DST_SERVER_APP_ID, DST_SERVER_APP_ID, DST_SERVER_APP_ID)
+
+# 假的服务器程序：写一行日志后保持运行，直到被停止
+FAKE_SERVER = '''
+import sys, time
+print("fake dedicated server", sys.argv[1:], flush=True)
+time.sleep(600)
+'''
+
+
+def write_random_file(path, size, rng, compressible=False):
+    """写入指定大小的文件，compressible为True时内容容易压缩（模拟lua脚本）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        if compressible:
+            line = b"local value = GetModConfigData(\"option\") -- synthetic\n"
+            f.write((line * (size // len(line) + 1))[:size])
+        else:
+            f.write(rng.randbytes(size))
+
+
+def make_workshop(steam_path, mods, files_per_mod, file_size, rng):
+    """生成含mods个模组的workshop目录"""
+    workshop = os.path.join(steam_path, "steamapps", "workshop", "content", "322330")
+    for mod in range(mods):
+        mod_path = os.path.join(workshop, str(1000000 + mod))
+        write_random_file(os.path.join(mod_path, "modinfo.lua"), 512, rng, compressible=True)
+        write_random_file(os.path.join(mod_path, "modmain.lua"), 4096, rng, compressible=True)
+        for i in range(files_per_mod):
+            sub = "images" if i % 2 else "anim"
+            write_random_file(os.path.join(mod_path, sub, f"asset_{i}.tex"), file_size, rng)
+    return workshop
+
+
+def make_world(world_path, sessions, snapshot_size, rng):
+    """生成含sessions个存档快照（地上和洞穴各一份）的世界文件夹"""
+    with open(os.path.join(makedirs(world_path), "cluster.ini"), 'w', encoding='utf-8') as f:
+        f.write("[GAMEPLAY]\ngame_mode = survival\nmax_players = 6\n\n[NETWORK]\ncluster_name = bench\n")
+    for shard, is_master in (("Master", "true"), ("Caves", "false")):
+        shard_path = makedirs(os.path.join(world_path, shard))
+        with open(os.path.join(shard_path, "server.ini"), 'w', encoding='utf-8') as f:
+            f.write(f"[SHARD]\nis_master = {is_master}\nname = {shard}\n")
+        with open(os.path.join(shard_path, "leveldataoverride.lua"), 'w', encoding='utf-8') as f:
+            f.write("return { id = \"SURVIVAL_TOGETHER\", overrides = {} }\n")
+        session = os.path.join(shard_path, "save", "session", "BENCH0000000001")
+        for i in range(sessions):
+            write_random_file(os.path.join(session, f"{i:010d}"), snapshot_size, rng)
+            write_random_file(os.path.join(session, "A7BENCHUSER", f"{i:010d}"), snapshot_size // 16, rng)
+
+
+def make_cluster_zip(path, size, rng):
+    """生成与Klei网站下载格式相同、总大小约为size字节的配置文件压缩包"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{CLUSTER_NAME}/cluster_token.txt", "pds-g^BENCH^TOKEN")
+        zf.writestr(f"{CLUSTER_NAME}/cluster.ini", "[GAMEPLAY]\ngame_mode = survival\n")
+        zf.writestr(f"{CLUSTER_NAME}/Master/server.ini", "[SHARD]\nis_master = true\n")
+        zf.writestr(f"{CLUSTER_NAME}/Caves/server.ini", "[SHARD]\nis_master = false\n")
+        # 填充数据一半难以压缩、一半容易压缩，覆盖并行解压和串行解压两种路径
+        chunk = 2 * 1024 * 1024
+        written = 0
+        index = 0
+        while written < size:
+            part = min(chunk, size - written)
+            data = rng.randbytes(part) if index % 2 == 0 else bytes(part)
+            zf.writestr(f"{CLUSTER_NAME}/Master/save/blob_{index}.bin", data)
+            written += part
+            index += 1
+
+
+def make_fake_binary(directory, name, source):
+    """写入假的可执行程序，返回可直接执行的路径"""
+    script = os.path.join(makedirs(directory), f"{name}.py")
+    with open(script, 'w', encoding='utf-8') as f:
+        f.write(f"#!{sys.executable}\n{source}")
+    if sys.platform == "win32":
+        # Windows不能直接执行.py文件，用批处理包装
+        wrapper = os.path.join(directory, f"{name}.bat")
+        with open(wrapper, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+        return wrapper
+    os.chmod(script, 0o755)
+    return script
+
+
+def makedirs(path):
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class Fixtures:
+    """一次基准测试使用的全部合成数据和路径"""
+
+    def __init__(self, root, args):
+        rng = random.Random(args.seed)
+        self.root = root
+        self.steam_path = os.path.join(root, "steam")
+        self.steamcmd_path = makedirs(os.path.join(root, "steamcmd"))
+        self.world_folder = os.path.join(root, "world", "Cluster_1")
+        self.zips = {}
+
+        make_workshop(self.steam_path, args.mods, args.files_per_mod, args.mod_file_size, rng)
+        make_world(self.world_folder, args.sessions, args.snapshot_size, rng)
+        for size_mb in args.zip_sizes:
+            path = os.path.join(root, f"cluster_{size_mb}mb.zip")
+            make_cluster_zip(path, int(size_mb * 1024 * 1024), rng)
+            self.zips[size_mb] = path
+
+        self.steamcmd_exe = make_fake_binary(self.steamcmd_path, "steamcmd", FAKE_STEAMCMD)
+        server_bin = os.path.join(self.steamcmd_path, "steamapps", "common",
+                                  "Don't Starve Together Dedicated Server", "bin64")
+        self.server_exe = make_fake_binary(server_bin, "dontstarve_dedicated_server_nullrenderer_x64",
+                                           FAKE_SERVER)
+
+    def config(self, klei_path, zip_size=None, **overrides):
+        """生成指向合成数据的部署配置"""
+        config = {
+            'config_file': self.zips[zip_size if zip_size is not None else min(self.zips)],
+            'steamcmd_path': self.steamcmd_path,
+            'steam_path': self.steam_path,
+            'world_folder': self.world_folder,
+            'klei_path': klei_path,
+            'steamcmd_exe': self.steamcmd_exe,
+            'server_exe': self.server_exe,
+            'update_policy': 'update',
+            'auto_restart': False,
+            'tail_logs': False,
+        }
+        config.update(overrides)
+        return config
+
+
+class BenchRunner:
+    """按场景重复计时，记录每次耗时"""
+
+    def __init__(self, repeat, verbose=False):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = {}
+
+    def on_event(self, event):
+        if self.verbose and event["type"] == "log":
+            print(f"    [{event['level']}] {event['message']}")
+
+    def measure(self, name, func, setup=None, repeat=None):
+        """执行setup()（不计时）后对func(setup的返回值)计时，重复repeat次"""
+        runs = []
+        for _ in range(repeat or self.repeat):
+            state = setup() if setup is not None else None
+            start = time.perf_counter()
+            func(state)
+            runs.append(time.perf_counter() - start)
+        self.results[name] = {
+            "runs": runs,
+            "min": min(runs),
+            "median": statistics.median(runs),
+            "mean": statistics.fmean(runs),
+        }
+        print(f"  {name:<28} 中位数 {self.results[name]['median'] * 1000:9.1f} ms"
+              f"  最小 {self.results[name]['min'] * 1000:9.1f} ms  ({len(runs)} 次)")
+
+
+def run_benchmarks(fixtures, runner, work):
+    """依次运行各场景"""
+    counter = [0]
+
+    def fresh_dir(name):
+        counter[0] += 1
+        path = os.path.join(work, f"{name}_{counter[0]}")
+        shutil.rmtree(path, ignore_errors=True)
+        return makedirs(path)
+
+    def pipeline(klei_path, **overrides):
+        return DeployPipeline(fixtures.config(klei_path, **overrides), on_event=runner.on_event)
+
+    # 解压配置文件：冷（空目录）与热（文件未变，按CRC跳过）
+    for size_mb in sorted(fixtures.zips):
+        warm_path = fresh_dir("extract_warm")
+        pipeline(warm_path, zip_size=size_mb).extract_config_file(warm_path)
+        runner.measure(f"extract_config_{size_mb}mb_cold",
+                       lambda klei: pipeline(klei, zip_size=size_mb).extract_config_file(klei),
+                       setup=lambda: fresh_dir("extract"))
+        runner.measure(f"extract_config_{size_mb}mb_warm",
+                       lambda _: pipeline(warm_path, zip_size=size_mb).extract_config_file(warm_path))
+
+    # 同步世界文件
+    warm_world = fresh_dir("world_warm")
+    pipeline(warm_world).copy_world_files(os.path.join(warm_world, CLUSTER_NAME))
+    runner.measure("copy_world_cold",
+                   lambda klei: pipeline(klei).copy_world_files(os.path.join(klei, CLUSTER_NAME)),
+                   setup=lambda: fresh_dir("world"))
+    runner.measure("copy_world_warm",
+                   lambda _: pipeline(warm_world).copy_world_files(os.path.join(warm_world, CLUSTER_NAME)))
+
+    # 复制模组（冷启动时每次使用新的安装目录）
+    def mods_setup():
+        return fresh_dir("mods")
+
+    def copy_mods(install, **overrides):
+        pipeline(work, server_install_path=install, **overrides).copy_mods()
+
+    warm_install = fresh_dir("mods_warm")
+    copy_mods(warm_install)
+    runner.measure("copy_mods_cold", copy_mods, setup=mods_setup)
+    runner.measure("copy_mods_warm", lambda _: copy_mods(warm_install))
+    runner.measure("copy_mods_cold_copy", lambda install: copy_mods(install, mod_copy_strategy="copy"),
+                   setup=mods_setup)
+
+    # 清理服务器文件夹（每次先放入一份世界文件副本）
+    def clean_setup():
+        path = os.path.join(fresh_dir("clean"), CLUSTER_NAME)
+        shutil.copytree(fixtures.world_folder, path)
+        with open(os.path.join(path, "cluster_token.txt"), 'w', encoding='utf-8') as f:
+            f.write("token")
+        return path
+
+    runner.measure("clean_server_folder", lambda path: pipeline(work).clean_server_folder(path),
+                   setup=clean_setup)
+
+    # SteamCMD更新（假的SteamCMD）
+    runner.measure("update_steamcmd", lambda _: pipeline(work).update_steamcmd())
+
+    # 完整流程，包括启动假服务器；计时后停止分片进程
+    stage_times = {}
+
+    def full_run(klei, **overrides):
+        deploy = pipeline(klei, **dict({'stage_cache': False}, **overrides))
+        deploy.on_event = lambda event: (stage_times.update(event["stages"])
+                                         if event["type"] == "summary" else runner.on_event(event))
+        try:
+            deploy.run()
+        finally:
+            if deploy.supervisor is not None:
+                deploy.supervisor.stop(timeout=5, graceful=False)
+
+    runner.measure("full_pipeline", full_run, setup=lambda: fresh_dir("full"))
+    
+    # 输入未变时重新部署：除SteamCMD和启动外的步骤按缓存跳过
+    cached_klei = fresh_dir("full_cached")
+    full_run(cached_klei, stage_cache=True)
+    runner.measure("redeploy_cached", lambda _: full_run(cached_klei, stage_cache=True))
+    return stage_times
+
+
+def compare(results, baseline, threshold):
+    """与基准结果比较中位数，返回变慢超过阈值的场景"""
+    regressions = []
+    print(f"\n与基准比较（阈值 {threshold:g}%）:")
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name:<28} 基准中没有该场景")
+            continue
+        change = (result["median"] - base["median"]) / base["median"] * 100 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  <-- 变慢"
+            regressions.append(name)
+        print(f"  {name:<28} {base['median'] * 1000:9.1f} ms -> {result['median'] * 1000:9.1f} ms"
+              f"  ({change:+.1f}%){flag}")
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="饥荒联机版服务器部署流程基准测试")
+    parser.add_argument("--mods", type=int, default=40, help="workshop模组数量")
+    parser.add_argument("--files-per-mod", type=int, default=20, help="每个模组的资源文件数量")
+    parser.add_argument("--mod-file-size", type=int, default=32 * 1024, help="每个资源文件的字节数")
+    parser.add_argument("--sessions", type=int, default=10, help="每个分片的存档快照数量")
+    parser.add_argument("--snapshot-size", type=int, default=512 * 1024, help="每个存档快照的字节数")
+    parser.add_argument("--zip-sizes", type=float, nargs="+", default=[1, 16], help="配置文件压缩包大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景重复次数")
+    parser.add_argument("--seed", type=int, default=20240101, help="生成合成数据的随机种子")
+    parser.add_argument("--workdir", help="生成数据的目录（默认使用临时目录，结束后删除）")
+    parser.add_argument("--output", help="结果JSON文件（默认写入benchmarks/results/）")
+    parser.add_argument("--baseline", help="与之比较的基准结果JSON文件")
+    parser.add_argument("--threshold", type=float, default=20.0, help="中位数变慢超过该百分比视为退化")
+    parser.add_argument("--verbose", action="store_true", help="输出部署流程日志")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    args.zip_sizes = [int(size) if float(size).is_integer() else size for size in args.zip_sizes]
+    root = args.workdir or tempfile.mkdtemp(prefix="dst_bench_")
+    os.makedirs(root, exist_ok=True)
+    # 更新状态和步骤缓存写入临时目录，不影响工具目录中的真实状态
+    dst_pipeline.UPDATE_STATE_PATH = os.path.join(root, "update_state.json")
+    dst_pipeline.STAGE_CACHE_PATH = os.path.join(root, "stage_cache.json")
+    try:
+        print(f"生成合成数据: {root}")
+        start = time.perf_counter()
+        fixtures = Fixtures(os.path.join(root, "fixtures"), args)
+        print(f"合成数据生成完成，耗时 {time.perf_counter() - start:.1f} 秒\n")
+
+        runner = BenchRunner(args.repeat, verbose=args.verbose)
+        stage_times = run_benchmarks(fixtures, runner, makedirs(os.path.join(root, "work")))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = {
+        "schema": BENCH_SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": {key: value for key, value in vars(args).items()
+                   if key not in ("workdir", "output", "baseline", "threshold", "verbose")},
+        "results": runner.results,
+        "full_pipeline_stages": stage_times,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入: {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("schema") != BENCH_SCHEMA_VERSION:
+            print("基准结果的格式版本不同，无法比较", file=sys.stderr)
+            return 2
+        if baseline.get("params") != results["params"]:
+            print("警告: 基准结果使用了不同的测试参数，比较结果仅供参考", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n性能退化: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+集群目录的增量备份（不依赖tkinter）
+
+每次部署切换集群前给正式集群拍一个快照。文件按固定大小切块，每块按内容的
+SHA-256去重后压缩保存，快照只记录各文件由哪些块组成；相邻两次快照之间大部分
+存档没有变化，只有新增或修改过的块会被写入。大小和修改时间都与上一个快照
+相同的文件不再读取，直接沿用上一个快照中的块列表。
+
+备份目录结构：
+    chunks/ab/abcdef...          压缩后的数据块（首字节为格式标记）
+    snapshots/<集群名>/<ID>.json  快照清单
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 切块大小：存档文件大多小于1MB，整文件即为一块；大文件只有变化的块需要重新保存
+BACKUP_CHUNK_SIZE = 1024 * 1024
+BACKUP_COMPRESS_LEVEL = 6
+BACKUP_SNAPSHOT_VERSION = 1
+# 数据块首字节：压缩后没有变小的数据直接原样保存
+CHUNK_ZLIB = b"z"
+CHUNK_RAW = b"r"
+# 默认保留策略：最近N个快照，以及最近若干天、若干周中每天/每周最新的一个
+BACKUP_KEEP_LAST = 10
+BACKUP_KEEP_DAILY = 7
+BACKUP_KEEP_WEEKLY = 4
+
+
+class BackupStore:
+    """按块去重、压缩保存的集群快照仓库
+
+    snapshot()备份一个集群目录，restore()把快照还原到指定目录，
+    prune()按保留策略删除旧快照并回收不再被引用的数据块。
+    """
+
+    def __init__(self, root, workers=4, compress_level=BACKUP_COMPRESS_LEVEL):
+        self.root = os.path.abspath(root)
+        self.chunks_path = os.path.join(self.root, "chunks")
+        self.snapshots_path = os.path.join(self.root, "snapshots")
+        self.tmp_path = os.path.join(self.root, "tmp")
+        for path in (self.chunks_path, self.snapshots_path, self.tmp_path):
+            os.makedirs(path, exist_ok=True)
+        self.workers = max(1, int(workers))
+        self.compress_level = compress_level
+        self.lock = threading.Lock()
+        self.added_chunks = 0
+        self.added_bytes = 0
+
+    def chunk_path(self, digest):
+        """数据块在仓库中的路径"""
+        return os.path.join(self.chunks_path, digest[:2], digest)
+
+    def put_chunk(self, data):
+        """保存一个数据块，返回其哈希；相同内容的块已存在时不再写入"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return digest
+        compressed = zlib.compress(data, self.compress_level)
+        payload = CHUNK_ZLIB + compressed if len(compressed) < len(data) else CHUNK_RAW + data
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，中断时不会留下不完整的块
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self.lock:
+            self.added_chunks += 1
+            self.added_bytes += len(payload)
+        return digest
+
+    def get_chunk(self, digest):
+        """读取并解压一个数据块"""
+        with open(self.chunk_path(digest), 'rb') as f:
+            payload = f.read()
+        if payload[:1] == CHUNK_ZLIB:
+            return zlib.decompress(payload[1:])
+        return payload[1:]
+
+    def store_file(self, path):
+        """把文件切块保存，返回块哈希列表"""
+        chunks = []
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b""):
+                chunks.append(self.put_chunk(data))
+        return chunks
+
+    def snapshot_dir(self, cluster):
+        return os.path.join(self.snapshots_path, cluster)
+
+    def list_snapshots(self, cluster=None):
+        """返回快照清单（不含文件列表），按创建时间从新到旧排列"""
+        clusters = [cluster] if cluster else sorted(os.listdir(self.snapshots_path))
+        result = []
+        for name in clusters:
+            for manifest in self.load_manifests(name):
+                result.append({k: v for k, v in manifest.items() if k not in ("files", "dirs")})
+        result.sort(key=lambda m: m["created"], reverse=True)
+        return result
+
+    def load_manifests(self, cluster):
+        """读取某个集群的全部快照清单，跳过损坏的清单"""
+        path = self.snapshot_dir(cluster)
+        if not os.path.isdir(path):
+            return []
+        manifests = []
+        for name in os.listdir(path):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if manifest.get("version") == BACKUP_SNAPSHOT_VERSION:
+                manifests.append(manifest)
+        return manifests
+
+    def load_snapshot(self, snapshot_id, cluster=None):
+        """按ID读取快照清单；snapshot_id为None时返回该集群最新的快照"""
+        clusters = [cluster] if cluster else sorted(os.listdir(self.snapshots_path))
+        candidates = [m for name in clusters for m in self.load_manifests(name)
+                      if snapshot_id is None or m["id"] == snapshot_id]
+        if not candidates:
+            raise FileNotFoundError(f"找不到备份: {snapshot_id or cluster or ''}")
+        return max(candidates, key=lambda m: m["created"])
+
+    def snapshot(self, source, cluster, exclude=(), on_file=None):
+        """备份source目录，返回 (快照清单, 是否新建)
+
+        内容与最新的快照完全一致时不再新建快照，返回最新的快照；
+        on_file(文件大小)在每个文件处理完后调用，用于报告进度
+        """
+        latest = None
+        manifests = self.load_manifests(cluster)
+        if manifests:
+            latest = max(manifests, key=lambda m: m["created"])
+        previous = latest["files"] if latest else {}
+
+        files = {}
+        dirs = []
+        pending = []
+        total_size = 0
+        for root, dirnames, filenames in os.walk(source):
+            rel_root = os.path.relpath(root, source)
+            if rel_root != "." and not dirnames and not filenames:
+                dirs.append(rel_root.replace(os.sep, "/"))
+            for name in filenames:
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, source).replace(os.sep, "/")
+                if rel_path in exclude:
+                    continue
+                st = os.stat(path)
+                entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "mode": st.st_mode & 0o777}
+                total_size += st.st_size
+                old = previous.get(rel_path)
+                if (old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns
+                        and all(os.path.exists(self.chunk_path(c)) for c in old["chunks"])):
+                    entry["chunks"] = old["chunks"]
+                    if on_file is not None:
+                        on_file(st.st_size)
+                else:
+                    pending.append((rel_path, path))
+                files[rel_path] = entry
+
+        # 哈希和压缩在zlib/hashlib中会释放GIL，多线程并行处理变化的文件
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda item: (item[0], self.store_file(item[1])), pending)
+            for rel_path, chunks in results:
+                files[rel_path]["chunks"] = chunks
+                if on_file is not None:
+                    on_file(files[rel_path]["size"])
+
+        if latest and latest["files"] == files and sorted(latest.get("dirs", [])) == sorted(dirs):
+            return latest, False
+
+        created = time.time()
+        snapshot_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(created))
+        os.makedirs(self.snapshot_dir(cluster), exist_ok=True)
+        suffix = 1
+        base_id = snapshot_id
+        while os.path.exists(os.path.join(self.snapshot_dir(cluster), f"{snapshot_id}.json")):
+            suffix += 1
+            snapshot_id = f"{base_id}-{suffix}"
+        manifest = {
+            "version": BACKUP_SNAPSHOT_VERSION,
+            "id": snapshot_id,
+            "cluster": cluster,
+            "created": created,
+            "source": os.path.abspath(source),
+            "file_count": len(files),
+            "size": total_size,
+            "files": files,
+            "dirs": dirs,
+        }
+        path = os.path.join(self.snapshot_dir(cluster), f"{snapshot_id}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return manifest, True
+
+    def restore(self, manifest, target):
+        """把快照还原到target（target应不存在），多线程并行解压各文件"""
+        os.makedirs(target)
+        for rel_dir in manifest.get("dirs", []):
+            os.makedirs(os.path.join(target, *rel_dir.split("/")), exist_ok=True)
+
+        def restore_file(item):
+            rel_path, entry = item
+            path = os.path.join(target, *rel_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                for digest in entry["chunks"]:
+                    f.write(self.get_chunk(digest))
+            os.chmod(path, entry.get("mode", 0o644))
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            return entry["size"]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return sum(executor.map(restore_file, manifest["files"].items()))
+
+    def select_expired(self, manifests, keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY,
+                       keep_weekly=BACKUP_KEEP_WEEKLY):
+        """按保留策略返回应删除的快照
+
+        保留最新的keep_last个快照，以及最近keep_daily天、keep_weekly周中每天、每周最新的一个
+        """
+        ordered = sorted(manifests, key=lambda m: m["created"], reverse=True)
+        keep = {m["id"] for m in ordered[:keep_last]}
+        for count, key in ((keep_daily, "%Y-%m-%d"), (keep_weekly, "%G-W%V")):
+            periods = set()
+            for manifest in ordered:
+                period = time.strftime(key, time.localtime(manifest["created"]))
+                if period in periods:
+                    continue
+                if len(periods) >= count:
+                    break
+                periods.add(period)
+                keep.add(manifest["id"])
+        return [m for m in ordered if m["id"] not in keep]
+
+    def prune(self, cluster, **policy):
+        """按保留策略删除集群的旧快照并回收数据块，返回 (删除的快照数, 删除的块数, 释放字节数)"""
+        expired = self.select_expired(self.load_manifests(cluster), **policy)
+        for manifest in expired:
+            try:
+                os.remove(os.path.join(self.snapshot_dir(cluster), f"{manifest['id']}.json"))
+            except OSError:
+                pass
+        removed, freed = self.gc() if expired else (0, 0)
+        return len(expired), removed, freed
+
+    def gc(self):
+        """删除没有被任何快照引用的数据块和残留的临时文件，返回 (删除数量, 释放字节数)"""
+        referenced = set()
+        for cluster in os.listdir(self.snapshots_path):
+            for manifest in self.load_manifests(cluster):
+                for entry in manifest["files"].values():
+                    referenced.update(entry["chunks"])
+        removed = 0
+        freed = 0
+        for prefix in os.listdir(self.chunks_path):
+            prefix_path = os.path.join(self.chunks_path, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for digest in os.listdir(prefix_path):
+                if digest in referenced:
+                    continue
+                path = os.path.join(prefix_path, digest)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+            if not os.listdir(prefix_path):
+                os.rmdir(prefix_path)
+        for name in os.listdir(self.tmp_path):
+            try:
+                os.remove(os.path.join(self.tmp_path, name))
+            except OSError:
+                pass
+        return removed, freed
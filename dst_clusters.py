@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多集群部署辅助：端口分配与CPU核心分配（不依赖tkinter）
+
+同一台机器上运行多个集群时，每个集群的master_port、每个分片的server_port、
+master_server_port和authentication_port都必须互不冲突；每个分片的模拟基本是
+单线程的，把分片固定到各自的核心上可以避免多个分片争抢同一个核心。
+"""
+
+import configparser
+import os
+import socket
+
+# 各类端口的起始值（与饥荒联机版默认值一致）
+PORT_BASES = {
+    "master_port": 10888,
+    "server_port": 10999,
+    "master_server_port": 27016,
+    "authentication_port": 8766,
+}
+# 端口所在的ini文件和小节：cluster.ini中的是集群级端口，其余在每个分片的server.ini中
+PORT_LOCATIONS = {
+    "master_port": ("SHARD", True),
+    "server_port": ("NETWORK", False),
+    "master_server_port": ("STEAM", False),
+    "authentication_port": ("STEAM", False),
+}
+
+
+def read_ini(path):
+    """读取ini文件，保留键名大小写"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            parser.read_file(f)
+    return parser
+
+
+def write_ini(parser, path):
+    """写回ini文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        parser.write(f)
+
+
+def discover_shards(cluster_path):
+    """列出集群中的分片（包含server.ini的子目录），Master排在最前
+
+    找不到任何分片配置时返回默认的Master和Caves
+    """
+    shards = []
+    if os.path.isdir(cluster_path):
+        for item in sorted(os.listdir(cluster_path)):
+            if os.path.isfile(os.path.join(cluster_path, item, "server.ini")):
+                shards.append(item)
+    if not shards:
+        return ["Master", "Caves"]
+    shards.sort(key=lambda name: (name != "Master", name))
+    return shards
+
+
+def port_in_use(port):
+    """检查本机的UDP端口是否已被占用"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.bind(("", port))
+        except OSError:
+            return True
+    return False
+
+
+class PortAllocator:
+    """在一次部署的所有集群之间分配互不冲突的端口
+
+    优先沿用ini文件中已有的端口（重新部署时端口保持不变），与本次已分配的
+    端口冲突时才从起始值往上寻找一个未被占用的端口
+    """
+
+    def __init__(self, bases=None, check_in_use=True):
+        self.bases = dict(PORT_BASES, **(bases or {}))
+        self.check_in_use = check_in_use
+        self.used = set()
+
+    def allocate(self, kind, preferred=None):
+        """分配一个端口，preferred为ini中已有的值"""
+        if preferred and preferred not in self.used:
+            self.used.add(preferred)
+            return preferred
+        port = self.bases[kind]
+        while port in self.used or (self.check_in_use and port_in_use(port)):
+            port += 1
+        self.used.add(port)
+        return port
+
+    def assign_cluster(self, cluster_path):
+        """为一个集群分配端口并写入cluster.ini和各分片的server.ini，返回分配结果"""
+        assigned = {}
+        for kind, (section, cluster_level) in PORT_LOCATIONS.items():
+            if not cluster_level:
+                continue
+            ini_path = os.path.join(cluster_path, "cluster.ini")
+            assigned[kind] = self._assign(ini_path, section, kind)
+
+        for shard in discover_shards(cluster_path):
+            shard_dir = os.path.join(cluster_path, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            ini_path = os.path.join(shard_dir, "server.ini")
+            for kind, (section, cluster_level) in PORT_LOCATIONS.items():
+                if not cluster_level:
+                    assigned[f"{shard}.{kind}"] = self._assign(ini_path, section, kind)
+        return assigned
+
+    def _assign(self, ini_path, section, kind):
+        parser = read_ini(ini_path)
+        try:
+            preferred = parser.getint(section, kind)
+        except (configparser.Error, ValueError):
+            preferred = None
+        port = self.allocate(kind, preferred)
+        if preferred != port:
+            if not parser.has_section(section):
+                parser.add_section(section)
+            parser.set(section, kind, str(port))
+            write_ini(parser, ini_path)
+        return port
+
+
+def available_cpus():
+    """当前进程可以使用的CPU核心列表"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CpuAllocator:
+    """把分片依次分配到不同的CPU核心上，分片数超过核心数时循环使用"""
+
+    def __init__(self, cpus=None, reserve=0):
+        cpus = list(cpus) if cpus else available_cpus()
+        # 可以保留前几个核心给系统和其他程序使用
+        self.cpus = cpus[reserve:] or cpus
+        self.next_index = 0
+
+    def allocate(self):
+        """返回下一个分片应固定的核心列表"""
+        cpu = self.cpus[self.next_index % len(self.cpus)]
+        self.next_index += 1
+        return [cpu]
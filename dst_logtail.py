@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片服务器日志的增量跟踪与事件索引（不依赖tkinter）
+
+按记录的字节偏移量继续读取各分片的server_log.txt，只处理新增内容；Linux上用
+inotify等待文件变化，其他平台定时轮询。服务器重启时日志会被截断重写，检测到
+文件变小或被替换后从头读取。错误、模组加载失败、玩家进出、存档等事件写入
+SQLite索引，偏移量也保存在同一个数据库中，工具重启后不会重新扫描整个日志。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import sqlite3
+import sys
+import threading
+import time
+
+# 需要索引的日志事件：(类型, 正则表达式)，按顺序匹配，第一个匹配的生效
+LOG_EVENT_PATTERNS = [
+    ("mod_error", re.compile(r"(?:Mod:.*Failed|error loading mod|Disabling .* because it had an error"
+                             r"|Could not load mod)", re.IGNORECASE)),
+    ("error", re.compile(r"(?:LUA ERROR|\[string \".*\"\]:\d+:|stack traceback|^\s*Error\b|\bFATAL\b)")),
+    ("join", re.compile(r"\[Join Announcement\]\s*(.*)")),
+    ("leave", re.compile(r"\[Leave Announcement\]\s*(.*)")),
+    ("save", re.compile(r"Serializing world")),
+    ("shutdown", re.compile(r"Shutting down")),
+]
+# 事件类型对应的部署日志级别
+LOG_EVENT_LEVELS = {
+    "mod_error": "ERROR",
+    "error": "ERROR",
+    "join": "INFO",
+    "leave": "INFO",
+    "save": "INFO",
+    "shutdown": "WARNING",
+}
+LOG_EVENT_NAMES = {
+    "mod_error": "模组加载失败",
+    "error": "错误",
+    "join": "玩家加入",
+    "leave": "玩家离开",
+    "save": "存档",
+    "shutdown": "关闭",
+}
+# 日志行开头的游戏内时间，例如 [00:12:34]:
+LOG_TIME_PATTERN = re.compile(r"^\[(\d+:\d+:\d+)\]:\s*")
+# 每次最多读取的字节数，避免第一次跟踪大日志时一次读入全部内容
+LOG_READ_CHUNK = 4 * 1024 * 1024
+
+# inotify常量（见<sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+def classify_log_line(line):
+    """返回日志行的事件类型，不是需要索引的事件时返回None"""
+    for kind, pattern in LOG_EVENT_PATTERNS:
+        if pattern.search(line):
+            return kind
+    return None
+
+
+class LogIndex:
+    """日志事件和读取偏移量的SQLite存储，可以在多个线程中使用"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS offsets ("
+                              "path TEXT PRIMARY KEY, inode INTEGER, offset INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS events ("
+                              "id INTEGER PRIMARY KEY, cluster TEXT, shard TEXT, time REAL,"
+                              "log_time TEXT, kind TEXT, message TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS events_kind ON events (kind, time)")
+
+    def get_offset(self, path):
+        """返回 (inode, 偏移量)，没有记录时返回 (None, 0)"""
+        with self.lock:
+            row = self.conn.execute("SELECT inode, offset FROM offsets WHERE path = ?",
+                                    (path,)).fetchone()
+        return row if row else (None, 0)
+
+    def commit(self, path, inode, offset, events):
+        """在一个事务中写入新事件并更新偏移量"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO events (cluster, shard, time, log_time, kind, message) "
+                "VALUES (?, ?, ?, ?, ?, ?)", events)
+            self.conn.execute("INSERT OR REPLACE INTO offsets (path, inode, offset) VALUES (?, ?, ?)",
+                              (path, inode, offset))
+
+    def search(self, text=None, kind=None, cluster=None, shard=None, limit=100):
+        """按关键字、事件类型、集群和分片查询事件，返回最新的limit条（按时间正序）"""
+        conditions = []
+        params = []
+        if text:
+            conditions.append("message LIKE ?")
+            params.append(f"%{text}%")
+        for column, value in (("kind", kind), ("cluster", cluster), ("shard", shard)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT cluster, shard, time, log_time, kind, message FROM events "
+                f"{where} ORDER BY id DESC LIMIT ?", params).fetchall()
+        keys = ("cluster", "shard", "time", "log_time", "kind", "message")
+        return [dict(zip(keys, row)) for row in reversed(rows)]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Inotify:
+    """用ctypes调用Linux inotify，只用来在目录内有文件变化时唤醒跟踪线程"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.libc = libc
+
+    def watch(self, path):
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            raise OSError(ctypes.get_errno(), f"无法监视目录: {path}")
+
+    def wait(self, timeout):
+        """等待文件变化或超时，读出并丢弃全部待处理事件"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogTailer:
+    """在后台线程中跟踪一个集群各分片的日志文件
+
+    files为 {分片名: 日志路径}；匹配到的事件写入LogIndex，并通过on_event
+    回调 (分片名, 事件类型, 日志时间, 内容) 通知调用方。
+    """
+
+    def __init__(self, files, index, cluster="", on_event=None, poll_interval=1.0):
+        self.files = {shard: os.path.abspath(path) for shard, path in files.items()}
+        self.index = index
+        self.cluster = cluster
+        self.on_event = on_event
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.thread = None
+        self.inotify = None
+
+    def start(self):
+        """启动跟踪线程；inotify不可用时使用轮询"""
+        if sys.platform.startswith("linux"):
+            try:
+                inotify = Inotify()
+                for path in {os.path.dirname(p) for p in self.files.values()}:
+                    os.makedirs(path, exist_ok=True)
+                    inotify.watch(path)
+                self.inotify = inotify
+            except (OSError, AttributeError, TypeError):
+                self.inotify = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            for shard, path in self.files.items():
+                try:
+                    while self.read_new(shard, path):
+                        if self.stopping.is_set():
+                            return
+                except OSError:
+                    pass
+            if self.inotify is not None:
+                # 即使inotify漏掉事件（例如目录被删除重建），超时后也会重新检查
+                self.inotify.wait(self.poll_interval)
+            else:
+                self.stopping.wait(self.poll_interval)
+
+    def read_new(self, shard, path):
+        """读取日志新增的完整行并建立索引，读满一块时返回True表示还有未读内容"""
+        if not os.path.exists(path):
+            return False
+        inode, offset = self.index.get_offset(path)
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            # 文件被替换或变小说明服务器重启后重写了日志，从头开始读
+            if (inode and st.st_ino and inode != st.st_ino) or st.st_size < offset:
+                offset = 0
+            if st.st_size == offset:
+                if inode != st.st_ino:
+                    self.index.commit(path, st.st_ino, offset, [])
+                return False
+            f.seek(offset)
+            data = f.read(LOG_READ_CHUNK)
+        # 最后一行可能还没写完，留到下次读取
+        end = data.rfind(b"\n")
+        if end < 0:
+            return False
+        chunk = data[:end + 1]
+        events = []
+        now = time.time()
+        for raw in chunk.splitlines():
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            kind = classify_log_line(line)
+            if kind is None:
+                continue
+            match = LOG_TIME_PATTERN.match(line)
+            log_time = match.group(1) if match else ""
+            message = line[match.end():] if match else line
+            events.append((self.cluster, shard, now, log_time, kind, message))
+        self.index.commit(path, st.st_ino, offset + len(chunk), events)
+        if self.on_event is not None:
+            for _, _, _, log_time, kind, message in events:
+                self.on_event(shard, kind, log_time, message)
+        return len(data) == LOG_READ_CHUNK
+
+    def stop(self):
+        """停止跟踪线程"""
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取世界的modoverrides.lua，得到集群实际启用的模组（不依赖tkinter）
+
+modoverrides.lua是一个返回Lua表的脚本，例如：
+    return {
+      ["workshop-378160973"]={ configuration_options={ ... }, enabled=true },
+      ["MyLocalMod"]={ enabled=false },
+    }
+这里只实现解析这类数据表所需的Lua子集：表构造、字符串、数字、布尔值、nil和注释。
+"""
+
+import os
+import re
+import zipfile
+
+MODOVERRIDES_NAME = "modoverrides.lua"
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<long_comment>--\[(?P<lc_eq>=*)\[.*?\](?P=lc_eq)\])
+  | (?P<comment>--[^\n]*)
+  | (?P<long_string>\[(?P<ls_eq>=*)\[.*?\](?P=ls_eq)\])
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>[{}\[\]=,;\-])
+""", re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v",
+            "\\": "\\", "\"": "\"", "'": "'", "\n": "\n"}
+
+
+class LuaParseError(ValueError):
+    """modoverrides.lua不是可以解析的数据表"""
+
+
+def _unescape(body):
+    result = []
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch != "\\" or i + 1 >= len(body):
+            result.append(ch)
+            i += 1
+            continue
+        nxt = body[i + 1]
+        if nxt.isdigit():
+            digits = re.match(r"\d{1,3}", body[i + 1:]).group(0)
+            result.append(chr(int(digits)))
+            i += 1 + len(digits)
+        else:
+            result.append(_ESCAPES.get(nxt, nxt))
+            i += 2
+    return "".join(result)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise LuaParseError(f"无法解析的字符 {text[pos]!r}（位置 {pos}）")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind in ("lc_eq", "ls_eq"):
+            kind = "long_comment" if match.group("long_comment") else "long_string"
+        if kind in ("space", "comment", "long_comment"):
+            continue
+        value = match.group(kind)
+        if kind == "long_string":
+            eq = match.group("ls_eq")
+            value = value[len(eq) + 2:-(len(eq) + 2)]
+            if value.startswith("\n"):
+                value = value[1:]
+            tokens.append(("string", value))
+        elif kind == "string":
+            tokens.append(("string", _unescape(value[1:-1])))
+        elif kind == "number":
+            tokens.append(("number", int(value, 16) if value[:2] in ("0x", "0X")
+                           else float(value) if any(c in value for c in ".eE") else int(value)))
+        else:
+            tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise LuaParseError(f"期望 {value or kind}，实际为 {token[1]!r}")
+        self.pos += 1
+        return token
+
+    def value(self):
+        kind, value = self.peek()
+        if kind in ("string", "number"):
+            self.pos += 1
+            return value
+        if kind == "op" and value == "-":
+            self.pos += 1
+            return -self.take("number")[1]
+        if kind == "op" and value == "{":
+            return self.table()
+        if kind == "name" and value in ("true", "false", "nil"):
+            self.pos += 1
+            return {"true": True, "false": False, "nil": None}[value]
+        raise LuaParseError(f"不支持的值 {value!r}")
+
+    def table(self):
+        """解析表构造；只有数组部分时返回list，否则返回dict（数组元素的键为1、2、3…）"""
+        self.take("op", "{")
+        result = {}
+        index = 1
+        while self.peek() != ("op", "}"):
+            kind, value = self.peek()
+            if kind == "op" and value == "[":
+                self.pos += 1
+                key = self.value()
+                self.take("op", "]")
+                self.take("op", "=")
+                result[key] = self.value()
+            elif kind == "name" and self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1] == ("op", "="):
+                self.pos += 2
+                result[value] = self.value()
+            else:
+                result[index] = self.value()
+                index += 1
+            if self.peek() in (("op", ","), ("op", ";")):
+                self.pos += 1
+            elif self.peek() != ("op", "}"):
+                raise LuaParseError(f"表中缺少分隔符，位于 {self.peek()[1]!r}")
+        self.take("op", "}")
+        if result and list(result) == list(range(1, len(result) + 1)):
+            return list(result.values())
+        return result
+
+
+def parse_lua_table(text):
+    """解析 `return { ... }` 形式的Lua数据文件，返回Python字典或列表"""
+    parser = _Parser(_tokenize(text.lstrip("\ufeff")))
+    if parser.peek() == ("name", "return"):
+        parser.pos += 1
+    if parser.peek()[0] is None:
+        return {}
+    result = parser.value()
+    if parser.peek()[0] is not None:
+        raise LuaParseError(f"表之后还有多余内容: {parser.peek()[1]!r}")
+    return result
+
+
+def enabled_mods(text):
+    """返回modoverrides.lua中enabled=true的模组目录名集合"""
+    table = parse_lua_table(text)
+    if not isinstance(table, dict):
+        return set()
+    return {name for name, options in table.items()
+            if isinstance(name, str) and isinstance(options, dict) and options.get("enabled") is True}
+
+
+def collect_enabled_mods(world_folder=None, config_file=None):
+    """汇总世界文件夹各分片和配置文件压缩包中的modoverrides.lua
+
+    返回 (启用的模组集合, 读取的文件列表, 解析失败的 [(文件, 错误)])；
+    没有找到任何modoverrides.lua时集合为None，表示无法判断需要哪些模组
+    """
+    found = None
+    sources = []
+    errors = []
+
+    def add(label, text):
+        nonlocal found
+        try:
+            mods = enabled_mods(text)
+        except LuaParseError as e:
+            errors.append((label, str(e)))
+            return
+        found = (found or set()) | mods
+        sources.append(label)
+
+    if world_folder and os.path.isdir(world_folder):
+        for shard in sorted(os.listdir(world_folder)):
+            path = os.path.join(world_folder, shard, MODOVERRIDES_NAME)
+            if os.path.isfile(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    add(path, f.read())
+
+    if config_file and os.path.isfile(config_file):
+        try:
+            with zipfile.ZipFile(config_file, 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    if info.filename.rsplit("/", 1)[-1] == MODOVERRIDES_NAME:
+                        add(f"{config_file}:{info.filename}",
+                            zip_ref.read(info).decode("utf-8", errors="replace"))
+        except zipfile.BadZipFile:
+            pass
+
+    # 任何一个文件解析失败时都无法确定完整的模组列表，按未找到处理
+    if errors:
+        found = None
+    return found, sources, errors
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址的共享模组仓库（不依赖tkinter）
+
+模组文件按内容的SHA-256保存为仓库中的对象，各个专用服务器安装的mods目录由
+这些对象硬链接（不支持时reflink或复制）构成，多个集群或多个安装目录中相同的
+模组文件只占一份磁盘空间。每个mods目录在refs中记录自己引用的对象，对象的引用
+计数由全部refs汇总得到，垃圾回收删除不再被任何mods目录引用的对象。
+
+仓库目录结构：
+    objects/ab/abcdef...   文件对象（按哈希前两位分目录）
+    refs/<mods目录ID>.json  某个mods目录引用的全部模组文件
+    index.json             源文件哈希缓存（路径、大小、修改时间未变时不再重新计算）
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# 放入仓库和从仓库链接出去时使用的复制策略：对象必须是源文件的独立副本，
+# 不能与Steam Workshop中的文件硬链接，否则Steam原地更新模组时会改写对象
+STORE_INGEST_STRATEGIES = ("reflink", "copy_file_range", "sendfile", "copy")
+STORE_LINK_STRATEGIES = ("hardlink", "reflink", "copy_file_range", "sendfile", "copy")
+STORE_INDEX_VERSION = 1
+
+
+class ModStore:
+    """内容寻址的模组文件仓库
+
+    ingest()把模组目录中的文件放入仓库并返回目录树 {相对路径: 哈希}（空目录的
+    哈希为None），materialize()按目录树在目标位置重建模组目录；set_refs()记录
+    某个mods目录当前引用的目录树，gc()删除引用计数为0的对象。
+    """
+
+    def __init__(self, root, copy_engine_factory):
+        self.root = os.path.abspath(root)
+        self.objects_path = os.path.join(self.root, "objects")
+        self.refs_path = os.path.join(self.root, "refs")
+        self.tmp_path = os.path.join(self.root, "tmp")
+        self.index_path = os.path.join(self.root, "index.json")
+        for path in (self.objects_path, self.refs_path, self.tmp_path):
+            os.makedirs(path, exist_ok=True)
+        self.ingest_engine = copy_engine_factory(STORE_INGEST_STRATEGIES)
+        self.link_engine = copy_engine_factory(STORE_LINK_STRATEGIES)
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+        self.added_objects = 0
+        self.added_bytes = 0
+
+    def object_path(self, digest):
+        """对象在仓库中的路径"""
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def hash_file(self, path):
+        """计算文件的SHA-256，大小和修改时间未变时直接使用缓存"""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            cached = self.index.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self.lock:
+            self.index[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def add_file(self, path):
+        """把文件放入仓库，返回其哈希；相同内容的对象已存在时不再复制"""
+        digest = self.hash_file(path)
+        obj_path = self.object_path(digest)
+        if os.path.exists(obj_path):
+            return digest
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        # 先复制到临时文件再改名，其他线程或进程不会看到写了一半的对象
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_path)
+        os.close(fd)
+        try:
+            self.ingest_engine.copy_file(path, tmp_path)
+            os.replace(tmp_path, obj_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if not os.path.exists(obj_path):
+                raise
+            return digest
+        with self.lock:
+            self.added_objects += 1
+            self.added_bytes += os.path.getsize(obj_path)
+        return digest
+
+    def ingest(self, src):
+        """把模组目录中的全部文件放入仓库，返回目录树"""
+        tree = {}
+        for root, dirs, files in os.walk(src):
+            rel_root = os.path.relpath(root, src)
+            if not dirs and not files and rel_root != ".":
+                tree[rel_root.replace(os.sep, "/")] = None
+            for name in files:
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, src).replace(os.sep, "/")
+                tree[rel_path] = self.add_file(file_path)
+        return tree
+
+    def materialize(self, tree, dst):
+        """按目录树在dst重建模组目录（dst应不存在或为空）"""
+        os.makedirs(dst, exist_ok=True)
+        for rel_path, digest in sorted(tree.items()):
+            target = os.path.join(dst, *rel_path.split("/"))
+            if digest is None:
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self.link_engine.copy_file(self.object_path(digest), target)
+
+    def ref_file(self, mods_path):
+        """mods目录对应的引用记录文件"""
+        ref_id = hashlib.sha1(os.path.abspath(mods_path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.refs_path, f"{ref_id}.json")
+
+    def set_refs(self, mods_path, trees):
+        """记录mods目录当前引用的全部模组目录树 {模组名: 目录树}"""
+        ref_path = self.ref_file(mods_path)
+        tmp_path = ref_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"path": os.path.abspath(mods_path), "mods": trees}, f, ensure_ascii=False)
+        os.replace(tmp_path, ref_path)
+
+    def refcounts(self):
+        """汇总全部引用记录，返回 {哈希: 引用次数}
+
+        对应的mods目录已不存在的引用记录会被删除
+        """
+        counts = {}
+        for name in os.listdir(self.refs_path):
+            if not name.endswith(".json"):
+                continue
+            ref_path = os.path.join(self.refs_path, name)
+            try:
+                with open(ref_path, 'r', encoding='utf-8') as f:
+                    ref = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if not os.path.isdir(ref.get("path", "")):
+                os.remove(ref_path)
+                continue
+            for tree in ref.get("mods", {}).values():
+                for digest in tree.values():
+                    if digest is not None:
+                        counts[digest] = counts.get(digest, 0) + 1
+        return counts
+
+    def gc(self):
+        """删除引用计数为0的对象和残留的临时文件，返回 (删除数量, 释放字节数)"""
+        counts = self.refcounts()
+        removed = 0
+        freed = 0
+        for prefix in os.listdir(self.objects_path):
+            prefix_path = os.path.join(self.objects_path, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for digest in os.listdir(prefix_path):
+                if counts.get(digest):
+                    continue
+                obj_path = os.path.join(prefix_path, digest)
+                try:
+                    size = os.path.getsize(obj_path)
+                    os.remove(obj_path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+            if not os.listdir(prefix_path):
+                os.rmdir(prefix_path)
+        for name in os.listdir(self.tmp_path):
+            try:
+                os.remove(os.path.join(self.tmp_path, name))
+            except OSError:
+                pass
+        # 源文件已不存在的哈希缓存也一并清理
+        with self.lock:
+            self.index = {path: entry for path, entry in self.index.items() if os.path.exists(path)}
+        return removed, freed
+
+    def load_index(self):
+        """加载源文件哈希缓存，不存在或损坏时返回空缓存"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != STORE_INDEX_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def save_index(self):
+        """保存源文件哈希缓存"""
+        with self.lock:
+            data = {"version": STORE_INDEX_VERSION, "files": dict(self.index)}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工具自身使用的文件路径
+
+单独放在一个不导入其他模块的文件中，图形界面启动时只需要这些路径，
+不必为此导入整个部署流程。
+"""
+
+import os
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 配置文件路径
+CONFIG_FILE_PATH = os.path.join(TOOL_DIR, ".dst_server_config.json")
+
+# 完整日志写入的滚动日志文件
+LOG_FILE_PATH = os.path.join(TOOL_DIR, "dst_server_tool.log")
+
+# SteamCMD更新状态缓存
+UPDATE_STATE_PATH = os.path.join(TOOL_DIR, ".dst_update_state.json")
+
+# 部署步骤输入指纹缓存（输入未变的步骤在重新部署时跳过）
+STAGE_CACHE_PATH = os.path.join(TOOL_DIR, ".dst_stage_cache.json")
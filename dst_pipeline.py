@@ -0,0 +1,2450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+饥荒联机版专用服务器部署流程（不依赖tkinter）
+
+图形界面和命令行共用同一套部署逻辑，进度和日志以结构化事件的形式发出。
+命令行用法示例:
+    python dst_pipeline.py --json
+    python dst_pipeline.py --world-folder D:/Klei/Cluster_1 --no-start
+"""
+
+import argparse
+import errno
+import getpass
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from dst_backup import BACKUP_KEEP_DAILY, BACKUP_KEEP_LAST, BACKUP_KEEP_WEEKLY, BackupStore
+from dst_clusters import CpuAllocator, PortAllocator, discover_shards
+from dst_logtail import LOG_EVENT_LEVELS, LOG_EVENT_NAMES, LogIndex, LogTailer
+from dst_modoverrides import collect_enabled_mods
+from dst_modstore import ModStore
+from dst_paths import CONFIG_FILE_PATH, LOG_FILE_PATH, STAGE_CACHE_PATH, UPDATE_STATE_PATH
+from dst_readiness import (READY_PHASE_NAMES, STALL_TIMEOUT, ReadinessMonitor, append_ready_history, find_regressions,
+                           format_phases)
+from dst_supervisor import (CONSOLE_SAVE_TIMEOUT, CONSOLE_SHUTDOWN_TIMEOUT, ROLLING_SETTLE_TIME,
+                            ShardSupervisor, format_shard_stats, running_shards)
+from dst_trace import StageProgress, Tracer, as_progress
+
+# 集群名称及部署时使用的暂存/旧版本目录后缀
+CLUSTER_NAME = "MyDediServer"
+STAGING_SUFFIX = ".staging"
+OLD_SUFFIX = ".old"
+RESTORE_SUFFIX = ".restore"
+
+# 写入滚动日志文件时各日志级别对应的logging级别
+LOG_FILE_LEVELS = {
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR
+}
+
+# 饥荒联机版专用服务器的Steam应用ID
+DST_SERVER_APP_ID = "343050"
+
+# 蓝绿安装（blue_green）：两个专用服务器安装目录轮流使用，SteamCMD只更新未在运行的那个
+INSTALL_SLOTS = ("blue", "green")
+INSTALL_SLOT_PREFIX = "dst_server_"
+
+# 超过该大小的压缩包条目放入线程池并行解压
+ZIP_PARALLEL_THRESHOLD = 1024 * 1024
+
+# 无法按字节预估的步骤（SteamCMD更新、启动服务器）在整体进度中每单位权重折算的字节数
+STAGE_WEIGHT_BYTES = 32 * 1024 * 1024
+
+# 世界文件哈希索引（保存在集群目录内，随集群目录一起切换）
+WORLD_INDEX_NAME = ".dst_world_index.json"
+WORLD_INDEX_VERSION = 1
+# 同步世界文件时不覆盖也不删除的文件
+WORLD_SYNC_KEEP = {"cluster_token.txt", WORLD_INDEX_NAME}
+
+# 模组同步清单（保存在服务器mods目录内，记录每个模组的签名）
+MOD_MANIFEST_NAME = ".dst_mod_manifest.json"
+MOD_MANIFEST_VERSION = 1
+# 共享模组仓库的默认目录（在SteamCMD目录下，与各服务器安装位于同一磁盘，便于硬链接）
+MOD_STORE_DIR = "dst_mod_store"
+
+# 等待分片就绪（wait_ready）的默认最长时间（秒）
+READY_TIMEOUT = 600
+
+# 集群备份仓库的默认目录（在Klei存档根目录下，多个集群共用，相同的块只保存一份）
+BACKUP_DIR = ".dst_backups"
+
+# 默认复制策略：Steam会原地更新Workshop中的模组文件，硬链接会让服务器mods目录跟着被改写
+# （更新到一半时服务器读到不完整的模组），模组和世界存档一样默认不与源文件共享数据；
+# 确认不介意时可用mod_copy_strategy指定hardlink
+MOD_COPY_STRATEGIES = ("reflink", "copy_file_range", "sendfile", "copy")
+WORLD_COPY_STRATEGIES = ("reflink", "copy_file_range", "sendfile", "copy")
+
+
+def parse_vdf(text):
+    """解析Valve KeyValues文本（.acf/.vdf格式），返回嵌套字典"""
+    tokens = re.findall(r'"((?:[^"\\]|\\.)*)"|(\{)|(\})', text)
+    stack = [{}]
+    key = None
+    for string, open_brace, close_brace in tokens:
+        if open_brace:
+            if key is None:
+                raise ValueError("VDF格式错误: 缺少键名")
+            child = {}
+            stack[-1][key] = child
+            stack.append(child)
+            key = None
+        elif close_brace:
+            if len(stack) == 1:
+                raise ValueError("VDF格式错误: 多余的 }")
+            stack.pop()
+        elif key is None:
+            key = string
+        else:
+            stack[-1][key] = string.replace('\\\\', '\\')
+            key = None
+    return stack[0]
+
+
+def format_size(num_bytes):
+    """把字节数格式化为便于阅读的字符串"""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def directory_size(path):
+    """目录中全部文件的总字节数（用于预估步骤的工作量），目录不存在时返回0"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.stat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def fingerprint_paths(paths, with_hash=False):
+    """根据文件的路径、大小和修改时间计算输入指纹，with_hash时同时计算文件内容哈希
+    
+    paths中可以是文件或目录（递归包含全部文件），不存在的路径也计入指纹
+    """
+    hasher = hashlib.sha256()
+    for base in paths:
+        hasher.update(f"{base}\0".encode("utf-8"))
+        if os.path.isfile(base):
+            files = [(base, "")]
+        else:
+            files = []
+            for root, dirs, names in os.walk(base):
+                dirs.sort()
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, base)))
+        for path, rel_path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            hasher.update(f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\0".encode("utf-8"))
+            if with_hash:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def create_file_logger():
+    """创建写入滚动日志文件的logger，保留完整日志"""
+    logger = logging.getLogger("dst_server_tool")
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        try:
+            handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE_PATH, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+        except OSError:
+            handler = logging.NullHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+class DeploymentCancelled(Exception):
+    """用户取消了配置过程"""
+
+
+class SteamCMDProgress:
+    """解析SteamCMD的“Update state (0x61) downloading, progress: 12.34 (a / b)”进度行"""
+    
+    PATTERN = re.compile(
+        r"Update state \((0x[0-9a-fA-F]+)\) ([^,]+), progress: ([\d.]+) \((\d+) / (\d+)\)")
+    STATE_NAMES = {
+        "reconfiguring": "配置中",
+        "preallocating": "预分配",
+        "downloading": "下载中",
+        "verifying install": "校验安装",
+        "verifying update": "校验更新",
+        "committing": "写入中",
+    }
+    
+    def __init__(self):
+        self.state = None
+        self.percent = 0.0
+        self.current = 0
+        self.total = 0
+        self.rate = 0.0
+        self.state_changed = False
+        self._last_sample = None
+        
+    def feed(self, line):
+        """解析一行输出，是进度行时更新状态并返回True"""
+        match = self.PATTERN.search(line)
+        if not match:
+            return False
+        state = match.group(2).strip()
+        current = int(match.group(4))
+        now = time.monotonic()
+        
+        self.state_changed = state != self.state
+        if self.state_changed:
+            self.rate = 0.0
+            self._last_sample = None
+        elif self._last_sample is not None:
+            last_time, last_bytes = self._last_sample
+            if now > last_time and current >= last_bytes:
+                # 指数平滑，避免速度数字来回跳动
+                instant = (current - last_bytes) / (now - last_time)
+                self.rate = instant if self.rate == 0 else self.rate * 0.7 + instant * 0.3
+        self._last_sample = (now, current)
+        
+        self.state = state
+        self.percent = float(match.group(3))
+        self.current = current
+        self.total = int(match.group(5))
+        return True
+        
+    def fraction(self):
+        """把当前阶段进度换算为整体进度（下载占前70%，校验占后30%）"""
+        part = min(max(self.percent / 100, 0.0), 1.0)
+        if self.state and self.state.startswith("verifying"):
+            return 0.7 + 0.3 * part
+        return 0.7 * part
+        
+    def describe(self):
+        """生成一行便于阅读的进度描述"""
+        name = self.STATE_NAMES.get(self.state, self.state)
+        text = f"SteamCMD {name}: {self.percent:.1f}% ({format_size(self.current)} / {format_size(self.total)})"
+        if self.rate > 0:
+            text += f"，速度 {format_size(self.rate)}/s"
+        return text
+
+
+class CopyEngine:
+    """文件复制引擎
+    
+    按顺序尝试硬链接、reflink（写时复制克隆）、copy_file_range、sendfile，
+    当前策略不可用时自动降级，最后退回普通复制，并统计每种策略的使用次数。
+    """
+    
+    STRATEGIES = ("hardlink", "reflink", "copy_file_range", "sendfile", "copy")
+    STRATEGY_NAMES = {
+        "hardlink": "硬链接",
+        "reflink": "reflink克隆",
+        "copy_file_range": "copy_file_range",
+        "sendfile": "sendfile",
+        "copy": "普通复制",
+    }
+    # 表示“该策略在此文件系统/平台上不可用”的错误码，遇到后不再尝试该策略
+    UNSUPPORTED_ERRNOS = {
+        errno.EXDEV, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS,
+        errno.EINVAL, errno.ENOTTY, errno.EPERM, errno.EMLINK,
+    }
+    FICLONE = 0x40049409  # Linux ioctl: 对btrfs/XFS等文件系统执行reflink
+    
+    def __init__(self, strategies=None):
+        strategies = strategies or self.STRATEGIES
+        self.strategies = [s for s in strategies if s in self.STRATEGIES and self.is_supported(s)]
+        if "copy" not in self.strategies:
+            self.strategies.append("copy")
+        self.disabled = set()
+        self.counts = {}
+        self.lock = threading.Lock()
+        
+    @classmethod
+    def from_setting(cls, setting, default_strategies):
+        """根据配置值创建引擎：auto使用默认顺序，或指定单个策略（失败时退回普通复制）"""
+        if not setting or setting == "auto":
+            return cls(default_strategies)
+        if isinstance(setting, str):
+            setting = [setting]
+        return cls(list(setting))
+        
+    @staticmethod
+    def is_supported(strategy):
+        """判断当前平台是否提供该策略"""
+        if strategy == "hardlink":
+            return hasattr(os, "link")
+        if strategy == "reflink":
+            return fcntl is not None and sys.platform.startswith("linux")
+        if strategy == "copy_file_range":
+            return hasattr(os, "copy_file_range")
+        if strategy == "sendfile":
+            return hasattr(os, "sendfile") and sys.platform.startswith("linux")
+        return strategy == "copy"
+        
+    def copy_file(self, src, dst, *, follow_symlinks=True):
+        """复制单个文件，签名与shutil.copy2一致，可作为copytree的copy_function"""
+        for strategy in self.strategies:
+            if strategy in self.disabled:
+                continue
+            try:
+                getattr(self, f"_copy_{strategy}")(src, dst)
+            except OSError as e:
+                if strategy == "copy":
+                    raise
+                if e.errno in self.UNSUPPORTED_ERRNOS:
+                    with self.lock:
+                        self.disabled.add(strategy)
+                continue
+            with self.lock:
+                self.counts[strategy] = self.counts.get(strategy, 0) + 1
+            return dst
+        raise OSError(f"没有可用的复制策略: {src}")
+        
+    def copytree(self, src, dst, dirs_exist_ok=False):
+        """使用当前引擎复制整个目录"""
+        return shutil.copytree(src, dst, copy_function=self.copy_file, dirs_exist_ok=dirs_exist_ok)
+        
+    def summary(self):
+        """返回各策略的使用统计，例如“硬链接 120 个文件，普通复制 3 个文件”"""
+        with self.lock:
+            counts = dict(self.counts)
+        if not counts:
+            return "没有复制文件"
+        return "，".join(f"{self.STRATEGY_NAMES[s]} {counts[s]} 个文件"
+                        for s in self.STRATEGIES if s in counts)
+        
+    def _remove_existing(self, dst):
+        # 目标可能是上次留下的硬链接，直接截断写入会破坏源文件，必须先删除
+        if os.path.lexists(dst):
+            os.remove(dst)
+            
+    def _copy_hardlink(self, src, dst):
+        self._remove_existing(dst)
+        os.link(src, dst)
+        
+    def _copy_reflink(self, src, dst):
+        self._remove_existing(dst)
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), self.FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        
+    def _copy_copy_file_range(self, src, dst):
+        self._remove_existing(dst)
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    self._copy_rest(fsrc, fdst, size - remaining, size, src)
+                    break
+                remaining -= copied
+        shutil.copystat(src, dst)
+        
+    def _copy_sendfile(self, src, dst):
+        self._remove_existing(dst)
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            offset = 0
+            size = os.fstat(fsrc.fileno()).st_size
+            while offset < size:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, size - offset)
+                if sent == 0:
+                    self._copy_rest(fsrc, fdst, offset, size, src)
+                    break
+                offset += sent
+        shutil.copystat(src, dst)
+        
+    @staticmethod
+    def _copy_rest(fsrc, fdst, offset, size, src):
+        # 系统调用在文件结束前返回0时，剩余部分改用普通读写复制，不能留下截断的文件
+        fsrc.seek(offset)
+        fdst.seek(offset)
+        shutil.copyfileobj(fsrc, fdst)
+        if fdst.tell() != size:
+            raise OSError(errno.EIO, f"复制不完整: 预期 {size} 字节，实际 {fdst.tell()} 字节", src)
+        
+    def _copy_copy(self, src, dst):
+        self._remove_existing(dst)
+        shutil.copy2(src, dst)
+
+
+class Stage:
+    """部署流程中的一个步骤
+    
+    inputs/outputs为资源名称，某步骤的输入若是另一步骤的输出，则依赖该步骤；
+    没有步骤产生的输入视为外部已就绪。func接收一个StageProgress进度对象。
+    estimate返回步骤需要处理的字节数，用于按字节分配整体进度；无法预估时
+    按weight * STAGE_WEIGHT_BYTES折算
+    
+    fingerprint返回步骤外部输入的指纹（可JSON序列化），与上游步骤的指纹一起
+    组成缓存键；缓存键与上次成功时相同、上游步骤都被跳过且ready()确认输出
+    仍然存在时跳过该步骤，跳过时调用on_skip。skip_with中的步骤全部被跳过时
+    本步骤也跳过（用于只为其他步骤服务的步骤，例如切换前的备份）
+    """
+    
+    def __init__(self, name, func, inputs=(), outputs=(), weight=1, estimate=None,
+                 fingerprint=None, ready=None, on_skip=None, skip_with=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.weight = weight
+        self.estimate = estimate
+        self.fingerprint = fingerprint
+        self.ready = ready
+        self.on_skip = on_skip
+        self.skip_with = tuple(skip_with)
+
+
+class StageScheduler:
+    """按依赖关系调度步骤，输入都已就绪的步骤放入线程池并行执行"""
+    
+    def __init__(self, stages, max_workers=4, emit=None, cancel_event=None, tracer=None, cache=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max(1, int(max_workers))
+        self.emit = emit or (lambda event: None)
+        self.cancel_event = cancel_event or threading.Event()
+        self.tracer = tracer or Tracer()
+        self.deps = self.resolve_dependencies()
+        self.timings = {}
+        self.wall_time = 0.0
+        self.fractions = {name: 0.0 for name in self.stages}
+        self.estimates = {}
+        self.weights = {name: stage.weight * STAGE_WEIGHT_BYTES for name, stage in self.stages.items()}
+        self.last_progress = 0.0
+        self.lock = threading.Lock()
+        # 上次成功时各步骤的缓存键；运行后更新为本次结果，由调用方保存
+        self.cache = dict(cache) if cache is not None else None
+        self.keys = {}
+        self.skipped = set()
+        
+    def resolve_dependencies(self):
+        """根据输入输出推导每个步骤依赖的步骤，并检查重复输出和循环依赖"""
+        producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"资源 {output} 同时由 {producers[output]} 和 {stage.name} 产生")
+                producers[output] = stage.name
+                
+        deps = {name: {producers[i] for i in stage.inputs if i in producers}
+                for name, stage in self.stages.items()}
+        
+        # 拓扑排序检查循环依赖
+        remaining = {name: set(d) for name, d in deps.items()}
+        while remaining:
+            ready = [name for name, d in remaining.items() if not d]
+            if not ready:
+                raise ValueError(f"步骤之间存在循环依赖: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for d in remaining.values():
+                d.difference_update(ready)
+        return deps
+        
+    def estimate_stages(self):
+        """预估各步骤要处理的字节数，作为整体进度中的权重"""
+        for name, stage in self.stages.items():
+            if stage.estimate is None or name in self.skipped:
+                continue
+            try:
+                estimate = stage.estimate()
+            except (OSError, ValueError, zipfile.BadZipFile):
+                estimate = None
+            if estimate is not None:
+                self.estimates[name] = estimate
+                self.weights[name] = estimate
+                
+    def plan_skips(self):
+        """计算各步骤的缓存键，返回可以跳过的步骤
+        
+        缓存键包含上游步骤的缓存键，上游输入变化时下游步骤的缓存键也随之变化；
+        没有fingerprint的步骤每次都运行，但不会使下游步骤失效
+        """
+        if self.cache is None:
+            return set()
+        clean = set()
+        for name in self.topological_order():
+            stage = self.stages[name]
+            if stage.fingerprint is None:
+                continue
+            try:
+                fingerprint = stage.fingerprint()
+            except (OSError, ValueError, zipfile.BadZipFile):
+                continue
+            upstream = sorted((dep, self.keys.get(dep)) for dep in self.deps[name])
+            key = hashlib.sha256(json.dumps([fingerprint, upstream], sort_keys=True,
+                                            ensure_ascii=False).encode("utf-8")).hexdigest()
+            self.keys[name] = key
+            if self.cache.get(name) != key:
+                continue
+            if any(dep in self.keys and dep not in clean for dep in self.deps[name]):
+                continue
+            if stage.ready is not None and not stage.ready():
+                continue
+            clean.add(name)
+        return {name for name, stage in self.stages.items()
+                if (name in clean or (stage.fingerprint is None and stage.skip_with))
+                and all(other in clean for other in stage.skip_with)}
+                
+    def skip_stage(self, stage):
+        """跳过输入未变化的步骤，进度直接记为完成"""
+        if stage.on_skip is not None:
+            stage.on_skip()
+        self.emit({"type": "stage", "name": stage.name, "status": "skipped"})
+        self.report(stage.name, 1.0)
+        
+    def set_weight(self, name, total):
+        """步骤运行中得知准确的字节总量时更新权重"""
+        with self.lock:
+            self.weights[name] = total
+            
+    def report(self, name, fraction):
+        """记录某个步骤的进度，并按各步骤的字节权重换算为整体进度（只增不减）"""
+        with self.lock:
+            self.fractions[name] = min(max(fraction, 0.0), 1.0)
+            total = sum(self.weights.values())
+            done = sum(self.weights[n] * f for n, f in self.fractions.items())
+            value = done * 100 / total if total else 100
+            if value < self.last_progress:
+                return
+            self.last_progress = value
+        self.emit({"type": "progress", "value": value})
+        
+    def run_stage(self, stage):
+        """在工作线程中执行单个步骤，记录起止时间和处理的文件、字节数"""
+        self.emit({"type": "stage", "name": stage.name, "status": "start"})
+        with self.tracer.span(stage.name, cat="stage") as span:
+            progress = StageProgress(lambda fraction: self.report(stage.name, fraction), span,
+                                     total=self.estimates.get(stage.name),
+                                     on_total=lambda total: self.set_weight(stage.name, total))
+            stage.func(progress)
+        summary = span.summary()
+        self.timings[stage.name] = dict(summary, start=span.start - self.started,
+                                        end=span.end - self.started)
+        self.emit(dict(summary, type="stage", name=stage.name, status="done"))
+        self.report(stage.name, 1.0)
+        
+    def run(self):
+        """执行全部步骤，任一步骤失败时不再启动新步骤，等待运行中的步骤结束后抛出异常"""
+        self.started = time.perf_counter()
+        self.skipped = self.plan_skips()
+        for name in sorted(self.skipped):
+            self.skip_stage(self.stages[name])
+        self.estimate_stages()
+        pending = set(self.stages) - self.skipped
+        finished = set(self.skipped)
+        running = {}
+        error = None
+        # 本次需要运行的步骤先从缓存中移除，成功后再记录新的缓存键
+        if self.cache is not None:
+            for name in pending:
+                self.cache.pop(name, None)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None and not self.cancel_event.is_set():
+                    for name in sorted(pending):
+                        if self.deps[name] <= finished:
+                            running[executor.submit(self.run_stage, self.stages[name])] = name
+                            pending.discard(name)
+                if not running:
+                    break
+                    
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        finished.add(name)
+                        if self.cache is not None and name in self.keys:
+                            self.cache[name] = self.keys[name]
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                            
+        self.wall_time = time.perf_counter() - self.started
+        if error is not None:
+            raise error
+        if pending:
+            raise DeploymentCancelled("用户取消了配置")
+            
+    def critical_path(self):
+        """按实际耗时计算关键路径，返回 (步骤名称列表, 关键路径耗时)"""
+        longest = {}
+        previous = {}
+        for name in self.topological_order():
+            if name not in self.timings:
+                continue
+            best = max((d for d in self.deps[name] if d in longest),
+                       key=lambda d: longest[d], default=None)
+            longest[name] = self.timings[name]["elapsed"] + (longest[best] if best else 0.0)
+            previous[name] = best
+        if not longest:
+            return [], 0.0
+        last = max(longest, key=longest.get)
+        path = []
+        node = last
+        while node is not None:
+            path.append(node)
+            node = previous[node]
+        return list(reversed(path)), longest[last]
+        
+    def topological_order(self):
+        """返回按依赖排序的步骤名称"""
+        order = []
+        visited = set()
+        
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for dep in sorted(self.deps[name]):
+                visit(dep)
+            order.append(name)
+            
+        for name in sorted(self.stages):
+            visit(name)
+        return order
+        
+    def total_stage_time(self):
+        """各步骤耗时之和，与总耗时对比可以看出并行节省的时间"""
+        return sum(t["elapsed"] for t in self.timings.values())
+
+
+class DeployPipeline:
+    """部署流程：解压配置、同步世界、同步模组、更新服务器、启动服务器
+    
+    config为与.dst_server_config.json相同结构的字典；on_event接收结构化事件：
+        {"type": "log", "level": ..., "message": ..., "time": ...}
+        {"type": "progress", "value": 0~100}
+        {"type": "stage", "name": ..., "status": "start"/"done", "elapsed": 秒}
+    """
+    
+    def __init__(self, config, on_event=None, cancel_event=None, port_allocator=None, cpu_allocator=None,
+                 running_supervisor=None):
+        self.config = dict(config)
+        self.on_event = on_event
+        self.cancel_event = cancel_event or threading.Event()
+        self.cluster_name = self.config.get('cluster_name') or CLUSTER_NAME
+        # 多集群部署时共享的端口/CPU分配器，单集群时为None（不改动端口、不固定核心）
+        self.port_allocator = port_allocator
+        self.cpu_allocator = cpu_allocator
+        self.emit_lock = threading.Lock()
+        # 各步骤及子操作的计时和文件/字节统计，可导出为Chrome trace
+        self.tracer = Tracer()
+        # modoverrides.lua解析结果缓存（预估和复制模组两处使用），元组包装以区分未解析和None
+        self.enabled_mods_cache = None
+        # start_servers成功后为分片进程管理器，调用方可用它查看状态或停止服务器
+        self.supervisor = None
+        # 上次部署启动、仍在运行的分片管理器：切换集群前通过控制台存档并关闭，
+        # 集群未变化时滚动重启
+        self.running_supervisor = running_supervisor
+        # 分片就绪检测（start_servers后在后台跟踪启动日志）
+        self.readiness = None
+        # 蓝绿安装时本次部署使用的安装（SteamCMD步骤确定），查询到的最新buildid
+        self.install_slot = None
+        self.latest_buildid = None
+        # 本次部署是否改动了mods目录（复制或删除了模组）、更新了运行中的分片所用的专用服务器，
+        # 两者都没有时运行中的服务器无需重启
+        self.mods_changed = False
+        self.server_updated = False
+        
+    def emit(self, event):
+        """发出结构化事件（多个步骤可能同时发出事件）"""
+        if self.on_event is not None:
+            with self.emit_lock:
+                self.on_event(event)
+            
+    def log_message(self, message, level="INFO"):
+        """发出日志事件"""
+        self.emit({"type": "log", "level": level, "message": message, "time": time.time()})
+        
+    def update_progress(self, value):
+        """发出进度事件"""
+        self.emit({"type": "progress", "value": value})
+        
+    def check_cancelled(self):
+        """在步骤之间检查是否已请求取消"""
+        if self.cancel_event.is_set():
+            raise DeploymentCancelled("用户取消了配置")
+            
+    def klei_path(self):
+        """Klei存档根目录（可用klei_path配置覆盖）"""
+        if self.config.get('klei_path'):
+            return self.config['klei_path']
+        if sys.platform == "win32":
+            return f"C:\\Users\\{getpass.getuser()}\\Documents\\Klei\\DoNotStarveTogether"
+        return os.path.join(os.path.expanduser("~"), ".klei", "DoNotStarveTogether")
+        
+    def server_install_path(self):
+        """专用服务器安装目录（可用server_install_path配置覆盖，蓝绿安装时为本次使用的安装）"""
+        if self.config.get('blue_green'):
+            return self.install_slot_path(self.current_install_slot())
+        if self.config.get('server_install_path'):
+            return self.config['server_install_path']
+        return os.path.join(self.config.get('steamcmd_path', ''), "steamapps", "common",
+                            "Don't Starve Together Dedicated Server")
+        
+    def install_slot_path(self, slot):
+        """蓝绿安装中某个安装的目录（位于install_root，默认为SteamCMD目录）"""
+        root = self.config.get('install_root') or self.config.get('steamcmd_path', '')
+        return os.path.join(root, INSTALL_SLOT_PREFIX + slot)
+        
+    def current_install_slot(self):
+        """蓝绿安装时下次启动使用的安装：本次SteamCMD步骤确定的，或上次更新成功的"""
+        return self.install_slot or self.load_update_state().get("current_install", INSTALL_SLOTS[0])
+        
+    def steamcmd_exe(self):
+        """SteamCMD可执行文件（可用steamcmd_exe配置覆盖）"""
+        if self.config.get('steamcmd_exe'):
+            return self.config['steamcmd_exe']
+        name = "steamcmd.exe" if sys.platform == "win32" else "steamcmd.sh"
+        return os.path.join(self.config.get('steamcmd_path', ''), name)
+        
+    def server_exe(self):
+        """专用服务器可执行文件（可用server_exe配置覆盖）"""
+        if self.config.get('server_exe'):
+            return self.config['server_exe']
+        name = ("dontstarve_dedicated_server_nullrenderer.exe" if sys.platform == "win32"
+                else "dontstarve_dedicated_server_nullrenderer")
+        return os.path.join(self.server_install_path(), "bin", name)
+        
+    def run(self):
+        """运行完整部署流程，出错时抛出异常，取消时抛出DeploymentCancelled
+        
+        各步骤按声明的输入输出组成依赖图，互不依赖的步骤（例如SteamCMD更新与
+        世界文件同步）并行执行
+        """
+        self.log_message(f"开始配置饥荒联机版专用服务器（集群: {self.cluster_name}）...")
+        
+        # 设置路径
+        klei_path = self.klei_path()
+        local_server_path = os.path.join(klei_path, self.cluster_name)
+        # 新集群先在暂存目录中构建，检查通过后再整体切换，运行中的集群不受影响
+        staging_path = f"{local_server_path}{STAGING_SUFFIX}"
+        
+        self.log_message(f"设置Klei路径: {klei_path}")
+        self.log_message(f"暂存目录: {staging_path}")
+        # 存档、备份、切换目录之前确认没有不受本次部署管理的分片在使用该集群
+        self.check_running_shards()
+        self.update_progress(0)
+        
+        # stage_cache关闭时不跳过任何步骤，但仍记录本次的缓存键，避免下次按过期的缓存跳过
+        use_cache = self.config.get('stage_cache', True)
+        scheduler = StageScheduler(
+            self.build_stages(klei_path, local_server_path, staging_path),
+            max_workers=self.config.get('stage_workers', 4),
+            emit=self.emit, cancel_event=self.cancel_event, tracer=self.tracer,
+            cache=self.load_stage_cache() if use_cache else {})
+        try:
+            scheduler.run()
+        finally:
+            # 失败或取消时也导出时间线，便于查看卡在了哪一步；已成功的步骤记录缓存键
+            self.export_trace()
+            self.save_stage_cache(scheduler.cache)
+        self.update_progress(100)
+        
+        if scheduler.skipped:
+            self.log_message(f"输入未变化，跳过步骤: {', '.join(sorted(scheduler.skipped))}")
+        
+        for name, timing in sorted(scheduler.timings.items(), key=lambda item: item[1]["start"]):
+            text = f"步骤 {name}: {timing['elapsed']:.2f} 秒"
+            if timing["bytes"]:
+                text += (f"，{timing['files']} 个文件，{format_size(timing['bytes'])}，"
+                         f"{format_size(timing['throughput'])}/s")
+            self.log_message(text)
+        path, critical_time = scheduler.critical_path()
+        self.log_message(
+            f"关键路径: {' → '.join(path)}，耗时 {critical_time:.2f} 秒；"
+            f"总耗时 {scheduler.wall_time:.2f} 秒，各步骤累计 {scheduler.total_stage_time():.2f} 秒")
+        self.emit({"type": "summary", "critical_path": path, "critical_time": critical_time,
+                   "wall_time": scheduler.wall_time, "stages": scheduler.timings})
+        
+        self.log_message("🎉 配置完成！您的饥荒联机版本地服务器正在启动！", "SUCCESS")
+        
+    def export_trace(self):
+        """配置了trace_path时把本次部署的时间线导出为Chrome trace JSON"""
+        path = self.config.get('trace_path')
+        if not path:
+            return
+        path = path.replace("{cluster}", self.cluster_name)
+        try:
+            self.tracer.export(path, {"cluster": self.cluster_name,
+                                      "started": time.strftime("%Y-%m-%d %H:%M:%S")})
+        except OSError as e:
+            self.log_message(f"导出时间线失败: {str(e)}", "WARNING")
+            return
+        self.log_message(f"部署时间线已导出: {path}（可在chrome://tracing或Perfetto中打开）")
+        
+    def build_stages(self, klei_path, local_server_path, staging_path):
+        """构建部署步骤列表，依赖关系由inputs/outputs推导
+        
+        解压、同步世界、存档和备份只为切换集群服务，跟随swap一起跳过：暂存目录在切换后
+        存放的是旧集群，单独跳过解压或同步世界会把旧内容切换上去
+        """
+        with_hash = self.config.get('stage_cache_hash', False)
+        
+        def extract(progress):
+            self.log_message("正在解压配置文件...")
+            self.extract_config_file(klei_path, staging_path, progress)
+            self.log_message("配置文件解压完成", "SUCCESS")
+            
+        def world(progress):
+            # 准备令牌（暂存目录中的过期文件在同步世界文件时清理）
+            self.restore_cluster_token(staging_path, local_server_path)
+            self.log_message("保留cluster_token.txt文件", "WARNING")
+            self.log_message("正在同步世界文件...")
+            self.copy_world_files(staging_path, progress, keep_files=self.config_cluster_files())
+            self.log_message("世界文件同步完成", "SUCCESS")
+            if self.port_allocator is not None:
+                ports = self.port_allocator.assign_cluster(staging_path)
+                self.log_message("端口分配: " + "，".join(f"{k}={v}" for k, v in ports.items()))
+                
+        def config_fingerprint():
+            return [fingerprint_paths([self.config.get('config_file', '')], with_hash),
+                    self.cluster_name, os.path.abspath(klei_path)]
+            
+        def world_fingerprint():
+            return [fingerprint_paths([self.config.get('world_folder', '')], with_hash),
+                    self.config.get('world_copy_strategy'), self.port_allocator is not None]
+            
+        def mods_fingerprint():
+            if not self.config.get('steam_mod', True):
+                return None
+            sources, _ = self.select_mods()
+            return [os.path.abspath(self.server_install_path()),
+                    {k: self.config.get(k) for k in ('mod_store', 'mod_store_path', 'mod_copy_strategy', 'mod_hash')},
+                    {name: [kind, fingerprint_paths([src], with_hash)] for name, (src, kind) in sources.items()}]
+                    
+        def mods_ready():
+            if not self.config.get('steam_mod', True):
+                return True
+            return os.path.isfile(os.path.join(self.server_install_path(), "mods", MOD_MANIFEST_NAME))
+            
+        def register_ports():
+            # 跳过切换时正式集群的端口保持不变，仍需登记，避免后面的集群分配到相同端口
+            if self.port_allocator is not None:
+                self.port_allocator.assign_cluster(local_server_path)
+                
+        def save(progress):
+            # 服务器仍在运行时先存档，备份中包含最新的进度
+            if self.servers_running():
+                with progress.span("c_save"):
+                    saved = self.running_supervisor.save(self.config.get('save_timeout', CONSOLE_SAVE_TIMEOUT))
+                if not saved:
+                    # 切换前分片存档退出后还会再备份一次，这里只提示，不中止部署
+                    self.log_message("未能确认各分片存档完成，本次备份可能不包含最新进度", "WARNING")
+                    
+        def backup(progress):
+            self.backup_cluster(local_server_path, progress)
+            
+        def swap(progress):
+            self.verify_cluster_folder(staging_path)
+            if self.servers_running():
+                # 运行中的分片存档后退出，再增量备份一次关闭时的存档，然后才切换目录
+                with progress.span("c_shutdown"):
+                    self.running_supervisor.stop(self.config.get('shutdown_timeout', CONSOLE_SHUTDOWN_TIMEOUT))
+                self.backup_cluster(local_server_path, progress)
+            # 正式集群备份完成后，检查暂存目录并切换为正式集群
+            self.swap_cluster_folder(staging_path, local_server_path)
+            
+        def mods(progress):
+            # 仅当勾选时执行
+            if self.config.get('steam_mod', True):
+                self.log_message("正在复制模组文件...")
+                self.copy_mods(progress)
+                self.log_message("模组文件复制完成", "SUCCESS")
+            else:
+                self.log_message("跳过模组复制", "INFO")
+                
+        def steamcmd(progress):
+            self.log_message("正在运行SteamCMD更新...")
+            self.update_steamcmd(progress)
+            self.log_message("SteamCMD更新完成", "SUCCESS")
+            
+        def start(progress):
+            if self.servers_running() and self.install_switched():
+                # 换到新版本的安装：各分片版本必须一致，不能逐个重启，全部存档退出后从新安装启动
+                self.log_message(f"专用服务器安装已切换到 {self.server_install_path()}，正在重启全部分片...")
+                with progress.span("c_shutdown"):
+                    self.running_supervisor.stop(self.config.get('shutdown_timeout', CONSOLE_SHUTDOWN_TIMEOUT))
+            if self.servers_running() and not (self.mods_changed or self.server_updated):
+                self.supervisor = self.running_supervisor
+                self.log_message("集群、模组和专用服务器均未变化，服务器继续运行，无需重启", "SUCCESS")
+                return
+            if self.servers_running():
+                # 集群目录没有切换，服务器仍在运行：逐个分片滚动重启以应用模组和服务器更新
+                self.log_message("正在滚动重启服务器...")
+                # 已重启的分片继续运行；取消或某个分片超时未就绪时不再重启后面的分片
+                self.supervisor = self.running_supervisor
+                self.running_supervisor.rolling_restart(
+                    timeout=self.config.get('shutdown_timeout', CONSOLE_SHUTDOWN_TIMEOUT),
+                    settle=self.config.get('rolling_settle', ROLLING_SETTLE_TIME),
+                    ready_timeout=self.config.get('ready_timeout', READY_TIMEOUT),
+                    cancel_event=self.cancel_event)
+                self.check_cancelled()
+                self.log_message("服务器滚动重启完成！", "SUCCESS")
+                return
+            self.log_message("正在启动服务器...")
+            self.start_servers()
+            self.log_message("服务器进程已启动", "SUCCESS")
+            if self.readiness is not None and self.config.get('wait_ready', False):
+                # 等待各分片加载完模组和世界、连上主分片，本步骤的耗时即为就绪耗时
+                self.log_message("正在等待各分片就绪...")
+                if not self.readiness.wait(self.config.get('ready_timeout', READY_TIMEOUT)):
+                    pending = [name for name in self.readiness.shards if not self.readiness.is_ready(name)]
+                    raise RuntimeError(f"分片未能就绪: {', '.join(pending)}")
+                self.log_message("服务器启动完成，各分片已就绪！", "SUCCESS")
+            
+        # 蓝绿安装时模组复制到本次更新后使用的安装，运行中的分片等SteamCMD更新完另一个安装
+        # 后才关闭；使用哪个安装要在更新时才确定，模组步骤不按缓存跳过（模组按清单增量同步）
+        blue_green = bool(self.config.get('blue_green'))
+        install_inputs = ("server_install",) if blue_green else ()
+        stages = [
+            Stage("extract", extract, inputs=("config_file",), outputs=("staged_config",), weight=1,
+                  estimate=self.estimate_config_bytes,
+                  fingerprint=config_fingerprint, skip_with=("swap",)),
+            Stage("world", world, inputs=("staged_config", "world_folder"), outputs=("staged_cluster",), weight=3,
+                  estimate=lambda: directory_size(self.config.get('world_folder', '')),
+                  fingerprint=world_fingerprint, skip_with=("swap",)),
+            Stage("save", save, outputs=("cluster_saved",), weight=1, skip_with=("swap",)),
+            Stage("backup", backup, inputs=("cluster_saved",), outputs=("cluster_backup",), weight=1,
+                  estimate=lambda: (directory_size(local_server_path)
+                                    if self.config.get('backup', True) and os.path.isdir(local_server_path) else 0),
+                  skip_with=("swap",)),
+            Stage("swap", swap, inputs=("staged_cluster", "cluster_backup") + install_inputs, outputs=("cluster",),
+                  weight=1,
+                  fingerprint=lambda: os.path.abspath(local_server_path),
+                  ready=lambda: os.path.isfile(os.path.join(local_server_path, "cluster.ini")),
+                  on_skip=register_ports),
+            Stage("mods", mods, inputs=("workshop",) + install_inputs, outputs=("mods",), weight=3,
+                  estimate=lambda: (sum(directory_size(src) for src, _ in self.select_mods()[0].values())
+                                    if self.config.get('steam_mod', True) else 0),
+                  fingerprint=None if blue_green else mods_fingerprint, ready=mods_ready),
+            Stage("steamcmd", steamcmd, outputs=("server_install",), weight=4),
+        ]
+        if self.config.get('start_servers', True):
+            stages.append(Stage("start", start, inputs=("cluster", "mods", "server_install"),
+                                outputs=("servers",), weight=1))
+        else:
+            self.log_message("跳过启动服务器", "INFO")
+        return stages
+        
+    def estimate_config_bytes(self):
+        """配置文件压缩包解压后的总字节数"""
+        with zipfile.ZipFile(self.config.get('config_file', ''), 'r') as zip_ref:
+            return sum(info.file_size for info in zip_ref.infolist())
+            
+    def extract_config_file(self, target_path, cluster_path=None, progress=None):
+        """解压配置文件
+        
+        指定cluster_path时，压缩包中MyDediServer（或与集群同名）目录下的文件解压到cluster_path，
+        其余文件仍解压到target_path；世界文件夹中也有的集群文件由同步世界写入，不解压，
+        否则两个步骤每次部署都会互相覆盖。磁盘上大小和CRC32都一致的文件会被跳过；
+        需要解压的文件先流式解压到临时文件并校验CRC，全部成功后才替换正式文件，
+        压缩包损坏时不会改动任何已有文件
+        """
+        progress = as_progress(progress)
+        config_file = self.config.get('config_file', '')
+        if not os.path.exists(config_file):
+            raise FileNotFoundError(f"配置文件不存在: {config_file}")
+            
+        try:
+            zip_ref = zipfile.ZipFile(config_file, 'r')
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"配置文件不是有效的压缩包: {str(e)}") from e
+            
+        world_files = self.world_file_keys() if cluster_path is not None else set()
+        with zip_ref:
+            # 先规划所有条目的目标路径，不安全的路径在写入任何文件之前就会报错
+            entries = []
+            for info in zip_ref.infolist():
+                parts = [p for p in info.filename.split('/') if p]
+                if cluster_path is not None and parts and parts[0] in (CLUSTER_NAME, self.cluster_name):
+                    dest = self.safe_join(cluster_path, parts[1:])
+                    if not info.is_dir() and "/".join(parts[1:]) in world_files:
+                        continue
+                else:
+                    dest = self.safe_join(target_path, parts)
+                entries.append((info, dest))
+                
+        pending = []
+        skipped = 0
+        with progress.span("校验已有文件") as op:
+            for info, dest in entries:
+                if info.is_dir():
+                    continue
+                if self.zip_entry_unchanged(info, dest):
+                    skipped += 1
+                    op.add(1, info.file_size)
+                else:
+                    pending.append((info, dest))
+            op.set(skipped=skipped)
+                
+        # 解压到临时文件：大文件并行解压，小文件在当前线程解压
+        large = [e for e in pending if e[0].file_size >= ZIP_PARALLEL_THRESHOLD]
+        small = [e for e in pending if e[0].file_size < ZIP_PARALLEL_THRESHOLD]
+        written = []
+        with progress.span("解压", files=len(pending)) as extract_op:
+            try:
+                if large:
+                    workers = min(len(large), self.config.get('zip_workers') or min(4, os.cpu_count() or 1))
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        futures = [executor.submit(self.extract_zip_entry, config_file, info, dest,
+                                                   on_done=extract_op.add)
+                                   for info, dest in large]
+                        # 等所有条目都结束再报错，保证失败时能清理全部临时文件
+                        errors = []
+                        for future in as_completed(futures):
+                            try:
+                                written.append(future.result())
+                            except Exception as e:
+                                errors.append(e)
+                        if errors:
+                            raise errors[0]
+                if small:
+                    with zipfile.ZipFile(config_file, 'r') as zip_ref:
+                        for info, dest in small:
+                            written.append(self.extract_zip_entry(config_file, info, dest, zip_ref,
+                                                                  on_done=extract_op.add))
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                for tmp_path, _ in written:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise ValueError(f"配置文件已损坏，未写入任何文件: {str(e)}") from e
+            except Exception:
+                for tmp_path, _ in written:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise
+            
+        for info, dest in entries:
+            if info.is_dir():
+                os.makedirs(dest, exist_ok=True)
+        for tmp_path, dest in written:
+            os.replace(tmp_path, dest)
+            
+        self.log_message(f"配置文件解压: 跳过 {skipped} 个未变化文件，解压 {len(written)} 个文件")
+        
+    def config_cluster_files(self):
+        """配置文件压缩包中解压到集群目录的文件（相对路径，/分隔），同步世界时不删除"""
+        with zipfile.ZipFile(self.config.get('config_file', ''), 'r') as zip_ref:
+            names = zip_ref.namelist()
+        files = set()
+        for name in names:
+            parts = [p for p in name.split('/') if p]
+            if len(parts) > 1 and parts[0] in (CLUSTER_NAME, self.cluster_name) and not name.endswith('/'):
+                files.add("/".join(parts[1:]))
+        return files
+        
+    def world_file_keys(self):
+        """同步世界时会写入的文件（相对路径，/分隔），解压配置文件时跳过"""
+        world_folder = self.config.get('world_folder', '')
+        keys = set()
+        for root, _, files in os.walk(world_folder):
+            rel_root = os.path.relpath(root, world_folder)
+            for f in files:
+                key = os.path.normpath(os.path.join(rel_root, f)).replace(os.sep, "/")
+                if key not in WORLD_SYNC_KEEP:
+                    keys.add(key)
+        return keys
+        
+    def zip_entry_unchanged(self, info, dest):
+        """磁盘上的文件大小和CRC32与压缩包条目一致时返回True"""
+        try:
+            if os.path.getsize(dest) != info.file_size:
+                return False
+            crc = 0
+            with open(dest, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    crc = zlib.crc32(chunk, crc)
+        except OSError:
+            return False
+        return crc == info.CRC
+        
+    def extract_zip_entry(self, config_file, info, dest, zip_ref=None, on_done=None):
+        """把单个条目流式解压到临时文件，返回 (临时文件, 目标路径)
+        
+        读取到末尾时zipfile会校验CRC，数据损坏会抛出BadZipFile。
+        未传入zip_ref时（工作线程中）单独打开压缩包；解压完成后调用on_done(1, 字节数)
+        """
+        own_zip = zip_ref is None
+        if own_zip:
+            zip_ref = zipfile.ZipFile(config_file, 'r')
+        tmp_path = dest + ".dst_tmp"
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with zip_ref.open(info) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            if on_done is not None:
+                on_done(1, info.file_size)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            if own_zip:
+                zip_ref.close()
+        return tmp_path, dest
+                    
+    def safe_join(self, base, parts):
+        """拼接压缩包内的路径，拒绝绝对路径和..以防写出目标目录"""
+        for part in parts:
+            if part in ('..', '.') or os.path.isabs(part) or ':' in part or '\\' in part:
+                raise ValueError(f"压缩包中包含不安全的路径: {'/'.join(parts)}")
+        return os.path.join(base, *parts)
+            
+    def clean_server_folder(self, server_path):
+        """清理服务器文件夹"""
+        if not os.path.exists(server_path):
+            os.makedirs(server_path)
+            return
+            
+        # 备份cluster_token.txt
+        cluster_token_path = os.path.join(server_path, "cluster_token.txt")
+        backup_path = os.path.join(server_path, "cluster_token.txt.bak")
+        
+        if os.path.exists(cluster_token_path):
+            shutil.copy2(cluster_token_path, backup_path)
+            
+        # 删除除cluster_token.txt外的所有文件和文件夹
+        for item in os.listdir(server_path):
+            item_path = os.path.join(server_path, item)
+            if item != "cluster_token.txt":
+                if os.path.isdir(item_path):
+                    shutil.rmtree(item_path)
+                else:
+                    os.remove(item_path)
+                    
+        # 恢复cluster_token.txt
+        if os.path.exists(backup_path):
+            shutil.move(backup_path, cluster_token_path)
+                    
+    def restore_cluster_token(self, staging_path, live_path):
+        """配置文件中没有cluster_token.txt时，沿用正式集群中的令牌"""
+        staging_token = os.path.join(staging_path, "cluster_token.txt")
+        live_token = os.path.join(live_path, "cluster_token.txt")
+        if not os.path.exists(staging_token) and os.path.exists(live_token):
+            shutil.copy2(live_token, staging_token)
+            
+    def verify_cluster_folder(self, cluster_path):
+        """检查构建好的集群目录是否完整"""
+        if not os.path.isfile(os.path.join(cluster_path, "cluster.ini")):
+            raise FileNotFoundError(f"集群目录缺少cluster.ini: {cluster_path}")
+        if not os.path.isdir(os.path.join(cluster_path, "Master")):
+            raise FileNotFoundError(f"集群目录缺少Master文件夹: {cluster_path}")
+        if not os.path.isfile(os.path.join(cluster_path, "cluster_token.txt")):
+            self.log_message("集群目录中没有cluster_token.txt，服务器可能无法启动", "WARNING")
+        self.log_message("暂存集群检查通过", "SUCCESS")
+        
+    def swap_cluster_folder(self, staging_path, live_path):
+        """用重命名把暂存目录切换为正式集群
+        
+        旧集群被换到暂存目录位置保留下来，下次部署时复用；切换失败时立即回滚
+        """
+        start = time.perf_counter()
+        if not os.path.exists(live_path):
+            os.rename(staging_path, live_path)
+        else:
+            old_path = f"{live_path}{OLD_SUFFIX}"
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            try:
+                os.rename(live_path, old_path)
+            except OSError as e:
+                raise RuntimeError(f"无法切换集群目录，请先关闭正在运行的服务器: {str(e)}") from e
+            try:
+                os.rename(staging_path, live_path)
+            except OSError:
+                os.rename(old_path, live_path)
+                self.log_message("切换集群失败，已回滚到原集群", "ERROR")
+                raise
+            os.rename(old_path, staging_path)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.log_message(f"集群已切换为新版本，耗时 {elapsed:.1f} 毫秒", "SUCCESS")
+        
+    def install_switched(self):
+        """运行中的分片所用的安装与本次部署使用的不同（蓝绿安装切换到了新版本）"""
+        server_path = os.path.abspath(os.path.dirname(self.server_exe()))
+        return any(os.path.abspath(shard.cwd) != server_path for shard in self.running_supervisor.shards)
+        
+    def check_running_shards(self, allow_supervised=True):
+        """锁文件中记录的该集群分片仍在运行（例如另一个部署或命令行启动的）时拒绝继续
+        
+        allow_supervised时不计本次部署接手的running_supervisor管理的分片
+        """
+        running = running_shards(self.shard_lock_path(), self.cluster_name)
+        if allow_supervised and self.running_supervisor is not None:
+            supervised = {shard.process.pid for shard in self.running_supervisor.shards if shard.process is not None}
+            running = {name: pid for name, pid in running.items() if pid not in supervised}
+        if running:
+            shards = ", ".join(f"{name}（PID {pid}）" for name, pid in sorted(running.items()))
+            raise RuntimeError(f"检测到分片仍在运行: {shards}，请先停止服务器")
+            
+    def servers_running(self):
+        """上次部署启动的分片是否仍在运行"""
+        return self.running_supervisor is not None and self.running_supervisor.is_running()
+        
+    def backup_path(self):
+        """集群备份仓库目录（可用backup_path配置覆盖）"""
+        return self.config.get('backup_path') or os.path.join(self.klei_path(), BACKUP_DIR)
+        
+    def open_backup_store(self):
+        return BackupStore(self.backup_path(), workers=self.config.get('backup_workers', 4))
+        
+    def backup_cluster(self, live_path, progress=None):
+        """给正式集群拍一个增量快照，然后按保留策略清理旧快照
+        
+        backup为false时跳过；正式集群还不存在（第一次部署）时没有需要备份的内容
+        """
+        progress = as_progress(progress)
+        if not self.config.get('backup', True):
+            self.log_message("跳过集群备份", "INFO")
+            return
+        if not os.path.isdir(live_path):
+            self.log_message("正式集群不存在，无需备份")
+            return
+            
+        self.log_message(f"正在备份当前集群到: {self.backup_path()}")
+        store = self.open_backup_store()
+        with progress.span("快照") as op:
+            manifest, created = store.snapshot(live_path, self.cluster_name,
+                                               on_file=lambda size: op.add(files=1, bytes=size))
+            op.set(chunks=store.added_chunks, stored_bytes=store.added_bytes)
+        if created:
+            self.log_message(
+                f"集群备份完成: {manifest['id']}，{manifest['file_count']} 个文件，"
+                f"{format_size(manifest['size'])}，新增 {store.added_chunks} 个数据块"
+                f"（压缩后 {format_size(store.added_bytes)}）", "SUCCESS")
+        else:
+            self.log_message(f"集群与最近的备份 {manifest['id']} 相同，无需新建备份", "SUCCESS")
+            
+        with progress.span("清理旧备份"):
+            expired, removed, freed = store.prune(
+                self.cluster_name,
+                keep_last=self.config.get('backup_keep_last', BACKUP_KEEP_LAST),
+                keep_daily=self.config.get('backup_keep_daily', BACKUP_KEEP_DAILY),
+                keep_weekly=self.config.get('backup_keep_weekly', BACKUP_KEEP_WEEKLY))
+        if expired:
+            self.log_message(f"按保留策略删除 {expired} 个旧备份，回收 {removed} 个数据块，"
+                             f"释放 {format_size(freed)}")
+            
+    def restore_backup(self, snapshot_id=None):
+        """把备份还原为正式集群，snapshot_id为None时还原最新的备份
+        
+        还原前先给当前集群拍一个快照，还原的内容先写入临时目录，再与正式集群整体切换
+        """
+        # 运行中的分片会继续写入存档并在退出时覆盖还原的内容
+        self.check_running_shards(allow_supervised=False)
+        klei_path = self.klei_path()
+        live_path = os.path.join(klei_path, self.cluster_name)
+        restore_path = f"{live_path}{RESTORE_SUFFIX}"
+        store = self.open_backup_store()
+        manifest = store.load_snapshot(snapshot_id, self.cluster_name)
+        
+        # 切换后换下来的集群会被删除，关闭了部署备份（backup为false）时也要先拍快照
+        if os.path.isdir(live_path):
+            current, created = store.snapshot(live_path, self.cluster_name)
+            if created:
+                self.log_message(f"已备份还原前的集群: {current['id']}")
+                
+        start = time.perf_counter()
+        if os.path.exists(restore_path):
+            shutil.rmtree(restore_path)
+        self.log_message(f"正在还原备份 {manifest['id']}（{manifest['file_count']} 个文件，"
+                         f"{format_size(manifest['size'])}）...")
+        try:
+            store.restore(manifest, restore_path)
+        except BaseException:
+            shutil.rmtree(restore_path, ignore_errors=True)
+            raise
+        self.swap_cluster_folder(restore_path, live_path)
+        shutil.rmtree(restore_path, ignore_errors=True)
+        elapsed = time.perf_counter() - start
+        self.log_message(f"备份 {manifest['id']} 已还原到 {live_path}，耗时 {elapsed:.2f} 秒", "SUCCESS")
+        return manifest
+        
+    def copy_world_files(self, target_path, progress=None, keep_files=()):
+        """增量同步世界文件
+        
+        目标目录中的哈希索引记录了上次写入的每个文件的大小、修改时间和内容哈希，
+        内容未变的文件直接跳过，源中已不存在的文件会被删除（keep_files中的文件除外，
+        例如从配置文件压缩包解压的文件）
+        """
+        progress = as_progress(progress)
+        world_folder = self.config.get('world_folder', '')
+        if not os.path.exists(world_folder):
+            raise FileNotFoundError(f"世界文件夹不存在: {world_folder}")
+            
+        engine = CopyEngine.from_setting(
+            self.config.get('world_copy_strategy'), WORLD_COPY_STRATEGIES)
+        os.makedirs(target_path, exist_ok=True)
+        index = self.load_world_index(target_path)
+        old_files = index.get("files", {})
+        old_sources = index.get("sources", {})
+        new_files = {}
+        new_sources = {}
+        source_dirs = set()
+        
+        skipped_files = skipped_bytes = 0
+        copied_files = copied_bytes = 0
+        
+        with progress.span("同步文件") as op:
+            for root, dirs, files in os.walk(world_folder):
+                rel_root = os.path.relpath(root, world_folder)
+                for d in dirs:
+                    source_dirs.add(os.path.normpath(os.path.join(rel_root, d)))
+                for f in files:
+                    rel_path = os.path.normpath(os.path.join(rel_root, f))
+                    key = rel_path.replace(os.sep, "/")
+                    if key in WORLD_SYNC_KEEP:
+                        continue
+                    src = os.path.join(world_folder, rel_path)
+                    dst = os.path.join(target_path, rel_path)
+                    src_stat = os.stat(src)
+                
+                    # 源文件的大小和修改时间未变时沿用上次计算的哈希
+                    cached = old_sources.get(key)
+                    if cached and cached["size"] == src_stat.st_size and cached["mtime"] == src_stat.st_mtime_ns:
+                        src_hash = cached["hash"]
+                    else:
+                        src_hash = self.hash_file(src)
+                    new_sources[key] = {"size": src_stat.st_size, "mtime": src_stat.st_mtime_ns, "hash": src_hash}
+                
+                    # 目标文件自上次写入后没有被改动，且内容与源相同，则跳过
+                    entry = old_files.get(key)
+                    if entry and entry["hash"] == src_hash:
+                        try:
+                            dst_stat = os.stat(dst)
+                        except OSError:
+                            dst_stat = None
+                        if (dst_stat is not None and dst_stat.st_size == entry["size"]
+                                and dst_stat.st_mtime_ns == entry["mtime"]):
+                            new_files[key] = entry
+                            skipped_files += 1
+                            skipped_bytes += src_stat.st_size
+                            op.add(1, src_stat.st_size)
+                            continue
+                
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    engine.copy_file(src, dst)
+                    dst_stat = os.stat(dst)
+                    new_files[key] = {"size": dst_stat.st_size, "mtime": dst_stat.st_mtime_ns, "hash": src_hash}
+                    copied_files += 1
+                    copied_bytes += src_stat.st_size
+                    op.add(1, src_stat.st_size)
+            op.set(copied_files=copied_files, copied_bytes=copied_bytes, skipped_files=skipped_files)
+        
+        with progress.span("清理过期文件") as op:
+            pruned = self.prune_world_files(target_path, new_files.keys() | set(keep_files), source_dirs)
+            op.set(pruned=pruned)
+        with progress.span("保存索引"):
+            self.save_world_index(target_path, {
+                "version": WORLD_INDEX_VERSION, "files": new_files, "sources": new_sources})
+        
+        self.log_message(
+            f"世界文件同步: 跳过 {skipped_files} 个未变化文件（{format_size(skipped_bytes)}），"
+            f"传输 {copied_files} 个文件（{format_size(copied_bytes)}），删除 {pruned} 个过期文件")
+        if copied_files:
+            self.log_message(f"世界文件复制方式: {engine.summary()}")
+            
+    def prune_world_files(self, target_path, keep_files, keep_dirs):
+        """删除目标目录中源已不存在的文件和文件夹，返回删除的文件数"""
+        pruned = 0
+        for root, dirs, files in os.walk(target_path, topdown=False):
+            rel_root = os.path.relpath(root, target_path)
+            for f in files:
+                rel_path = os.path.normpath(os.path.join(rel_root, f))
+                key = rel_path.replace(os.sep, "/")
+                if key in keep_files or key in WORLD_SYNC_KEEP:
+                    continue
+                os.remove(os.path.join(root, f))
+                pruned += 1
+            for d in dirs:
+                rel_path = os.path.normpath(os.path.join(rel_root, d))
+                dir_path = os.path.join(root, d)
+                if rel_path not in keep_dirs and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+        return pruned
+        
+    def hash_file(self, path):
+        """计算文件内容的SHA-1"""
+        hasher = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+        
+    def load_world_index(self, target_path):
+        """加载世界文件哈希索引，不存在或损坏时返回空索引"""
+        index_path = os.path.join(target_path, WORLD_INDEX_NAME)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if index.get("version") != WORLD_INDEX_VERSION:
+            return {}
+        return index
+        
+    def save_world_index(self, target_path, index):
+        """保存世界文件哈希索引"""
+        index_path = os.path.join(target_path, WORLD_INDEX_NAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+                
+    def workshop_path(self):
+        """Steam Workshop中饥荒联机版模组的下载目录"""
+        return os.path.join(self.config.get('steam_path', ''), "steamapps", "workshop", "content", "322330")
+        
+    def mod_sources(self):
+        """收集所有源模组：目标目录名 -> (源路径, 类型)"""
+        sources = {}
+        workshop_path = self.workshop_path()
+        if os.path.exists(workshop_path):
+            for item in os.listdir(workshop_path):
+                src = os.path.join(workshop_path, item)
+                if os.path.isdir(src):
+                    sources[f"workshop-{item}"] = (src, "workshop")
+                    
+        local_mods_path = os.path.join(self.config.get('steam_path', ''), "steamapps", "common",
+                                       "Don't Starve Together", "mods")
+        if os.path.exists(local_mods_path):
+            for item in os.listdir(local_mods_path):
+                src = os.path.join(local_mods_path, item)
+                if os.path.isdir(src):
+                    sources[item] = (src, "local")
+        return sources
+        
+    def enabled_mods(self):
+        """读取世界文件夹和配置文件压缩包中的modoverrides.lua，返回启用的模组集合
+        
+        多集群部署时使用deploy_clusters预先汇总的全部集群启用的模组（共用一个mods目录）；
+        没有找到modoverrides.lua或无法解析时返回None，表示复制全部模组
+        """
+        if 'cluster_enabled_mods' in self.config:
+            mods = self.config['cluster_enabled_mods']
+            return set(mods) if mods is not None else None
+        if self.enabled_mods_cache is None:
+            mods, _, errors = collect_enabled_mods(self.config.get('world_folder'), self.config.get('config_file'))
+            for path, error in errors:
+                self.log_message(f"无法解析 {path}: {error}，将复制全部模组", "WARNING")
+            self.enabled_mods_cache = (mods,)
+        return self.enabled_mods_cache[0]
+        
+    def select_mods(self):
+        """返回 (需要复制的源模组, 已启用但找不到的模组)
+        
+        only_enabled_mods开启（默认）且找到modoverrides.lua时只复制其中启用的模组
+        """
+        sources = self.mod_sources()
+        if not self.config.get('only_enabled_mods', True):
+            return sources, set()
+        wanted = self.enabled_mods()
+        if wanted is None:
+            return sources, set()
+        selected = {name: source for name, source in sources.items() if name in wanted}
+        return selected, wanted - set(sources)
+        
+    def copy_mods(self, progress=None):
+        """复制模组文件（基于同步清单增量同步，多线程并行复制）"""
+        progress = as_progress(progress)
+        workshop_path = self.workshop_path()
+        mods_path = os.path.join(self.server_install_path(), "mods")
+        
+        self.log_message(f"Workshop路径: {workshop_path}")
+        self.log_message(f"Mods目标路径: {mods_path}")
+        
+        if not os.path.exists(workshop_path):
+            self.log_message(f"警告: Steam Workshop路径不存在: {workshop_path}", "WARNING")
+            return
+            
+        available = len(self.mod_sources())
+        sources, missing = self.select_mods()
+        if len(sources) < available or missing:
+            self.log_message(f"根据modoverrides.lua只复制启用的 {len(sources)} 个模组（共 {available} 个可用）")
+        for name in sorted(missing):
+            hint = "请在创意工坊订阅该模组" if name.startswith("workshop-") else "请检查本地mods目录"
+            self.log_message(f"modoverrides.lua中启用的模组 {name} 未找到，{hint}", "WARNING")
+        os.makedirs(mods_path, exist_ok=True)
+        manifest = self.load_mod_manifest(mods_path)
+        if manifest is None:
+            # 没有同步清单时按旧版本的方式清理残留的workshop模组
+            self.log_message("未找到模组同步清单，将执行完整同步")
+            manifest = {}
+            for item in os.listdir(mods_path):
+                if item.startswith("workshop-") and item not in sources:
+                    shutil.rmtree(os.path.join(mods_path, item), ignore_errors=True)
+        
+        with_hash = self.config.get('mod_hash', False)
+        self.mod_copy_engine = CopyEngine.from_setting(
+            self.config.get('mod_copy_strategy'), MOD_COPY_STRATEGIES)
+        self.mod_store = None
+        if self.config.get('mod_store', False):
+            store_path = self.config.get('mod_store_path') or os.path.join(
+                self.config.get('steamcmd_path', ''), MOD_STORE_DIR)
+            self.mod_store = ModStore(store_path, CopyEngine)
+            self.log_message(f"使用共享模组仓库: {store_path}")
+        old_entries = manifest.get("mods", {})
+        new_entries = {}
+        
+        # 初始化计数器
+        workshop_count = 0
+        local_count = 0
+        unchanged_count = 0
+        removed_count = 0
+        
+        workers = self.get_mod_workers()
+        if workers > 1:
+            self.log_message(f"使用 {workers} 个线程并行同步模组")
+        
+        # 每个模组的扫描和复制互不影响，放入线程池执行；日志和计数只在当前线程处理
+        total = len(sources)
+        done = 0
+        next_report = 10
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self.sync_one_mod, name, src, kind,
+                                os.path.join(mods_path, name), old_entries.get(name), with_hash, progress)
+                for name, (src, kind) in sorted(sources.items())
+            ]
+            for future in as_completed(futures):
+                name, kind, status, result = future.result()
+                done += 1
+                if status == "unchanged":
+                    new_entries[name] = result
+                    unchanged_count += 1
+                elif status == "copied":
+                    new_entries[name] = result
+                    if kind == "workshop":
+                        workshop_count += 1
+                    else:
+                        local_count += 1
+                else:
+                    label = "workshop模组" if kind == "workshop" else "本地模组"
+                    self.log_message(f"复制{label} {name} 时出错: {result}", "WARNING")
+                
+                percent = done * 100 // total
+                if not progress.total:
+                    progress(done / total)
+                if percent >= next_report:
+                    self.log_message(f"模组同步进度: {done}/{total} ({percent}%)")
+                    next_report = percent // 10 * 10 + 10
+        
+        # 删除源中已不存在的模组
+        for name in old_entries:
+            if name not in sources:
+                shutil.rmtree(os.path.join(mods_path, name), ignore_errors=True)
+                removed_count += 1
+                self.log_message(f"删除已移除的模组: {name}")
+        
+        self.save_mod_manifest(mods_path, {"version": MOD_MANIFEST_VERSION, "mods": new_entries})
+        self.mods_changed = bool(workshop_count or local_count or removed_count)
+        
+        self.log_message(f"共复制 {workshop_count} 个workshop模组，{local_count} 个本地模组")
+        if self.mod_store is not None:
+            self.sync_mod_store(mods_path, new_entries)
+        elif workshop_count or local_count:
+            self.log_message(f"模组复制方式: {self.mod_copy_engine.summary()}")
+        total_count = len(new_entries)
+        self.log_message(f"模组同步完成，总计 {total_count} 个模组（未变化 {unchanged_count} 个，删除 {removed_count} 个）", "SUCCESS")
+        
+    def sync_mod_store(self, mods_path, entries):
+        """更新共享仓库中本mods目录的引用记录，并回收不再被任何mods目录引用的对象"""
+        store = self.mod_store
+        store.set_refs(mods_path, {name: entry["tree"] for name, entry in entries.items()
+                                   if "tree" in entry})
+        removed, freed = store.gc()
+        store.save_index()
+        if store.added_objects:
+            self.log_message(f"模组仓库新增 {store.added_objects} 个文件对象（{format_size(store.added_bytes)}）")
+        if store.link_engine.counts:
+            self.log_message(f"模组链接方式: {store.link_engine.summary()}")
+        if removed:
+            self.log_message(f"模组仓库回收 {removed} 个未引用的文件对象，释放 {format_size(freed)}")
+        
+    def get_mod_workers(self):
+        """获取模组复制线程数（配置项mod_workers，1表示串行）"""
+        workers = self.config.get('mod_workers')
+        if not workers:
+            workers = min(8, (os.cpu_count() or 1) + 4)
+        try:
+            return max(1, int(workers))
+        except (TypeError, ValueError):
+            return 1
+        
+    def sync_one_mod(self, name, src, kind, dst, old_entry, with_hash, progress=None):
+        """同步单个模组（在工作线程中执行，不直接写日志）
+        
+        返回 (名称, 类型, 状态, 结果)，状态为unchanged/copied/error
+        """
+        with as_progress(progress).span(name, kind=kind) as op:
+            result = self._sync_one_mod(name, src, kind, dst, old_entry, with_hash)
+            status, entry = result[2], result[3]
+            op.set(status=status)
+            if status != "error":
+                op.add(entry["signature"]["files"], entry["signature"]["size"])
+        return result
+        
+    def _sync_one_mod(self, name, src, kind, dst, old_entry, with_hash):
+        try:
+            signature = self.scan_mod_signature(src, with_hash)
+            # 启用共享仓库后，之前直接复制的模组需要重新从仓库链接一次
+            if (old_entry and os.path.isdir(dst)
+                    and (self.mod_store is None or "tree" in old_entry)
+                    and self.mod_signature_matches(old_entry.get("signature", {}), signature)):
+                return name, kind, "unchanged", old_entry
+                
+            if os.path.exists(dst):
+                shutil.rmtree(dst)
+            entry = {"source": src, "kind": kind, "signature": signature}
+            if self.mod_store is not None:
+                entry["tree"] = self.mod_store.ingest(src)
+                self.mod_store.materialize(entry["tree"], dst)
+            else:
+                self.mod_copy_engine.copytree(src, dst)
+            return name, kind, "copied", entry
+        except Exception as e:
+            return name, kind, "error", str(e)
+        
+    def scan_mod_signature(self, mod_path, with_hash=False):
+        """计算模组目录的签名（文件数、总大小、最新修改时间，可选内容哈希）"""
+        file_count = 0
+        total_size = 0
+        latest_mtime = os.stat(mod_path).st_mtime_ns
+        hasher = hashlib.sha1() if with_hash else None
+        
+        for root, dirs, files in os.walk(mod_path):
+            dirs.sort()
+            for d in dirs:
+                latest_mtime = max(latest_mtime, os.stat(os.path.join(root, d)).st_mtime_ns)
+            for f in sorted(files):
+                file_path = os.path.join(root, f)
+                st = os.stat(file_path)
+                file_count += 1
+                total_size += st.st_size
+                latest_mtime = max(latest_mtime, st.st_mtime_ns)
+                if hasher is not None:
+                    rel_path = os.path.relpath(file_path, mod_path).replace(os.sep, "/")
+                    hasher.update(rel_path.encode("utf-8") + b"\0")
+                    with open(file_path, 'rb') as fh:
+                        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                            hasher.update(chunk)
+        
+        signature = {"files": file_count, "size": total_size, "mtime": latest_mtime}
+        if hasher is not None:
+            signature["hash"] = hasher.hexdigest()
+        return signature
+        
+    def mod_signature_matches(self, old, new):
+        """比较两个模组签名是否一致"""
+        for key in ("files", "size", "mtime"):
+            if old.get(key) != new.get(key):
+                return False
+        if "hash" in new and old.get("hash") != new["hash"]:
+            return False
+        return True
+        
+    def load_mod_manifest(self, mods_path):
+        """加载模组同步清单，不存在或损坏时返回None"""
+        manifest_path = os.path.join(mods_path, MOD_MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            self.log_message("模组同步清单损坏，将重新同步", "WARNING")
+            return None
+        if manifest.get("version") != MOD_MANIFEST_VERSION:
+            return None
+        return manifest
+        
+    def save_mod_manifest(self, mods_path, manifest):
+        """保存模组同步清单（先写临时文件再替换，避免写坏）"""
+        manifest_path = os.path.join(mods_path, MOD_MANIFEST_NAME)
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+            
+    def update_steamcmd(self, progress=None):
+        """更新SteamCMD
+        
+        根据更新策略（配置项update_policy）决定跳过、普通更新或完整校验：
+        auto - 已是最新版本且近期校验过则跳过，有新版本时不带validate更新，
+               超过validate_interval_days天未校验时完整校验
+        update - 总是更新但不校验；validate - 总是完整校验；skip - 总是跳过
+        
+        blue_green开启时不更新运行中的服务器所用的安装，见update_install_slot
+        """
+        progress = as_progress(progress)
+        steamcmd_path = self.config.get('steamcmd_path', '')
+        steamcmd_exe = self.steamcmd_exe()
+        
+        if not os.path.exists(steamcmd_exe):
+            raise FileNotFoundError(f"SteamCMD不存在: {steamcmd_exe}")
+            
+        state = self.load_update_state()
+        if self.config.get('blue_green'):
+            self.update_install_slot(steamcmd_exe, state, progress)
+            return
+        with progress.span("检查版本") as op:
+            mode = self.choose_update_mode(steamcmd_exe, state)
+            op.set(mode=mode)
+        if mode == "skip":
+            self.log_message("专用服务器已是最新版本，跳过SteamCMD更新", "SUCCESS")
+            return
+            
+        previous = self.read_app_manifest(steamcmd_path)
+        if not self.run_app_update(steamcmd_exe, mode, progress):
+            return
+        manifest = self.read_app_manifest(steamcmd_path)
+        if manifest:
+            state["buildid"] = manifest.get("buildid")
+        # 读不到版本时无法确认没有变化，按已更新处理
+        self.server_updated = not (previous and manifest and previous.get("buildid") == manifest.get("buildid"))
+        if mode == "validate":
+            state["last_validate"] = time.time()
+        self.save_update_state(state)
+        
+    def update_install_slot(self, steamcmd_exe, state, progress):
+        """蓝绿安装：下次启动使用的安装不是最新时，更新另一个没有分片在运行的安装
+        
+        更新成功后把它设为下次启动使用的安装，运行中的分片不受影响，重启服务器时
+        才切换过去；更新失败时继续使用原来的安装。各安装的buildid和完整校验时间
+        分别记录在更新状态的installs中
+        """
+        installs = state.setdefault("installs", {})
+        current = state.get("current_install", INSTALL_SLOTS[0])
+        self.install_slot = current
+        with progress.span("检查版本", slot=current) as op:
+            mode = self.choose_update_mode(steamcmd_exe, installs.get(current, {}), self.install_slot_path(current))
+            op.set(mode=mode)
+        if mode == "skip":
+            self.log_message(f"安装 {current} 已是最新版本，跳过SteamCMD更新", "SUCCESS")
+            return
+            
+        # 分片运行所用的安装（上次启动时记录）保持不动；没有启动过时直接更新current
+        active = state.get("active_install")
+        target = current
+        if active == current:
+            target = next(slot for slot in INSTALL_SLOTS if slot != active)
+            with progress.span("检查版本", slot=target) as op:
+                mode = self.choose_update_mode(steamcmd_exe, installs.get(target, {}), self.install_slot_path(target))
+                op.set(mode=mode)
+        install_path = self.install_slot_path(target)
+        if mode != "skip":
+            os.makedirs(install_path, exist_ok=True)
+            self.log_message(f"正在更新未运行的安装 {target}: {install_path}")
+            if not self.run_app_update(steamcmd_exe, mode, progress, install_path):
+                self.log_message(f"继续使用安装 {current}", "WARNING")
+                return
+            slot_state = installs.setdefault(target, {})
+            manifest = self.read_app_manifest(install_path)
+            if manifest:
+                slot_state["buildid"] = manifest.get("buildid")
+            if mode == "validate":
+                slot_state["last_validate"] = time.time()
+            # 分片不在该安装上运行时由install_switched()判断为切换并全部重启
+            self.server_updated = True
+        state["current_install"] = target
+        self.install_slot = target
+        self.save_update_state(state)
+        if active and target != active:
+            self.log_message(f"下次启动服务器时切换到安装 {target}（当前运行: {active}）", "SUCCESS")
+            
+    def run_app_update(self, steamcmd_exe, mode, progress, install_path=None):
+        """执行app_update（install_path不为None时安装到该目录），返回是否成功"""
+        cmd = [steamcmd_exe]
+        if install_path is not None:
+            # force_install_dir必须在登录之前指定
+            cmd += ["+force_install_dir", os.path.abspath(install_path)]
+        cmd += ["+login", "anonymous", "+app_update", DST_SERVER_APP_ID]
+        if mode == "validate":
+            cmd.append("validate")
+        cmd.append("+quit")
+        self.log_message(f"执行命令: {' '.join(cmd)}")
+        
+        with progress.span("app_update", mode=mode) as op:
+            returncode = self.run_steamcmd(cmd, progress)
+            op.set(returncode=returncode)
+        if returncode is None:
+            return False
+            
+        # 检查返回码
+        if returncode != 0:
+            self.log_message(f"SteamCMD返回非零退出码: {returncode}", "WARNING")
+            # 不抛出异常，继续执行，因为有些警告不影响使用
+            return False
+            
+        self.log_message("SteamCMD更新成功完成", "SUCCESS")
+        return True
+        
+    def choose_update_mode(self, steamcmd_exe, state, install_path=None):
+        """根据更新策略和已安装版本选择 skip / update / validate
+        
+        install_path为蓝绿安装中的某个安装（其steamapps中有独立的appmanifest），
+        state为该安装的更新状态
+        """
+        policy = self.config.get('update_policy', 'auto')
+        if policy in ("skip", "update", "validate"):
+            self.log_message(f"更新策略: {policy}")
+            return policy
+            
+        manifest = self.read_app_manifest(install_path or self.config.get('steamcmd_path', ''))
+        if not manifest or manifest.get("StateFlags") != "4":
+            self.log_message("专用服务器未完整安装，执行完整校验")
+            return "validate"
+            
+        interval = float(self.config.get('validate_interval_days', 7)) * 86400
+        if time.time() - state.get("last_validate", 0) > interval:
+            self.log_message("距离上次完整校验已超过设定天数，执行完整校验")
+            return "validate"
+            
+        installed = manifest.get("buildid")
+        # 蓝绿安装时两个安装都要比较，同一次部署只查询一次
+        latest = self.latest_buildid or self.query_latest_buildid(steamcmd_exe)
+        self.latest_buildid = latest
+        if latest is None:
+            self.log_message("无法获取最新版本号，执行普通更新", "WARNING")
+            return "update"
+        self.log_message(f"已安装版本: {installed}，最新版本: {latest}")
+        return "skip" if installed == latest else "update"
+        
+    def query_latest_buildid(self, steamcmd_exe):
+        """通过app_info_print查询公开分支的最新buildid，失败返回None"""
+        cmd = [steamcmd_exe, "+login", "anonymous", "+app_info_update", "1",
+               "+app_info_print", DST_SERVER_APP_ID, "+quit"]
+        output = []
+        
+        def _collect(line):
+            output.append(line)
+            return True
+            
+        returncode = self.run_steamcmd(cmd, on_line=_collect)
+        if returncode is None:
+            return None
+        match = re.search(r'"branches"\s*\{\s*"public"\s*\{[^}]*?"buildid"\s+"(\d+)"',
+                          "\n".join(output), re.S)
+        return match.group(1) if match else None
+        
+    def read_app_manifest(self, steamcmd_path):
+        """读取steamapps/appmanifest_343050.acf，返回AppState字典，不存在时返回None
+        
+        使用force_install_dir时清单位于安装目录的steamapps中，steamcmd_path传安装目录
+        """
+        manifest_path = os.path.join(steamcmd_path, "steamapps", f"appmanifest_{DST_SERVER_APP_ID}.acf")
+        try:
+            with open(manifest_path, 'r', encoding='utf-8', errors='ignore') as f:
+                data = parse_vdf(f.read())
+        except (OSError, ValueError):
+            return None
+        return data.get("AppState")
+        
+    def load_stage_cache(self):
+        """加载本集群上次成功部署时各步骤的缓存键"""
+        try:
+            with open(STAGE_CACHE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f).get(self.cluster_name, {})
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return {}
+            
+    def save_stage_cache(self, cache):
+        """保存本集群各步骤的缓存键（多个集群共用一个缓存文件）"""
+        try:
+            with open(STAGE_CACHE_PATH, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {}
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        data[self.cluster_name] = cache
+        try:
+            with open(STAGE_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.log_message(f"保存步骤缓存失败: {str(e)}", "WARNING")
+            
+    def load_update_state(self):
+        """加载SteamCMD更新状态缓存（上次的buildid和完整校验时间）"""
+        try:
+            with open(UPDATE_STATE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+            
+    def save_update_state(self, state):
+        """保存SteamCMD更新状态缓存"""
+        try:
+            with open(UPDATE_STATE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.log_message(f"保存更新状态失败: {str(e)}", "WARNING")
+        
+    def run_steamcmd(self, cmd, progress=None, on_line=None):
+        """运行SteamCMD并逐行处理输出，返回退出码，无法启动时返回None
+        
+        进度行换算为0~1后传给progress；on_line返回True的行不再写入日志
+        """
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                errors='ignore',  # 忽略编码错误
+                bufsize=1
+            )
+        except Exception as e:
+            self.log_message(f"执行SteamCMD时发生错误: {str(e)}", "ERROR")
+            # 不抛出异常，继续执行
+            return None
+            
+        # 读取线程把输出逐行放入队列，当前线程轮询队列以便及时响应取消
+        lines = queue.Queue()
+        
+        def _reader():
+            for output_line in process.stdout:
+                lines.put(output_line)
+            lines.put(None)
+            
+        threading.Thread(target=_reader, daemon=True).start()
+        
+        tracker = SteamCMDProgress()
+        last_report = 0
+        while True:
+            if self.cancel_event.is_set():
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                self.log_message("已取消SteamCMD更新", "WARNING")
+                raise DeploymentCancelled("用户取消了配置")
+                
+            try:
+                line = lines.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if line is None:
+                break
+            line = line.rstrip()
+            if on_line is not None and on_line(line):
+                continue
+            line = line.strip()
+            if not line:
+                continue
+                
+            if tracker.feed(line):
+                if progress is not None:
+                    progress(tracker.fraction())
+                # 进度行较多，同一阶段每2秒最多输出一次
+                now = time.monotonic()
+                if tracker.state_changed or now - last_report >= 2:
+                    last_report = now
+                    self.log_message(tracker.describe())
+            else:
+                self.log_message(f"输出: {line}")
+                
+        # SteamCMD报告的最后一个阶段的总字节数（下载或校验的数据量）计入步骤统计
+        if progress is not None and tracker.total:
+            as_progress(progress).add(bytes=tracker.total)
+        return process.wait()
+            
+    def start_servers(self):
+        """启动服务器"""
+        server_exe = self.server_exe()
+        server_path = os.path.dirname(server_exe)
+        
+        if not os.path.exists(server_path):
+            raise FileNotFoundError(f"服务器路径不存在: {server_path}")
+            
+        # 检查可执行文件是否存在
+        if not os.path.exists(server_exe):
+            raise FileNotFoundError(f"服务器可执行文件不存在: {server_exe}")
+            
+        # 每个分片一个进程：集群目录中包含server.ini的子目录，默认为Master和Caves
+        shards = []
+        affinity = {}
+        for shard in discover_shards(os.path.join(self.klei_path(), self.cluster_name)):
+            cmd = [
+                server_exe,
+                "-console", "-cluster", self.cluster_name, "-shard", shard
+            ]
+            shards.append((shard, cmd))
+            if self.cpu_allocator is not None:
+                affinity[shard] = self.cpu_allocator.allocate()
+                
+        self.log_message(f"切换到目录: {server_path}")
+        for shard, cmd in shards:
+            self.log_message(f"启动{shard}服务器...")
+            self.log_message(f"{shard}命令: {' '.join(cmd)}")
+        
+        # 分片进程交给管理器：自动重启、PID锁文件防止重复启动
+        supervisor = ShardSupervisor(
+            shards,
+            cwd=server_path,
+            lock_path=self.shard_lock_path(),
+            log=self.log_message,
+            restart=self.config.get('auto_restart', True),
+            max_restarts=self.config.get('max_restarts', 5),
+            affinity=affinity,
+            cluster_path=os.path.join(self.klei_path(), self.cluster_name))
+        try:
+            supervisor.start()
+        except OSError as e:
+            self.log_message(f"启动服务器时出错: {str(e)}", "ERROR")
+            # 不抛出异常，继续执行
+            return
+        self.supervisor = supervisor
+        self.log_message("服务器启动命令已执行", "SUCCESS")
+        if self.config.get('blue_green'):
+            # 记录分片运行所用的安装，之后的更新不会动它；分片全部停止后清除记录
+            slot = self.current_install_slot()
+            state = self.load_update_state()
+            state["active_install"] = slot
+            self.save_update_state(state)
+            supervisor.stop_callbacks.append(lambda: self.release_install_slot(slot))
+            self.log_message(f"服务器从安装 {slot} 启动: {self.server_install_path()}")
+        if self.config.get('tail_logs', True):
+            self.start_log_tailer([shard for shard, _ in shards])
+        if self.config.get('watch_ready', True):
+            self.start_readiness([shard for shard, _ in shards])
+            
+    def release_install_slot(self, slot):
+        """蓝绿安装：从slot启动的分片已全部停止，清除运行记录，之后的更新可以使用该安装"""
+        state = self.load_update_state()
+        if state.get("active_install") == slot:
+            del state["active_install"]
+            self.save_update_state(state)
+            
+    def shard_lock_path(self):
+        """记录该集群分片PID的锁文件路径"""
+        return os.path.join(self.klei_path(), f".dst_shards_{self.cluster_name}.json")
+        
+    def log_index_path(self):
+        """分片日志事件索引的数据库路径"""
+        return os.path.join(self.klei_path(), f".dst_logs_{self.cluster_name}.sqlite")
+        
+    def start_log_tailer(self, shards):
+        """在后台跟踪各分片的server_log.txt，把重要事件写入索引并转发到部署日志"""
+        cluster_path = os.path.join(self.klei_path(), self.cluster_name)
+        files = {shard: os.path.join(cluster_path, shard, "server_log.txt") for shard in shards}
+        
+        def on_log_event(shard, kind, log_time, message):
+            self.emit({"type": "shard_log", "cluster": self.cluster_name, "shard": shard,
+                       "kind": kind, "log_time": log_time, "message": message})
+            self.log_message(f"[{shard}] {LOG_EVENT_NAMES[kind]}: {message}", LOG_EVENT_LEVELS[kind])
+            
+        try:
+            index = LogIndex(self.log_index_path())
+        except sqlite3.Error as e:
+            self.log_message(f"无法打开日志索引，不跟踪服务器日志: {str(e)}", "WARNING")
+            return
+        tailer = LogTailer(files, index, cluster=self.cluster_name, on_event=on_log_event,
+                           poll_interval=self.config.get('log_poll_interval', 1.0))
+        tailer.start()
+        self.supervisor.stop_callbacks.extend([tailer.stop, index.close])
+        mode = "inotify" if tailer.inotify is not None else "轮询"
+        self.log_message(f"正在跟踪服务器日志（{mode}），事件索引: {self.log_index_path()}")
+        
+    def ready_history_path(self):
+        """各次启动的分片就绪耗时历史"""
+        return os.path.join(self.klei_path(), f".dst_ready_{self.cluster_name}.json")
+        
+    def start_readiness(self, shards):
+        """在后台跟踪各分片的启动日志，报告每个分片的就绪耗时和卡住的分片
+        
+        全部分片都就绪后把这次的耗时追加到历史，明显慢于历史中位数时给出警告
+        """
+        results = {}
+        
+        def on_ready(shard, phases):
+            self.emit({"type": "shard_ready", "cluster": self.cluster_name, "shard": shard, "phases": phases})
+            detail = format_phases(phases)
+            self.log_message(f"{shard}服务器已就绪，用时 {phases['total']:.1f} 秒"
+                             + (f"（{detail}）" if detail else ""), "SUCCESS")
+            results[shard] = phases
+            if len(results) < len(shards):
+                return
+            entry = {"time": time.time(), "shards": dict(results), "mods": self.enabled_mod_count()}
+            results.clear()
+            try:
+                history = append_ready_history(self.ready_history_path(), entry)
+            except OSError as e:
+                self.log_message(f"无法保存就绪耗时历史: {str(e)}", "WARNING")
+                return
+            for name, total, median in find_regressions(history, entry["shards"]):
+                self.log_message(f"{name}服务器就绪用时 {total:.1f} 秒，明显慢于以往的 {median:.1f} 秒"
+                                 f"（中位数），可能是新增或更新的模组拖慢了启动", "WARNING")
+                
+        def on_stall(shard, phase, idle):
+            self.emit({"type": "shard_stalled", "cluster": self.cluster_name, "shard": shard,
+                       "phase": phase, "idle": idle})
+            self.log_message(f"{shard}服务器在{READY_PHASE_NAMES[phase]}阶段已 {idle:.0f} 秒没有新的日志输出，"
+                             f"可能卡住了", "WARNING")
+            
+        monitor = ReadinessMonitor(os.path.join(self.klei_path(), self.cluster_name), shards,
+                                   on_ready=on_ready, on_stall=on_stall,
+                                   stall_timeout=self.config.get('stall_timeout', STALL_TIMEOUT))
+        monitor.start()
+        self.readiness = monitor
+        # 分片重启后重新计时；滚动重启等到新进程就绪后再重启下一个分片，新进程卡住时中止
+        self.supervisor.spawn_callbacks.append(monitor.watch)
+        self.supervisor.ready_check = monitor.is_ready
+        self.supervisor.stall_check = monitor.is_stalled
+        self.supervisor.stop_callbacks.append(monitor.stop)
+        
+    def enabled_mod_count(self):
+        """启用的模组数量，无法判断时为None（记录在就绪耗时历史中便于对比）"""
+        mods = self.enabled_mods()
+        return len(mods) if mods is not None else None
+
+
+def cluster_configs(config):
+    """展开多集群配置：clusters列表中的每一项覆盖顶层配置，没有clusters时只有一个集群"""
+    clusters = config.get('clusters')
+    if not clusters:
+        return [dict(config)]
+    base = {k: v for k, v in config.items() if k != 'clusters'}
+    return [dict(base, **cluster) for cluster in clusters]
+
+
+def deploy_clusters(config, on_event=None, cancel_event=None, pipelines=None, running=None):
+    """依次部署配置中的全部集群，返回各集群的DeployPipeline
+    
+    多个集群共用一个专用服务器安装：SteamCMD只在第一个集群时更新；端口在所有
+    集群之间统一分配，pin_cpus开启时（多集群默认开启）每个分片固定到不同的核心。
+    传入pipelines列表时，每个集群开始部署前就加入列表，后面的集群失败时调用方
+    仍能拿到前面已启动集群的分片管理器。running为 {集群名: 上次部署启动的分片管理器}，
+    这些集群切换前会先存档并关闭，集群未变化时滚动重启
+    """
+    configs = cluster_configs(config)
+    multi = len(configs) > 1
+    names = [c.get('cluster_name') or CLUSTER_NAME for c in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"集群名称重复: {', '.join(names)}")
+        
+    port_allocator = PortAllocator() if multi or config.get('allocate_ports') else None
+    cpu_allocator = (CpuAllocator(reserve=config.get('reserve_cpus', 0))
+                     if config.get('pin_cpus', multi) else None)
+    
+    if multi:
+        # 全部集群共用一个mods目录，复制所有集群启用的模组的并集
+        union = set()
+        for cluster_config in configs:
+            mods, _, _ = collect_enabled_mods(cluster_config.get('world_folder'), cluster_config.get('config_file'))
+            if mods is None:
+                union = None
+                break
+            union |= mods
+        for cluster_config in configs:
+            cluster_config['cluster_enabled_mods'] = sorted(union) if union is not None else None
+            
+    pipelines = [] if pipelines is None else pipelines
+    for index, cluster_config in enumerate(configs):
+        if index > 0:
+            cluster_config['update_policy'] = 'skip'
+        trace_path = cluster_config.get('trace_path')
+        if multi and trace_path and "{cluster}" not in trace_path:
+            # 每个集群各导出一个时间线文件
+            root, ext = os.path.splitext(trace_path)
+            cluster_config['trace_path'] = f"{root}_{{cluster}}{ext or '.json'}"
+        pipeline = DeployPipeline(cluster_config, on_event=on_event, cancel_event=cancel_event,
+                                  port_allocator=port_allocator, cpu_allocator=cpu_allocator,
+                                  running_supervisor=(running or {}).get(names[index]))
+        pipelines.append(pipeline)
+        pipeline.run()
+    return pipelines
+
+
+def load_config_file(path):
+    """读取.dst_server_config.json格式的配置文件，不存在时返回空配置"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"配置文件格式错误: {path}")
+    return config
+
+
+def validate_config(config):
+    """检查必填项，返回错误信息列表"""
+    errors = []
+    if not config.get('config_file'):
+        errors.append("请选择配置文件！")
+    if not config.get('steamcmd_path'):
+        errors.append("请选择SteamCMD安装位置！")
+    if config.get('steam_mod', True) and not config.get('steam_path'):
+        errors.append("请选择Steam安装位置！")
+    if not config.get('world_folder'):
+        errors.append("请选择世界文件夹！")
+    return errors
+
+
+def build_arg_parser():
+    """命令行参数，未指定的项从配置文件读取"""
+    parser = argparse.ArgumentParser(description="饥荒联机版专用服务器部署工具（无界面模式）")
+    parser.add_argument("--config", default=CONFIG_FILE_PATH, help="配置文件路径（默认与图形界面共用）")
+    parser.add_argument("--config-file", help="服务器配置文件压缩包")
+    parser.add_argument("--steamcmd-path", help="SteamCMD安装目录")
+    parser.add_argument("--steam-path", help="Steam安装目录（用于复制模组）")
+    parser.add_argument("--world-folder", help="世界文件夹")
+    parser.add_argument("--klei-path", help="Klei存档根目录")
+    parser.add_argument("--update-policy", choices=("auto", "update", "validate", "skip"),
+                        help="SteamCMD更新策略")
+    parser.add_argument("--no-mods", action="store_true", help="不复制模组")
+    parser.add_argument("--no-start", action="store_true", help="部署完成后不启动服务器")
+    parser.add_argument("--json", action="store_true", help="以JSON行格式输出事件")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="把各步骤的耗时、文件数和字节数导出为Chrome trace JSON（{cluster}替换为集群名）")
+    parser.add_argument("--supervise", action="store_true",
+                        help="启动服务器后保持运行，自动重启崩溃的分片并定时输出CPU/内存，Ctrl+C停止服务器")
+    parser.add_argument("--stats-interval", type=float, default=10, help="--supervise模式下输出状态的间隔秒数")
+    parser.add_argument("--search-logs", nargs="?", const="", metavar="TEXT",
+                        help="查询已索引的服务器日志事件（可指定关键字）后退出，不执行部署")
+    parser.add_argument("--log-kind", choices=sorted(LOG_EVENT_NAMES), help="--search-logs只显示该类型的事件")
+    parser.add_argument("--limit", type=int, default=100, help="--search-logs最多显示的事件数")
+    parser.add_argument("--list-backups", action="store_true", help="列出各集群的备份后退出，不执行部署")
+    parser.add_argument("--restore-backup", nargs="?", const="", metavar="ID",
+                        help="把指定备份（默认为最新的备份）还原为正式集群后退出，请先关闭服务器")
+    parser.add_argument("--no-backup", action="store_true", help="部署时不备份当前集群")
+    parser.add_argument("--force", action="store_true", help="忽略步骤缓存，重新执行全部步骤")
+    parser.add_argument("--prefetch-update", action="store_true",
+                        help="蓝绿安装（blue_green）时只更新未运行的安装后退出，服务器继续运行，下次部署时切换")
+    parser.add_argument("--wait-ready", action="store_true",
+                        help="启动服务器后等待各分片就绪（加载完模组和世界并连上主分片），未能就绪时返回1")
+    return parser
+
+
+def main(argv=None):
+    """命令行入口，返回退出码：0成功，1失败，2参数错误，130已取消"""
+    args = build_arg_parser().parse_args(argv)
+    try:
+        config = load_config_file(args.config)
+    except (OSError, ValueError) as e:
+        print(f"读取配置文件失败: {e}", file=sys.stderr)
+        return 2
+        
+    overrides = {
+        'config_file': args.config_file,
+        'steamcmd_path': args.steamcmd_path,
+        'steam_path': args.steam_path,
+        'world_folder': args.world_folder,
+        'klei_path': args.klei_path,
+        'update_policy': args.update_policy,
+        'trace_path': args.trace,
+    }
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    config.setdefault('steam_mod', True)
+    if args.no_mods:
+        config['steam_mod'] = False
+    if args.no_start:
+        config['start_servers'] = False
+    if args.no_backup:
+        config['backup'] = False
+    if args.force:
+        config['stage_cache'] = False
+    if args.wait_ready:
+        config['wait_ready'] = True
+        
+    if args.search_logs is not None:
+        return search_logs(config, args)
+    if args.list_backups:
+        return list_backups(config, args)
+        
+    file_logger = create_file_logger()
+    
+    def on_event(event):
+        if event["type"] == "log":
+            file_logger.log(LOG_FILE_LEVELS.get(event["level"], logging.INFO),
+                            f"[{event['level']}] {event['message']}")
+        if args.json:
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+        elif event["type"] == "log":
+            timestamp = time.strftime("%H:%M:%S", time.localtime(event["time"]))
+            print(f"[{timestamp}] [{event['level']}] {event['message']}", flush=True)
+            
+    def log(message, level="INFO"):
+        on_event({"type": "log", "level": level, "message": message, "time": time.time()})
+        
+    if args.restore_backup is not None:
+        return restore_backups(config, args.restore_backup or None, on_event, log)
+    if args.prefetch_update:
+        return prefetch_update(config, on_event, log)
+        
+    errors = [f"{c.get('cluster_name') or CLUSTER_NAME}: {e}" if config.get('clusters') else e
+              for c in cluster_configs(config) for e in validate_config(c)]
+    if errors:
+        for error in errors:
+            print(error, file=sys.stderr)
+        return 2
+        
+    # 部署前检查路径、压缩包和磁盘空间，有问题时不开始部署
+    from dst_preflight import PreflightChecker
+    report = PreflightChecker().check(config)
+    for warning in report.warnings:
+        log(warning, "WARNING")
+    if not report.ok:
+        for error in report.errors:
+            log(error, "ERROR")
+        return 2
+    log(report.summary())
+        
+    cancel_event = threading.Event()
+    pipelines = []
+    result = {}
+    
+    def _run():
+        try:
+            deploy_clusters(config, on_event=on_event, cancel_event=cancel_event, pipelines=pipelines)
+            result["code"] = 0
+        except DeploymentCancelled:
+            log("配置已取消", "WARNING")
+            result["code"] = 130
+        except Exception as e:
+            log(f"配置过程中出现错误: {str(e)}", "ERROR")
+            result["code"] = 1
+            
+    # 部署在工作线程中运行，主线程响应Ctrl+C并通过取消标志结束部署
+    worker = threading.Thread(target=_run, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(0.2)
+        except KeyboardInterrupt:
+            cancel_event.set()
+    code = result.get("code", 1)
+    supervisors = [(p.cluster_name, p.supervisor) for p in pipelines if p.supervisor is not None]
+    if code == 0 and args.supervise and supervisors:
+        supervise(supervisors, on_event, log, args)
+    return code
+
+
+def search_logs(config, args):
+    """输出各集群日志索引中匹配的事件"""
+    for cluster_config in cluster_configs(config):
+        index_path = DeployPipeline(cluster_config).log_index_path()
+        if not os.path.exists(index_path):
+            continue
+        index = LogIndex(index_path)
+        try:
+            events = index.search(text=args.search_logs, kind=args.log_kind, limit=args.limit)
+        finally:
+            index.close()
+        for event in events:
+            if args.json:
+                print(json.dumps(event, ensure_ascii=False))
+            else:
+                print(f"{event['cluster']}/{event['shard']} [{event['log_time']}] "
+                      f"{LOG_EVENT_NAMES.get(event['kind'], event['kind'])}: {event['message']}")
+    return 0
+
+
+def list_backups(config, args):
+    """输出各集群的备份，从新到旧"""
+    for cluster_config in cluster_configs(config):
+        pipeline = DeployPipeline(cluster_config)
+        if not os.path.isdir(pipeline.backup_path()):
+            continue
+        for manifest in pipeline.open_backup_store().list_snapshots(pipeline.cluster_name):
+            if args.json:
+                print(json.dumps(manifest, ensure_ascii=False))
+            else:
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created"]))
+                print(f"{manifest['cluster']} {manifest['id']}  {created}  "
+                      f"{manifest['file_count']} 个文件  {format_size(manifest['size'])}")
+    return 0
+
+
+def restore_backups(config, snapshot_id, on_event, log):
+    """还原各集群的备份；指定snapshot_id时只还原包含该备份的集群"""
+    restored = 0
+    for cluster_config in cluster_configs(config):
+        pipeline = DeployPipeline(cluster_config, on_event=on_event)
+        if snapshot_id and not any(m["id"] == snapshot_id for m in
+                                   pipeline.open_backup_store().list_snapshots(pipeline.cluster_name)):
+            continue
+        try:
+            pipeline.restore_backup(snapshot_id)
+        except (OSError, RuntimeError) as e:
+            log(f"[{pipeline.cluster_name}] 还原备份失败: {str(e)}", "ERROR")
+            return 1
+        restored += 1
+    if not restored:
+        log(f"找不到备份: {snapshot_id}", "ERROR")
+        return 1
+    return 0
+
+
+def prefetch_update(config, on_event, log):
+    """蓝绿安装：只在后台更新未运行的安装，不部署也不重启服务器，下次部署时切换过去"""
+    if not config.get('blue_green'):
+        log("预取更新需要开启blue_green（两个安装目录轮流使用）", "ERROR")
+        return 2
+    # 多个集群共用一个专用服务器安装，按第一个集群的配置更新
+    pipeline = DeployPipeline(cluster_configs(config)[0], on_event=on_event)
+    try:
+        pipeline.update_steamcmd()
+    except (OSError, DeploymentCancelled) as e:
+        log(f"预取更新失败: {str(e)}", "ERROR")
+        return 1
+    log(f"下次启动使用安装 {pipeline.current_install_slot()}: {pipeline.server_install_path()}")
+    return 0
+
+
+def supervise(supervisors, on_event, log, args):
+    """在前台管理各集群的分片进程，直到分片全部停止或收到Ctrl+C"""
+    try:
+        while any(supervisor.is_running() for _, supervisor in supervisors):
+            time.sleep(args.stats_interval)
+            for name, supervisor in supervisors:
+                stats = supervisor.snapshot()
+                if args.json:
+                    on_event({"type": "shards", "cluster": name, "shards": stats})
+                else:
+                    log(f"[{name}] {format_shard_stats(stats)}")
+    except KeyboardInterrupt:
+        log("正在停止服务器...", "WARNING")
+    for _, supervisor in supervisors:
+        supervisor.stop()
+    log("服务器已停止", "SUCCESS")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
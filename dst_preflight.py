@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+部署前检查（不依赖tkinter）
+
+在真正开始部署之前检查各个路径和文件：SteamCMD和专用服务器可执行文件、配置文件
+压缩包是否完整、世界文件夹和Workshop目录是否存在，并按需要写入的字节数估算
+各磁盘的剩余空间是否足够。检查结果按路径缓存（文件按大小和修改时间，目录另外
+限定有效期），界面上输入变化时可以在后台线程中反复调用，没有变化的部分不再重新检查。
+"""
+
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+import zipfile
+
+from dst_pipeline import DeployPipeline, cluster_configs, directory_size, format_size, validate_config
+
+# 目录大小的缓存有效期（秒）：目录本身的修改时间不反映子目录中文件的变化
+PREFLIGHT_DIR_TTL = 30
+# 部署后剩余空间低于该值时给出警告
+PREFLIGHT_FREE_MARGIN = 512 * 1024 * 1024
+
+
+class PreflightReport:
+    """一次检查的结果：errors中任意一项都会导致部署失败，warnings仅提示"""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.disks = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def summary(self):
+        """一行文字概括检查结果"""
+        if self.errors:
+            return f"❌ 预检未通过: {self.errors[0]}" + (f"（共 {len(self.errors)} 项）" if len(self.errors) > 1 else "")
+        space = "；".join(f"{path} 需要 {format_size(required)}，可用 {format_size(free)}"
+                         for path, required, free in self.disks)
+        text = "✅ 预检通过" + (f"，{len(self.warnings)} 项警告" if self.warnings else "")
+        return f"{text}（{space}）" if space else text
+
+
+class PreflightChecker:
+    """部署前检查，结果按路径缓存，可以在多个线程中使用"""
+
+    def __init__(self):
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def cached(self, kind, path, compute):
+        """按 (检查类型, 路径) 缓存compute(path)的结果，路径的大小或修改时间变化后重新计算"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        signature = (st.st_size, st.st_mtime_ns) if st else None
+        key = (kind, os.path.abspath(path))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.cache.get(key)
+        if entry and entry[0] == signature:
+            if st is None or not stat.S_ISDIR(st.st_mode) or now - entry[1] < PREFLIGHT_DIR_TTL:
+                return entry[2]
+        value = compute(path)
+        with self.lock:
+            self.cache[key] = (signature, now, value)
+        return value
+
+    def check(self, config):
+        """检查配置中的全部集群，返回PreflightReport"""
+        start = time.perf_counter()
+        report = PreflightReport()
+        configs = cluster_configs(config)
+        required = {}
+        for cluster_config in configs:
+            prefix = f"{cluster_config.get('cluster_name')}: " if len(configs) > 1 else ""
+            errors = [prefix + e for e in validate_config(cluster_config)]
+            if errors:
+                report.errors.extend(errors)
+                continue
+            self.check_cluster(DeployPipeline(cluster_config), prefix, report, required)
+        self.check_space(required, report)
+        report.elapsed = time.perf_counter() - start
+        return report
+
+    def check_cluster(self, pipeline, prefix, report, required):
+        """检查一个集群，把各目录需要写入的字节数累加到required"""
+        config = pipeline.config
+
+        def error(message):
+            report.errors.append(prefix + message)
+
+        def warning(message):
+            report.warnings.append(prefix + message)
+
+        steamcmd_exe = pipeline.steamcmd_exe()
+        if not os.path.isfile(steamcmd_exe):
+            error(f"SteamCMD不存在: {steamcmd_exe}")
+        elif sys.platform != "win32" and not os.access(steamcmd_exe, os.X_OK):
+            error(f"SteamCMD没有执行权限: {steamcmd_exe}")
+        if (config.get('update_policy') == 'skip' and config.get('start_servers', True)
+                and not os.path.isfile(pipeline.server_exe())):
+            error(f"专用服务器未安装且更新策略为skip: {pipeline.server_exe()}")
+
+        zip_info = None
+        config_file = config.get('config_file', '')
+        if not os.path.isfile(config_file):
+            error(f"配置文件不存在: {config_file}")
+        else:
+            zip_info = self.cached("zip", config_file, inspect_zip)
+            if zip_info["error"]:
+                error(f"配置文件压缩包损坏: {zip_info['error']}")
+                zip_info = None
+            else:
+                required[pipeline.klei_path()] = required.get(pipeline.klei_path(), 0) + zip_info["size"]
+
+        world_folder = config.get('world_folder', '')
+        if not os.path.isdir(world_folder):
+            error(f"世界文件夹不存在: {world_folder}")
+        else:
+            # 压缩包和世界文件夹合并后必须有cluster.ini和Master，否则切换集群前的检查会失败
+            has_ini = os.path.isfile(os.path.join(world_folder, "cluster.ini")) or bool(zip_info and zip_info["cluster_ini"])
+            has_master = os.path.isdir(os.path.join(world_folder, "Master")) or bool(zip_info and zip_info["master"])
+            if zip_info is not None and not has_ini:
+                error("配置文件和世界文件夹中都没有cluster.ini")
+            if zip_info is not None and not has_master:
+                error("配置文件和世界文件夹中都没有Master文件夹")
+            world_size = self.cached("size", world_folder, directory_size)
+            live_path = os.path.join(pipeline.klei_path(), pipeline.cluster_name)
+            if config.get('backup', True) and os.path.isdir(live_path):
+                # 备份按块去重压缩，这里按未压缩大小估算上限
+                world_size += self.cached("size", live_path, directory_size)
+            required[pipeline.klei_path()] = required.get(pipeline.klei_path(), 0) + world_size
+
+        if config.get('steam_mod', True):
+            workshop_path = pipeline.workshop_path()
+            if not os.path.isdir(workshop_path):
+                warning(f"Steam Workshop路径不存在，将不会复制模组: {workshop_path}")
+            sources, missing = pipeline.select_mods()
+            for name in sorted(missing):
+                warning(f"modoverrides.lua中启用的模组 {name} 未找到")
+            # 已经复制过的模组只同步变化的文件，只计算目标中还没有的模组
+            mods_path = os.path.join(pipeline.server_install_path(), "mods")
+            mods_size = sum(self.cached("size", src, directory_size) for name, (src, _) in sources.items()
+                            if not os.path.isdir(os.path.join(mods_path, name)))
+            required[mods_path] = required.get(mods_path, 0) + mods_size
+
+    def check_space(self, required, report):
+        """按磁盘汇总需要写入的字节数，与剩余空间比较"""
+        disks = {}
+        for path, size in required.items():
+            existing = existing_parent(path)
+            if existing is None:
+                continue
+            device = os.stat(existing).st_dev
+            total, label = disks.get(device, (0, existing))
+            disks[device] = (total + size, label)
+        for total, label in disks.values():
+            free = shutil.disk_usage(label).free
+            report.disks.append((label, total, free))
+            if total > free:
+                report.errors.append(f"磁盘空间不足: {label} 需要 {format_size(total)}，"
+                                     f"仅剩 {format_size(free)}")
+            elif free - total < PREFLIGHT_FREE_MARGIN:
+                report.warnings.append(f"部署后 {label} 所在磁盘剩余空间不足 "
+                                       f"{format_size(PREFLIGHT_FREE_MARGIN)}")
+
+
+def inspect_zip(path):
+    """校验压缩包中全部文件的CRC，返回解压后大小以及是否包含cluster.ini和Master"""
+    info = {"error": None, "size": 0, "cluster_ini": False, "master": False}
+    try:
+        with zipfile.ZipFile(path, 'r') as zip_ref:
+            bad = zip_ref.testzip()
+            if bad is not None:
+                info["error"] = f"{bad} 校验失败"
+                return info
+            for entry in zip_ref.infolist():
+                parts = entry.filename.rstrip("/").split("/")
+                info["size"] += entry.file_size
+                info["cluster_ini"] = info["cluster_ini"] or parts[-1] == "cluster.ini"
+                info["master"] = info["master"] or "Master" in parts[:-1] or (entry.is_dir() and parts[-1] == "Master")
+    except (OSError, zipfile.BadZipFile, EOFError) as e:
+        info["error"] = str(e)
+    return info
+
+
+def existing_parent(path):
+    """path本身或最近的一个已存在的上级目录，用来确定path将位于哪个磁盘"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    return path
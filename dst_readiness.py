@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片就绪检测（不依赖tkinter）
+
+进程启动不代表分片可以进入：带模组的分片要先加载模组，再生成或加载世界，
+洞穴等次级分片还要连上主分片。这里跟踪各分片新写入的server_log.txt，按日志中的
+标志行记录每个阶段完成的时间，得到每个分片的就绪耗时及其分解（模组加载、世界
+加载、分片连接）；分片长时间没有新的日志输出仍未就绪时报告为卡住。
+"""
+
+import json
+import os
+import re
+import statistics
+import threading
+import time
+
+# 阶段完成的标志行（按阶段顺序）；时间以日志行开头的运行时长 [HH:MM:SS] 为准，
+# 读到该行的时间只用来补足不到一秒的部分
+READY_MARKERS = [
+    ("mods", re.compile(r"ModIndex: Load sequence finished|Loading mods? complete", re.IGNORECASE)),
+    ("world", re.compile(r"Begin Session:|Loaded world|World generated", re.IGNORECASE)),
+    ("listen", re.compile(r"Server Started on port|Online Server Started|Sim paused", re.IGNORECASE)),
+    ("link", re.compile(r"\[Shard\].*(?:connected|is now ready|LUA is now ready|Connection to master)",
+                        re.IGNORECASE)),
+]
+READY_PHASE_NAMES = {
+    "mods": "模组加载",
+    "world": "世界加载",
+    "listen": "开始监听",
+    "link": "分片连接",
+}
+READY_LOG_TIME = re.compile(r"^\[(\d+):(\d+):(\d+)\]")
+# 没有新的日志输出超过该时长（秒）仍未就绪的分片视为卡住
+STALL_TIMEOUT = 120.0
+# 就绪耗时历史保留的次数；比历史中位数慢该比例且至少慢若干秒时提示启动变慢
+READY_HISTORY_LIMIT = 50
+READY_REGRESSION_RATIO = 1.25
+READY_REGRESSION_MIN = 10.0
+
+
+class ShardReadiness:
+    """一个分片本次启动的就绪状态"""
+
+    def __init__(self, name, log_path, require_link):
+        self.name = name
+        self.log_path = log_path
+        self.require_link = require_link
+        self.reset()
+
+    def reset(self):
+        self.spawned = time.time()
+        self.offset = 0
+        self.inode = None
+        self.partial = b""
+        self.marks = {}
+        self.last_output = time.monotonic()
+        self.ready_at = None
+        self.stalled = False
+
+    @property
+    def ready(self):
+        if "world" not in self.marks:
+            return False
+        return not self.require_link or "link" in self.marks
+
+    def phases(self):
+        """各阶段耗时（秒）：模组加载、世界加载、分片连接，以及总的就绪耗时"""
+        result = {}
+        previous = 0.0
+        for phase in ("mods", "world", "link"):
+            if phase in self.marks:
+                result[phase] = max(0.0, self.marks[phase] - previous)
+                previous = self.marks[phase]
+        result["total"] = self.ready_at if self.ready_at is not None else previous
+        return result
+
+
+class ReadinessMonitor:
+    """在后台线程中跟踪各分片的启动日志，报告就绪耗时和卡住的分片
+
+    on_ready(分片名, 各阶段耗时)在分片就绪时调用，on_stall(分片名, 当前阶段, 无输出秒数)
+    在分片卡住时调用（恢复输出后再次卡住会再次调用）。
+    """
+
+    def __init__(self, cluster_path, shards, on_ready=None, on_stall=None,
+                 stall_timeout=STALL_TIMEOUT, poll_interval=0.5):
+        require_link = len(shards) > 1
+        self.shards = {name: ShardReadiness(name, os.path.join(cluster_path, name, "server_log.txt"), require_link)
+                       for name in shards}
+        self.on_ready = on_ready
+        self.on_stall = on_stall
+        self.stall_timeout = stall_timeout
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def watch(self, name):
+        """分片（重新）启动时调用，从新的日志开始重新计时"""
+        with self.lock:
+            if name in self.shards:
+                self.shards[name].reset()
+                self.changed.notify_all()
+
+    def is_ready(self, name):
+        with self.lock:
+            return self.shards[name].ready
+
+    def is_stalled(self, name):
+        with self.lock:
+            return self.shards[name].stalled
+
+    def wait(self, timeout=None):
+        """等待全部分片就绪或卡住，返回是否全部就绪"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while not all(s.ready or s.stalled for s in self.shards.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if (remaining is not None and remaining <= 0) or self.stopping.is_set():
+                    break
+                self.changed.wait(remaining if remaining is not None else 1.0)
+            return all(s.ready for s in self.shards.values())
+
+    def run(self):
+        while not self.stopping.wait(self.poll_interval):
+            for shard in list(self.shards.values()):
+                try:
+                    self.poll(shard)
+                except OSError:
+                    pass
+
+    def poll(self, shard):
+        """读取分片日志新增的完整行，记录阶段标志，检查是否卡住"""
+        with self.lock:
+            if shard.ready:
+                return
+            spawned, offset, inode = shard.spawned, shard.offset, shard.inode
+        lines = []
+        if os.path.exists(shard.log_path):
+            with open(shard.log_path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                # 启动前留下的旧日志不算；服务器启动时会重写日志
+                if st.st_mtime >= spawned - 1:
+                    if (inode is not None and inode != st.st_ino) or st.st_size < offset:
+                        offset = 0
+                    f.seek(offset)
+                    data = f.read()
+                    offset += len(data)
+                    inode = st.st_ino
+                    lines = data
+        ready_event = None
+        stall_event = None
+        with self.lock:
+            if shard.spawned != spawned:
+                return
+            now = time.monotonic()
+            if lines:
+                shard.last_output = now
+                shard.stalled = False
+                data = shard.partial + lines
+                complete, _, shard.partial = data.rpartition(b"\n")
+                for raw in complete.splitlines():
+                    self.mark(shard, raw.decode("utf-8", errors="replace"))
+            shard.offset, shard.inode = offset, inode
+            if shard.ready:
+                shard.ready_at = max(shard.marks.values())
+                ready_event = shard.phases()
+            elif not shard.stalled and now - shard.last_output >= self.stall_timeout:
+                shard.stalled = True
+                stall_event = (self.current_phase(shard), now - shard.last_output)
+        if ready_event is not None and self.on_ready is not None:
+            self.on_ready(shard.name, ready_event)
+        if stall_event is not None and self.on_stall is not None:
+            self.on_stall(shard.name, *stall_event)
+        # 回调结束后再唤醒wait()，等待方返回时就绪耗时已经报告过
+        if ready_event is not None or stall_event is not None:
+            with self.lock:
+                self.changed.notify_all()
+
+    def mark(self, shard, line):
+        """记录日志行对应的阶段完成时间（取第一次出现的时间）"""
+        for phase, pattern in READY_MARKERS:
+            if phase in shard.marks or not pattern.search(line):
+                continue
+            observed = time.time() - shard.spawned
+            match = READY_LOG_TIME.match(line)
+            if match:
+                h, m, s = (int(v) for v in match.groups())
+                logged = float(h * 3600 + m * 60 + s)
+                observed = min(max(observed, logged), logged + 0.999)
+            shard.marks[phase] = observed
+
+    def current_phase(self, shard):
+        """分片正在进行的阶段"""
+        for phase in ("mods", "world", "link"):
+            if phase not in shard.marks and (phase != "link" or shard.require_link):
+                return phase
+        return "listen"
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            self.changed.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+
+def format_phases(phases):
+    """把各阶段耗时格式化为一行文本"""
+    parts = [f"{READY_PHASE_NAMES[phase]} {phases[phase]:.1f} 秒"
+             for phase in ("mods", "world", "link") if phase in phases]
+    return "，".join(parts)
+
+
+def load_ready_history(path):
+    """读取就绪耗时历史，文件不存在或损坏时返回空列表"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return []
+    return history if isinstance(history, list) else []
+
+
+def append_ready_history(path, entry, limit=READY_HISTORY_LIMIT):
+    """追加一次启动的就绪耗时，只保留最近limit次，返回追加前的历史"""
+    history = load_ready_history(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump((history + [entry])[-limit:], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return history
+
+
+def find_regressions(history, shards):
+    """与历史中位数比较，返回明显变慢的分片 [(分片名, 本次耗时, 历史中位数)]"""
+    regressions = []
+    for name, phases in shards.items():
+        previous = [entry["shards"][name]["total"] for entry in history
+                    if name in entry.get("shards", {})]
+        if not previous:
+            continue
+        median = statistics.median(previous)
+        if phases["total"] >= median * READY_REGRESSION_RATIO and phases["total"] - median >= READY_REGRESSION_MIN:
+            regressions.append((name, phases["total"], median))
+    return regressions
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+饥荒联机版专用服务器分片进程管理（不依赖tkinter）
+
+负责启动各分片进程、检测退出并按退避时间自动重启，用PID锁文件防止重复启动，
+并提供每个分片的CPU和内存占用。psutil为可选依赖，未安装时在Linux上读取/proc。
+
+分片以-console启动，标准输入作为控制台：通过它发送c_save()存档、c_shutdown(true)
+存档后退出，停止服务器和逐个分片滚动重启时不会丢失存档进度。
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 主分片名称：滚动重启时最后重启，停止时最后关闭
+MASTER_SHARD = "Master"
+# 通过控制台存档、关闭的默认等待时间（秒）
+CONSOLE_SAVE_TIMEOUT = 60
+CONSOLE_SHUTDOWN_TIMEOUT = 120
+# 存档目录在该时长（秒）内没有新的写入即认为存档已完成
+SAVE_SETTLE_TIME = 2.0
+# 滚动重启时新进程至少稳定运行的时长（秒），之后才重启下一个分片
+ROLLING_SETTLE_TIME = 10.0
+# 滚动重启时等待新进程就绪的最长时间（秒），超时后停止滚动重启
+ROLLING_READY_TIMEOUT = 600
+# 锁文件已创建但还没有写入分片PID（另一个部署正在启动分片）时，在该时长（秒）内视为被占用
+LOCK_STARTUP_GRACE = 120
+
+
+def pid_alive(pid):
+    """判断进程是否仍在运行"""
+    if not pid:
+        return False
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+    if sys.platform == "win32":
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return False
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def process_cmdline(pid):
+    """进程的命令行参数列表，当前平台无法获取时返回None"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).cmdline()
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    return [arg.decode("utf-8", errors="replace") for arg in data.split(b"\0") if arg]
+
+
+def cmd_cluster(cmd):
+    """分片命令行中 -cluster 后面的集群名，没有时返回None"""
+    for arg, value in zip(cmd, cmd[1:]):
+        if arg == "-cluster":
+            return value
+    return None
+
+
+def is_shard_process(pid, cluster=None):
+    """PID对应的进程是否仍是该集群的分片
+    
+    重启电脑后锁文件中的PID可能已被其他程序复用，命令行中没有 -cluster <集群名>
+    的进程不算；无法读取命令行时只判断进程是否在运行
+    """
+    if not pid_alive(pid):
+        return False
+    if cluster is None:
+        return True
+    cmdline = process_cmdline(pid)
+    return cmdline is None or cmd_cluster(cmdline) == cluster
+
+
+def set_process_affinity(pid, cpus):
+    """把进程固定到指定的CPU核心上，当前平台不支持时返回False"""
+    cpus = list(cpus)
+    if psutil is not None:
+        try:
+            psutil.Process(pid).cpu_affinity(cpus)
+            return True
+        except (psutil.Error, AttributeError, ValueError):
+            return False
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(pid, cpus)
+            return True
+        except OSError:
+            return False
+    if sys.platform == "win32":
+        import ctypes
+        PROCESS_SET_INFORMATION = 0x0200
+        PROCESS_QUERY_INFORMATION = 0x0400
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_SET_INFORMATION | PROCESS_QUERY_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            mask = 0
+            for cpu in cpus:
+                mask |= 1 << cpu
+            return bool(kernel32.SetProcessAffinityMask(handle, ctypes.c_size_t(mask)))
+        finally:
+            kernel32.CloseHandle(handle)
+    return False
+
+
+class ProcessStats:
+    """采样进程的CPU占用（百分比）和常驻内存（字节）"""
+
+    def __init__(self):
+        self._samples = {}
+        self._procs = {}
+
+    def sample(self, pid):
+        """返回 (cpu百分比, rss字节)，当前平台无法获取时对应值为None"""
+        if psutil is not None:
+            try:
+                proc = self._procs.get(pid)
+                if proc is None:
+                    proc = self._procs[pid] = psutil.Process(pid)
+                    proc.cpu_percent(None)  # 第一次调用只建立基准
+                return proc.cpu_percent(None), proc.memory_info().rss
+            except psutil.Error:
+                self._procs.pop(pid, None)
+                return None, None
+        if os.path.exists(f"/proc/{pid}/stat"):
+            return self._sample_procfs(pid)
+        return None, None
+
+    def _sample_procfs(self, pid):
+        try:
+            with open(f"/proc/{pid}/stat", 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            ticks = int(fields[11]) + int(fields[12])  # utime + stime
+            rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None, None
+        now = time.monotonic()
+        cpu = None
+        last = self._samples.get(pid)
+        if last is not None and now > last[0]:
+            cpu = (ticks - last[1]) / os.sysconf("SC_CLK_TCK") / (now - last[0]) * 100
+        self._samples[pid] = (now, ticks)
+        return cpu, rss
+
+
+class ShardProcess:
+    """一个分片进程及其重启状态"""
+
+    def __init__(self, name, cmd, cwd):
+        self.name = name
+        self.cmd = list(cmd)
+        self.cwd = cwd
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.next_start = None
+        self.gave_up = False
+        # 工具正在主动关闭或重启该分片，监控线程不把退出当作崩溃处理
+        self.manual = False
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+
+class ShardSupervisor:
+    """管理一个集群的全部分片进程
+
+    lock_path中记录各分片的PID；锁文件以O_EXCL方式创建，记录的分片仍在运行时
+    拒绝启动，防止重复点击或同时部署启动出两套分片。分片意外退出后按 backoff_base * 2^n 秒（最多
+    backoff_max秒）重启，连续重启max_restarts次仍失败则放弃；稳定运行
+    stable_after秒后重启计数清零。
+    """
+
+    def __init__(self, shards, cwd, lock_path, log=None, restart=True, max_restarts=5,
+                 backoff_base=2.0, backoff_max=60.0, stable_after=300.0, poll_interval=1.0,
+                 affinity=None, cluster_path=None):
+        self.shards = [ShardProcess(name, cmd, cwd) for name, cmd in shards]
+        # 集群目录，用来观察各分片save目录的写入以判断存档是否完成
+        self.cluster_path = cluster_path
+        # {分片名: [CPU核心]}，启动和重启后都会重新固定
+        self.affinity = affinity or {}
+        self.lock_path = lock_path
+        self.cluster = cmd_cluster(self.shards[0].cmd) if self.shards else None
+        self.lock_created = None
+        self.log = log or (lambda message, level="INFO": None)
+        self.restart = restart
+        self.max_restarts = max_restarts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.poll_interval = poll_interval
+        self.stats = ProcessStats()
+        self.lock = threading.Lock()
+        self.console_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.monitor_thread = None
+        # 停止全部分片后依次调用，例如停止日志跟踪
+        self.stop_callbacks = []
+        # 每次启动（包括自动重启和滚动重启）分片进程后以分片名调用，例如重新开始就绪检测
+        self.spawn_callbacks = []
+        # ready_check(分片名)返回True表示分片已就绪，滚动重启时据此决定何时重启下一个分片；
+        # stall_check(分片名)返回True表示分片启动卡住，滚动重启就此中止
+        self.ready_check = None
+        self.stall_check = None
+
+    def start(self):
+        """启动全部分片并开始监控"""
+        self.acquire_lock()
+        try:
+            for shard in self.shards:
+                self.spawn(shard)
+        except Exception:
+            self.stop()
+            raise
+        self.write_lock()
+        self.monitor_thread = threading.Thread(target=self.monitor, daemon=True)
+        self.monitor_thread.start()
+
+    def spawn(self, shard):
+        """启动单个分片进程"""
+        shard.process = subprocess.Popen(shard.cmd, cwd=shard.cwd, stdin=subprocess.PIPE)
+        shard.started_at = time.monotonic()
+        shard.next_start = None
+        self.log(f"{shard.name}服务器进程ID: {shard.pid}")
+        cpus = self.affinity.get(shard.name)
+        if cpus:
+            if set_process_affinity(shard.pid, cpus):
+                self.log(f"{shard.name}服务器已固定到CPU核心: {', '.join(map(str, cpus))}")
+            else:
+                self.log(f"无法为{shard.name}服务器设置CPU亲和性", "WARNING")
+        for callback in self.spawn_callbacks:
+            callback(shard.name)
+
+    def monitor(self):
+        """监控线程：回收退出的进程并按退避时间重启"""
+        while not self.stopping.wait(self.poll_interval):
+            with self.lock:
+                changed = False
+                for shard in self.shards:
+                    if shard.gave_up or shard.process is None or shard.manual:
+                        continue
+                    now = time.monotonic()
+                    if shard.alive():
+                        if shard.restarts and now - shard.started_at >= self.stable_after:
+                            shard.restarts = 0
+                        continue
+
+                    if shard.next_start is None:
+                        code = shard.process.returncode
+                        self.log(f"{shard.name}服务器已退出，退出码: {code}", "WARNING")
+                        if not self.restart or shard.restarts >= self.max_restarts:
+                            shard.gave_up = True
+                            self.log(f"{shard.name}服务器重启次数过多，不再自动重启", "ERROR")
+                            continue
+                        delay = min(self.backoff_base * (2 ** shard.restarts), self.backoff_max)
+                        shard.next_start = now + delay
+                        self.log(f"{delay:g} 秒后重启{shard.name}服务器", "WARNING")
+                    elif now >= shard.next_start:
+                        shard.restarts += 1
+                        try:
+                            self.spawn(shard)
+                            changed = True
+                        except OSError as e:
+                            shard.next_start = None
+                            self.log(f"重启{shard.name}服务器失败: {str(e)}", "ERROR")
+                if changed:
+                    self.write_lock()
+
+    def shard(self, name):
+        for shard in self.shards:
+            if shard.name == name:
+                return shard
+        raise KeyError(name)
+        
+    def restart_order(self):
+        """滚动重启和关闭的顺序：先次级分片（如Caves），最后主分片"""
+        return sorted(self.shards, key=lambda shard: shard.name == MASTER_SHARD)
+        
+    def send_command(self, name, command):
+        """通过控制台向分片发送一条命令，分片未运行或控制台已关闭时返回False"""
+        shard = self.shard(name)
+        if not shard.alive() or shard.process.stdin is None:
+            return False
+        with self.console_lock:
+            try:
+                shard.process.stdin.write((command + "\n").encode("utf-8"))
+                shard.process.stdin.flush()
+            except (OSError, ValueError):
+                return False
+        return True
+        
+    def save(self, timeout=CONSOLE_SAVE_TIMEOUT):
+        """向各分片发送c_save()并等待存档写完，返回是否全部完成"""
+        since = time.time()
+        sent = [shard for shard in self.shards if self.send_command(shard.name, "c_save()")]
+        if not sent:
+            return False
+        self.log(f"已发送存档命令: {', '.join(shard.name for shard in sent)}")
+        deadline = time.monotonic() + timeout
+        done = all([self.wait_for_save(shard.name, since, deadline) for shard in sent])
+        if done:
+            self.log("各分片存档完成", "SUCCESS")
+        else:
+            self.log("等待存档超时，部分分片可能没有完成存档", "WARNING")
+        return done
+        
+    def wait_for_save(self, name, since, deadline):
+        """等待分片的save目录中出现since之后写入的文件，并在SAVE_SETTLE_TIME内不再变化"""
+        if self.cluster_path is None:
+            return False
+        save_path = os.path.join(self.cluster_path, name, "save")
+        last_write = None
+        while time.monotonic() < deadline:
+            latest = latest_mtime(save_path)
+            if latest is not None and latest >= since:
+                if last_write is not None and latest == last_write and time.time() - latest >= SAVE_SETTLE_TIME:
+                    return True
+                last_write = latest
+            if not self.shard(name).alive():
+                return last_write is not None
+            time.sleep(0.2)
+        return False
+        
+    def shutdown_shards(self, shards, timeout=CONSOLE_SHUTDOWN_TIMEOUT):
+        """向分片发送c_shutdown(true)（存档后退出）并等待退出，超时仍未退出的结束进程
+        
+        返回正常退出的分片名列表
+        """
+        with self.lock:
+            for shard in shards:
+                shard.manual = True
+        sent = [shard for shard in shards if self.send_command(shard.name, "c_shutdown(true)")]
+        deadline = time.monotonic() + timeout
+        graceful = []
+        for shard in sent:
+            try:
+                shard.process.wait(timeout=max(0.1, deadline - time.monotonic()))
+                graceful.append(shard.name)
+            except subprocess.TimeoutExpired:
+                self.log(f"{shard.name}服务器在 {timeout:g} 秒内没有退出，强制结束", "WARNING")
+        for shard in shards:
+            if shard.alive():
+                shard.process.terminate()
+                try:
+                    shard.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    shard.process.kill()
+                    shard.process.wait()
+            self.close_console(shard)
+        return graceful
+        
+    def close_console(self, shard):
+        if shard.process is not None and shard.process.stdin is not None:
+            try:
+                shard.process.stdin.close()
+            except OSError:
+                pass
+                
+    def rolling_restart(self, ready=None, timeout=CONSOLE_SHUTDOWN_TIMEOUT, settle=ROLLING_SETTLE_TIME,
+                        ready_timeout=ROLLING_READY_TIMEOUT, cancel_event=None):
+        """逐个重启分片：先次级分片再主分片，每个分片存档退出后立即重新启动，
+        新进程就绪后才重启下一个，任意时刻最多只有一个分片不在线
+        
+        ready(分片名)返回True表示新进程已就绪；未提供时使用ready_check，两者都没有时
+        以稳定运行settle秒为准。新进程ready_timeout秒内未就绪或stall_check报告卡住时
+        抛出RuntimeError，不再重启后面的分片；
+        cancel_event被设置或管理器停止时不再重启后面的分片，返回False，全部完成时返回True
+        """
+        ready = ready or self.ready_check
+        for shard in self.restart_order():
+            if shard.process is None:
+                continue
+            if (cancel_event is not None and cancel_event.is_set()) or self.stopping.is_set():
+                return False
+            self.log(f"正在重启{shard.name}服务器...", "WARNING")
+            start = time.monotonic()
+            graceful = self.shutdown_shards([shard], timeout)
+            if graceful:
+                self.log(f"{shard.name}服务器已存档并退出")
+            with self.lock:
+                # 重启期间调用了stop()：不再启动新进程，否则会在stop()结束后继续运行
+                if self.stopping.is_set():
+                    return False
+                shard.restarts = 0
+                shard.gave_up = False
+                try:
+                    self.spawn(shard)
+                finally:
+                    shard.manual = False
+                self.write_lock()
+            deadline = time.monotonic() + ready_timeout
+            while not (ready(shard.name) if ready is not None else time.monotonic() - shard.started_at >= settle):
+                if not shard.alive():
+                    raise RuntimeError(f"{shard.name}服务器重启后退出，退出码: {shard.process.returncode}")
+                if self.stall_check is not None and self.stall_check(shard.name):
+                    raise RuntimeError(f"{shard.name}服务器重启后卡住，已停止滚动重启")
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"{shard.name}服务器重启后 {ready_timeout} 秒内未就绪，已停止滚动重启")
+                if self.stopping.wait(0.2) or (cancel_event is not None and cancel_event.is_set()):
+                    return False
+            self.log(f"{shard.name}服务器已重启，停机 {time.monotonic() - start:.1f} 秒", "SUCCESS")
+        return True
+            
+    def stop(self, timeout=CONSOLE_SHUTDOWN_TIMEOUT, graceful=True):
+        """停止监控并结束全部分片进程
+        
+        graceful时先通过控制台让各分片存档后退出（次级分片先于主分片），超时后再结束进程
+        """
+        self.stopping.set()
+        if self.monitor_thread is not None and self.monitor_thread is not threading.current_thread():
+            self.monitor_thread.join(timeout=5)
+        if graceful:
+            alive = [shard for shard in self.restart_order() if shard.alive()]
+            if alive:
+                self.log("正在存档并关闭服务器...")
+                graceful_names = self.shutdown_shards(alive, timeout)
+                if graceful_names:
+                    self.log(f"已存档并退出: {', '.join(graceful_names)}", "SUCCESS")
+        # 锁内只取出要结束的进程；等待退出时不持有锁，界面刷新状态（snapshot）不会卡住。
+        # stopping已设置，滚动重启不会再启动新进程
+        with self.lock:
+            processes = [(shard, shard.process) for shard in self.shards if shard.process is not None]
+        for _, process in processes:
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for shard, process in processes:
+            try:
+                process.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            self.close_console(shard)
+        with self.lock:
+            self.release_lock()
+        for callback in self.stop_callbacks:
+            callback()
+
+    def is_running(self):
+        """是否还有分片在运行或等待重启"""
+        return any(shard.alive() or shard.next_start is not None for shard in self.shards)
+
+    def snapshot(self):
+        """返回各分片状态：PID、是否运行、CPU、内存、重启次数、运行时长"""
+        result = []
+        with self.lock:
+            for shard in self.shards:
+                alive = shard.alive()
+                cpu, rss = self.stats.sample(shard.pid) if alive else (None, None)
+                result.append({
+                    "name": shard.name,
+                    "pid": shard.pid,
+                    "alive": alive,
+                    "cpu": cpu,
+                    "rss": rss,
+                    "restarts": shard.restarts,
+                    "uptime": time.monotonic() - shard.started_at if alive else 0.0,
+                })
+        return result
+
+    def acquire_lock(self):
+        """原子地创建PID锁文件，记录的分片仍在运行或另一个部署正在启动时拒绝启动
+        
+        记录的进程都已退出（或PID已被其他程序复用）的锁文件是上次残留的，删除后重新创建
+        """
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        for _ in range(3):
+            try:
+                fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                data = read_lock_file(self.lock_path)
+                running = [f"{name} (PID {pid})" for name, pid in lock_shards(data).items()
+                           if is_shard_process(pid, self.cluster)]
+                if running:
+                    raise RuntimeError(f"检测到分片已在运行: {', '.join(running)}，请先停止服务器")
+                if lock_starting(data):
+                    raise RuntimeError(f"另一个部署（PID {data['owner']}）正在启动分片，请稍后再试")
+                # 只删除刚才判断过的那份残留锁，期间被其他部署重新创建的锁不动
+                if read_lock_file(self.lock_path) == data:
+                    try:
+                        os.remove(self.lock_path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            self.lock_created = time.time()
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.lock_data(), f)
+            return
+        raise RuntimeError(f"无法创建锁文件: {self.lock_path}")
+        
+    def lock_data(self):
+        """锁文件内容：创建锁的进程、创建时间和各分片的PID"""
+        return {"owner": os.getpid(), "created": self.lock_created,
+                "shards": {shard.name: shard.pid for shard in self.shards if shard.pid}}
+
+    def write_lock(self):
+        """把当前各分片的PID写入锁文件"""
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        tmp_path = f"{self.lock_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.lock_data(), f)
+        os.replace(tmp_path, self.lock_path)
+
+    def release_lock(self):
+        """删除本管理器创建的锁文件（没有拿到锁时不动其他部署的锁）"""
+        if self.lock_created is None:
+            return
+        self.lock_created = None
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+
+def latest_mtime(path):
+    """目录中最新的文件修改时间，目录不存在或为空时返回None"""
+    latest = None
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                mtime = os.stat(os.path.join(root, name)).st_mtime
+            except OSError:
+                continue
+            if latest is None or mtime > latest:
+                latest = mtime
+    return latest
+
+
+def read_lock_file(lock_path):
+    """读取PID锁文件的原始内容，不存在或损坏时返回空字典"""
+    try:
+        with open(lock_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def lock_shards(data):
+    """锁文件内容中的 {分片名: PID}（兼容旧版本只记录分片PID的格式）"""
+    shards = data.get("shards") if "shards" in data else data
+    if not isinstance(shards, dict):
+        return {}
+    return {name: pid for name, pid in shards.items() if isinstance(pid, int)}
+
+
+def lock_starting(data):
+    """锁文件是否由另一个仍在运行的进程刚刚创建、还没有写入分片PID"""
+    owner = data.get("owner")
+    created = data.get("created")
+    if not isinstance(owner, int) or owner == os.getpid() or lock_shards(data):
+        return False
+    if not isinstance(created, (int, float)) or time.time() - created >= LOCK_STARTUP_GRACE:
+        return False
+    return pid_alive(owner)
+
+
+def read_shard_lock(lock_path):
+    """读取PID锁文件，返回 {分片名: PID}"""
+    return lock_shards(read_lock_file(lock_path))
+
+
+def running_shards(lock_path, cluster=None):
+    """锁文件中记录的、仍在运行的该集群分片 {分片名: PID}"""
+    return {name: pid for name, pid in read_shard_lock(lock_path).items() if is_shard_process(pid, cluster)}
+
+
+def format_shard_stats(stats):
+    """把snapshot()的结果格式化为一行文本"""
+    parts = []
+    for shard in stats:
+        if not shard["alive"]:
+            parts.append(f"{shard['name']}: 未运行")
+            continue
+        cpu = f"{shard['cpu']:.0f}%" if shard["cpu"] is not None else "-"
+        rss = f"{shard['rss'] / 1024 / 1024:.0f} MB" if shard["rss"] is not None else "-"
+        text = f"{shard['name']}: PID {shard['pid']} CPU {cpu} 内存 {rss}"
+        if shard["restarts"]:
+            text += f" 重启 {shard['restarts']} 次"
+        parts.append(text)
+    return "  |  ".join(parts)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+部署流程的计时与统计（不依赖tkinter）
+
+每个步骤及其子操作记录为一个区间（Span），包含起止时间、所在线程、处理的
+文件数和字节数；子操作的计数会累加到所属步骤上。全部区间可以导出为Chrome
+trace格式的JSON（在chrome://tracing或Perfetto中打开），直观地看到部署时间
+花在了哪里。
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """一个计时区间，作为上下文管理器使用
+
+    add()累加处理的文件数和字节数，同时累加到parent；tracer为None时只计数不记录
+    """
+
+    def __init__(self, tracer, name, cat, parent=None, on_add=None, args=None):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.parent = parent
+        self.on_add = on_add
+        self.args = dict(args or {})
+        self.files = 0
+        self.bytes = 0
+        self.start = None
+        self.end = None
+        self.tid = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        if self.tracer is not None:
+            self.tracer.record(self)
+        return False
+
+    def add(self, files=0, bytes=0):
+        """累加处理的文件数和字节数（线程安全）"""
+        with self.lock:
+            self.files += files
+            self.bytes += bytes
+        if self.parent is not None:
+            self.parent.add(files, bytes)
+        if self.on_add is not None:
+            self.on_add()
+
+    def set(self, **args):
+        """附加其他统计信息，导出时写入args"""
+        with self.lock:
+            self.args.update(args)
+
+    @property
+    def elapsed(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start if self.start is not None else 0.0
+
+    def summary(self):
+        """返回耗时、文件数、字节数和吞吐量（字节/秒）"""
+        elapsed = self.elapsed
+        return {
+            "elapsed": elapsed,
+            "files": self.files,
+            "bytes": self.bytes,
+            "throughput": self.bytes / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class Tracer:
+    """收集一次部署中全部已结束的区间"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def span(self, name, cat="op", parent=None, on_add=None, **args):
+        """创建一个区间，with语句结束时记录"""
+        return Span(self, name, cat, parent=parent, on_add=on_add, args=args)
+
+    def record(self, span):
+        with self.lock:
+            self.spans.append(span)
+            self.thread_names.setdefault(span.tid, threading.current_thread().name)
+
+    def stage_metrics(self):
+        """各步骤的统计 {步骤名: summary()}"""
+        with self.lock:
+            return {span.name: span.summary() for span in self.spans if span.cat == "stage"}
+
+    def chrome_trace(self, metadata=None):
+        """生成Chrome trace格式的字典（时间单位为微秒）"""
+        pid = os.getpid()
+        events = []
+        with self.lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        for tid, name in thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": name}})
+        for span in sorted(spans, key=lambda s: s.start):
+            summary = span.summary()
+            args = dict(span.args)
+            if span.files or span.bytes:
+                args.update(files=span.files, bytes=span.bytes,
+                            throughput_mb_s=round(summary["throughput"] / 1024 / 1024, 2))
+            events.append({
+                "name": span.name,
+                "cat": span.cat,
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": summary["elapsed"] * 1e6,
+                "pid": pid,
+                "tid": span.tid,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": metadata or {}}
+
+    def export(self, path, metadata=None):
+        """把时间线写入Chrome trace JSON文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(metadata), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class StageProgress:
+    """传给步骤函数的进度对象
+
+    progress(fraction) 直接报告0~1的进度；设置了字节总量（预估或set_total）时，
+    add()和子操作累计的字节数会自动换算为进度。span()创建子操作区间。
+    """
+
+    def __init__(self, report, span, total=None, on_total=None):
+        self.report = report
+        self.stage_span = span
+        self.total = total
+        self.on_total = on_total
+        span.on_add = self._bytes_changed
+
+    def __call__(self, fraction):
+        self.report(fraction)
+
+    def set_total(self, total):
+        """设置本步骤需要处理的字节总量"""
+        self.total = total
+        if self.on_total is not None:
+            self.on_total(total)
+        self._bytes_changed()
+
+    def add(self, files=0, bytes=0):
+        """记录本步骤直接处理的文件和字节"""
+        self.stage_span.add(files, bytes)
+
+    def span(self, name, **args):
+        """创建子操作区间，子操作的计数会累加到本步骤"""
+        tracer = self.stage_span.tracer
+        return Span(tracer, name, self.stage_span.name, parent=self.stage_span, args=args)
+
+    def _bytes_changed(self):
+        if self.total:
+            self.report(self.stage_span.bytes / self.total)
+
+
+class NullProgress(StageProgress):
+    """未在调度器中运行时（直接调用某个步骤方法）使用的进度对象，只计数不记录"""
+
+    def __init__(self, report=None):
+        super().__init__(report or (lambda fraction: None), Span(None, "", "stage"))
+
+
+def as_progress(progress):
+    """把None或只接受fraction的回调统一包装为StageProgress"""
+    if isinstance(progress, StageProgress):
+        return progress
+    return NullProgress(progress)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+测试用的假程序和公共工具
+
+假程序的写法和合成数据与基准测试相同，直接复用benchmarks/bench_pipeline.py中的生成函数。
+"""
+
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench_pipeline import make_cluster_zip, make_fake_binary, make_workshop, make_world  # noqa: E402
+
+
+# 假的SteamCMD：记录每次调用的参数；app_info_print输出FAKE_BUILDID作为最新版本；
+# app_update输出与真实SteamCMD相同格式的进度行（带validate时另有校验阶段），
+# 然后在安装目录（+force_install_dir，默认为脚本所在目录）写入应用清单，
+# 并把FAKE_SERVER_SOURCE复制为专用服务器程序。FAKE_STEAMCMD_MODE为error时输出
+# 错误行并以退出码8结束，为hang时输出第一行进度后不再继续
+FAKE_STEAMCMD = '''
+import os, shutil, sys, time
+args = sys.argv[1:]
+root = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(root, "calls.log"), "a") as f:
+    f.write(" ".join(args) + "\\n")
+build = os.environ.get("FAKE_BUILDID", "100")
+mode = os.environ.get("FAKE_STEAMCMD_MODE", "ok")
+print("Redirecting stderr to 'logs/stderr.txt'", flush=True)
+if "+app_info_print" in args:
+    print('"343050"\\n{\\n"depots"\\n{\\n"branches"\\n{\\n"public"\\n{\\n"buildid"\\t\\t"%s"\\n}\\n}\\n}\\n}' % build)
+    sys.exit(0)
+install = args[args.index("+force_install_dir") + 1] if "+force_install_dir" in args else root
+if mode == "error":
+    print("ERROR! Failed to install app '343050' (Disk write failure)", flush=True)
+    sys.exit(8)
+states = ("downloading", "verifying install") if "validate" in args else ("downloading",)
+for state in states:
+    for i in range(1, 5):
+        print(f" Update state (0x61) {state}, progress: {i * 25:.2f} ({i * 1000} / 4000)", flush=True)
+        if mode == "hang":
+            time.sleep(60)
+os.makedirs(os.path.join(install, "steamapps"), exist_ok=True)
+with open(os.path.join(install, "steamapps", "appmanifest_343050.acf"), "w") as f:
+    f.write('"AppState"\\n{\\n\\t"StateFlags"\\t\\t"4"\\n\\t"buildid"\\t\\t"%s"\\n}\\n' % build)
+if os.environ.get("FAKE_SERVER_SOURCE"):
+    server = os.path.join(install, "bin", "dontstarve_dedicated_server_nullrenderer")
+    os.makedirs(os.path.dirname(server), exist_ok=True)
+    shutil.copy2(os.environ["FAKE_SERVER_SOURCE"], server)
+print("Success! App '343050' fully installed.", flush=True)
+'''
+
+# 假的专用服务器分片：启动和存档退出时各向FAKE_SERVER_LOG记录一行（含分片名和工作目录），
+# 在FAKE_KLEI下的集群目录中写入带就绪标志的server_log.txt，然后等待控制台的c_shutdown(true)
+FAKE_SERVER = '''
+import os, sys
+args = sys.argv[1:]
+shard = args[args.index("-shard") + 1]
+cluster = args[args.index("-cluster") + 1]
+with open(os.environ["FAKE_SERVER_LOG"], "a") as f:
+    f.write(f"start {shard} {os.getcwd()}\\n")
+shard_path = os.path.join(os.environ["FAKE_KLEI"], cluster, shard)
+os.makedirs(shard_path, exist_ok=True)
+with open(os.path.join(shard_path, "server_log.txt"), "w") as f:
+    f.write("[00:00:00]: Begin Session: 1\\n[00:00:00]: [Shard] is now ready\\n")
+for line in sys.stdin:
+    if line.strip() == "c_shutdown(true)":
+        with open(os.environ["FAKE_SERVER_LOG"], "a") as f:
+            f.write(f"shutdown {shard}\\n")
+        sys.exit(0)
+'''
+
+
+def make_deploy_fixture(root, mods=2):
+    """生成一次完整部署所需的合成数据（复用基准测试的生成函数），返回部署配置
+    
+    配置中的SteamCMD为FAKE_STEAMCMD，klei_path为root/klei；调用方需设置FAKE_KLEI、
+    FAKE_SERVER_LOG，并在FAKE_SERVER_SOURCE指向FAKE_SERVER时由SteamCMD安装服务器程序
+    """
+    rng = random.Random(0)
+    steamcmd_path = os.path.join(root, "steamcmd")
+    make_workshop(os.path.join(root, "steam"), mods, 1, 1024, rng)
+    make_world(os.path.join(root, "world"), 1, 4096, rng)
+    make_cluster_zip(os.path.join(root, "cluster.zip"), 0, rng)
+    return {
+        'config_file': os.path.join(root, "cluster.zip"),
+        'steamcmd_path': steamcmd_path,
+        'steamcmd_exe': make_fake_binary(steamcmd_path, "steamcmd", FAKE_STEAMCMD),
+        'steam_path': os.path.join(root, "steam"),
+        'world_folder': os.path.join(root, "world"),
+        'klei_path': os.path.join(root, "klei"),
+        'backup': False,
+        'tail_logs': False,
+        'auto_restart': False,
+        'update_policy': 'auto',
+        'shutdown_timeout': 5,
+        'rolling_settle': 0.2,
+    }
+
+
+def wait_until(predicate, timeout=10.0, interval=0.02):
+    """轮询直到predicate()为真，超时返回False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def read_lines(path):
+    """读取文本文件的各行，文件不存在时返回空列表"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+__all__ = ["FAKE_SERVER", "FAKE_STEAMCMD", "make_deploy_fixture", "make_fake_binary", "wait_until", "read_lines"]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""蓝绿安装：更新未运行的安装，切换安装时全部分片停止后再从新安装启动"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from fakes import FAKE_SERVER, make_deploy_fixture, make_fake_binary, read_lines, wait_until
+
+import dst_pipeline
+from dst_pipeline import DeployPipeline
+
+
+@unittest.skipIf(sys.platform == "win32", "假的分片通过批处理包装时无法接收控制台命令")
+class BlueGreenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_blue_green_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.config = make_deploy_fixture(self.root)
+        self.config['blue_green'] = True
+        self.server_log = os.path.join(self.root, "server.log")
+        self.state_path = os.path.join(self.root, "update_state.json")
+        patches = [
+            mock.patch.object(dst_pipeline, "UPDATE_STATE_PATH", self.state_path),
+            mock.patch.object(dst_pipeline, "STAGE_CACHE_PATH", os.path.join(self.root, "stage_cache.json")),
+            mock.patch.dict(os.environ, {
+                "FAKE_BUILDID": "100", "FAKE_KLEI": self.config['klei_path'], "FAKE_SERVER_LOG": self.server_log,
+                "FAKE_SERVER_SOURCE": make_fake_binary(os.path.join(self.root, "src"), "server", FAKE_SERVER)}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def deploy(self, running=None):
+        pipeline = DeployPipeline(self.config, running_supervisor=running)
+        pipeline.run()
+        self.assertIsNotNone(pipeline.supervisor)
+        if pipeline.supervisor is not running:
+            self.addCleanup(pipeline.supervisor.stop, 5)
+        return pipeline
+
+    def state(self):
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def slot_path(self, slot):
+        return os.path.join(self.config['steamcmd_path'], dst_pipeline.INSTALL_SLOT_PREFIX + slot)
+
+    def slot_buildid(self, slot):
+        manifest = os.path.join(self.slot_path(slot), "steamapps", "appmanifest_343050.acf")
+        with open(manifest, 'r', encoding='utf-8') as f:
+            return dst_pipeline.parse_vdf(f.read())["AppState"]["buildid"]
+
+    def app_updates(self):
+        calls = read_lines(os.path.join(self.config['steamcmd_path'], "calls.log"))
+        return [call.split()[1] for call in calls if "+app_update" in call]
+
+    def test_update_goes_to_inactive_slot_and_switch_restarts_all_shards(self):
+        first = self.deploy()
+        self.assertTrue(wait_until(lambda: len(read_lines(self.server_log)) == 2))
+        blue_bin = os.path.join(self.slot_path("blue"), "bin")
+        self.assertEqual(self.state()["active_install"], "blue")
+        self.assertEqual(sorted(read_lines(self.server_log)), [f"start Caves {blue_bin}", f"start Master {blue_bin}"])
+
+        # 新版本只安装到未运行的green，运行中的blue保持原版本
+        with mock.patch.dict(os.environ, {"FAKE_BUILDID": "101"}):
+            second = self.deploy(running=first.supervisor)
+        self.assertEqual(self.app_updates(), [self.slot_path("blue"), self.slot_path("green")])
+        self.assertEqual(self.slot_buildid("blue"), "100")
+        self.assertEqual(self.slot_buildid("green"), "101")
+        state = self.state()
+        self.assertEqual((state["current_install"], state["active_install"]), ("green", "green"))
+
+        # 切换安装：全部分片存档退出后才从green启动，而不是逐个滚动重启
+        self.assertTrue(wait_until(lambda: len(read_lines(self.server_log)) == 6))
+        green_bin = os.path.join(self.slot_path("green"), "bin")
+        lines = read_lines(self.server_log)
+        self.assertEqual(sorted(lines[2:4]), ["shutdown Caves", "shutdown Master"])
+        self.assertEqual(sorted(lines[4:]), [f"start Caves {green_bin}", f"start Master {green_bin}"])
+        self.assertIsNot(second.supervisor, first.supervisor)
+        self.assertTrue(all(os.path.abspath(shard.cwd) == green_bin for shard in second.supervisor.shards))
+
+        # 分片全部停止后清除运行记录
+        second.supervisor.stop(timeout=5)
+        self.assertNotIn("active_install", self.state())
+        self.assertEqual(self.state()["current_install"], "green")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""复制引擎：系统调用提前返回0时不能留下截断的文件"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dst_pipeline import CopyEngine
+
+
+class CopyEngineShortCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_copy_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.data = os.urandom(3 * 65536 + 123)
+        self.src = os.path.join(self.root, "src.bin")
+        with open(self.src, 'wb') as f:
+            f.write(self.data)
+        self.dst = os.path.join(self.root, "dst.bin")
+
+    def short_after_first_chunk(self, real):
+        # 第一次只复制一块，之后返回0，模拟在文件结束前停止的文件系统
+        calls = []
+
+        def call(*args):
+            calls.append(args)
+            if len(calls) > 1:
+                return 0
+            args = list(args)
+            args[-1] = min(args[-1], 65536)
+            return real(*args)
+        return call
+
+    def assert_copied(self, strategy):
+        engine = CopyEngine([strategy])
+        engine.copy_file(self.src, self.dst)
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(engine.counts, {strategy: 1})
+
+    @unittest.skipUnless(CopyEngine.is_supported("copy_file_range"), "当前平台不支持copy_file_range")
+    def test_copy_file_range_finishes_short_copy(self):
+        with mock.patch.object(os, "copy_file_range", self.short_after_first_chunk(os.copy_file_range)):
+            self.assert_copied("copy_file_range")
+
+    @unittest.skipUnless(CopyEngine.is_supported("sendfile"), "当前平台不支持sendfile")
+    def test_sendfile_finishes_short_copy(self):
+        with mock.patch.object(os, "sendfile", self.short_after_first_chunk(os.sendfile)):
+            self.assert_copied("sendfile")
+
+
+if __name__ == '__main__':
+    unittest.main()
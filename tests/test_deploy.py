@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""再次部署：没有变化时服务器继续运行，模组或专用服务器更新后才滚动重启；
+配置文件和世界文件都没有变化时不重写暂存目录中的任何文件；
+关闭备份时还原前也会给当前集群拍快照"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from fakes import FAKE_SERVER, make_deploy_fixture, make_fake_binary, read_lines, wait_until
+
+import dst_pipeline
+from dst_pipeline import CLUSTER_NAME, DeployPipeline
+
+
+@unittest.skipIf(sys.platform == "win32", "假的分片通过批处理包装时无法接收控制台命令")
+class RedeployTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_deploy_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.config = make_deploy_fixture(self.root)
+        install = os.path.join(self.config['steamcmd_path'], "steamapps", "common",
+                               "Don't Starve Together Dedicated Server")
+        self.config['server_exe'] = make_fake_binary(os.path.join(install, "bin"), "server", FAKE_SERVER)
+        self.server_log = os.path.join(self.root, "server.log")
+        patches = [
+            mock.patch.object(dst_pipeline, "UPDATE_STATE_PATH", os.path.join(self.root, "update_state.json")),
+            mock.patch.object(dst_pipeline, "STAGE_CACHE_PATH", os.path.join(self.root, "stage_cache.json")),
+            mock.patch.dict(os.environ, {"FAKE_BUILDID": "100", "FAKE_KLEI": self.config['klei_path'],
+                                         "FAKE_SERVER_LOG": self.server_log}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.messages = []
+        self.supervisor = None
+
+    def deploy(self):
+        pipeline = DeployPipeline(self.config, on_event=self.on_event, running_supervisor=self.supervisor)
+        pipeline.run()
+        self.assertIsNotNone(pipeline.supervisor)
+        if pipeline.supervisor is not self.supervisor:
+            self.addCleanup(pipeline.supervisor.stop, 5)
+        self.supervisor = pipeline.supervisor
+        return pipeline
+
+    def on_event(self, event):
+        if event["type"] == "log":
+            self.messages.append(event["message"])
+
+    def starts(self):
+        return [line for line in read_lines(self.server_log) if line.startswith("start")]
+
+    def test_restarts_only_when_mods_or_server_change(self):
+        self.deploy()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        pids = [shard.pid for shard in self.supervisor.shards]
+
+        # 集群、模组、专用服务器都没有变化：分片继续运行
+        del self.messages[:]
+        pipeline = self.deploy()
+        self.assertIn("集群、模组和专用服务器均未变化，服务器继续运行，无需重启", self.messages)
+        self.assertFalse(pipeline.mods_changed or pipeline.server_updated)
+        self.assertEqual([shard.pid for shard in self.supervisor.shards], pids)
+        self.assertEqual(len(self.starts()), 2)
+
+        # 模组有更新：滚动重启
+        mod = os.path.join(self.config['steam_path'], "steamapps", "workshop", "content", "322330", "1000000")
+        with open(os.path.join(mod, "modmain.lua"), 'a', encoding='utf-8') as f:
+            f.write("-- updated\n")
+        pipeline = self.deploy()
+        self.assertTrue(pipeline.mods_changed)
+        self.assertIn("服务器滚动重启完成！", self.messages)
+        self.assertEqual(len(self.starts()), 4)
+
+        # 专用服务器有新版本：滚动重启
+        del self.messages[:]
+        with mock.patch.dict(os.environ, {"FAKE_BUILDID": "101"}):
+            pipeline = self.deploy()
+        self.assertTrue(pipeline.server_updated)
+        self.assertFalse(pipeline.mods_changed)
+        self.assertIn("服务器滚动重启完成！", self.messages)
+        self.assertEqual(len(self.starts()), 6)
+
+    def test_warns_when_save_before_swap_is_not_confirmed(self):
+        self.deploy()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        # 世界文件变化时切换集群，切换前先存档；假的分片不写存档，等待超时
+        del self.messages[:]
+        self.config['save_timeout'] = 0.5
+        with open(os.path.join(self.config['world_folder'], "cluster.ini"), 'a', encoding='utf-8') as f:
+            f.write("; edited\n")
+        self.deploy()
+        self.assertIn("未能确认各分片存档完成，本次备份可能不包含最新进度", self.messages)
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 4))
+
+
+class StagedClusterRedeployTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_staging_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.config = make_deploy_fixture(self.root)
+        self.config.update({'start_servers': False, 'steam_mod': False, 'stage_cache': False})
+        # 只在压缩包中、世界文件夹中没有的文件，同步世界时不能删除
+        with zipfile.ZipFile(self.config['config_file'], 'a') as zf:
+            zf.writestr(f"{CLUSTER_NAME}/Master/modoverrides.lua", "return {}\n")
+        patches = [
+            mock.patch.object(dst_pipeline, "UPDATE_STATE_PATH", os.path.join(self.root, "update_state.json")),
+            mock.patch.object(dst_pipeline, "STAGE_CACHE_PATH", os.path.join(self.root, "stage_cache.json")),
+            mock.patch.dict(os.environ, {"FAKE_BUILDID": "100"}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.messages = []
+
+    def deploy(self):
+        del self.messages[:]
+        pipeline = DeployPipeline(self.config, on_event=self.on_event)
+        pipeline.run()
+        return pipeline
+
+    def on_event(self, event):
+        if event["type"] == "log":
+            self.messages.append(event["message"])
+
+    def test_unchanged_zip_and_world_rewrite_nothing(self):
+        # 第一次部署直接切换为正式集群，第二次在新的暂存目录中构建，之后暂存目录是上次的正式集群
+        for _ in range(3):
+            self.deploy()
+        self.assertTrue(any(m.startswith("配置文件解压:") and m.endswith("解压 0 个文件") for m in self.messages),
+                        self.messages)
+        self.assertTrue(any(m.startswith("世界文件同步:") and "传输 0 个文件" in m and m.endswith("删除 0 个过期文件")
+                            for m in self.messages), self.messages)
+        cluster = os.path.join(self.config['klei_path'], CLUSTER_NAME)
+        self.assertTrue(os.path.isfile(os.path.join(cluster, "Master", "modoverrides.lua")))
+        with open(os.path.join(self.config['world_folder'], "cluster.ini"), 'rb') as f:
+            world_ini = f.read()
+        with open(os.path.join(cluster, "cluster.ini"), 'rb') as f:
+            self.assertEqual(f.read(), world_ini)
+
+    def test_restore_snapshots_live_cluster_even_without_backup(self):
+        pipeline = self.deploy()
+        cluster = os.path.join(self.config['klei_path'], CLUSTER_NAME)
+        store = pipeline.open_backup_store()
+        deployed, _ = store.snapshot(cluster, CLUSTER_NAME)
+        with open(os.path.join(cluster, "cluster.ini"), 'a', encoding='utf-8') as f:
+            f.write("; edited\n")
+
+        # backup为false时还原也不能直接丢掉当前集群
+        DeployPipeline(self.config, on_event=self.on_event).restore_backup(deployed['id'])
+        snapshots = store.list_snapshots(CLUSTER_NAME)
+        self.assertEqual(len(snapshots), 2)
+        with open(os.path.join(cluster, "cluster.ini"), encoding='utf-8') as f:
+            self.assertNotIn("; edited", f.read())
+        DeployPipeline(self.config, on_event=self.on_event).restore_backup(snapshots[0]['id'])
+        with open(os.path.join(cluster, "cluster.ini"), encoding='utf-8') as f:
+            self.assertIn("; edited", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
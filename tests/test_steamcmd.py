@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""SteamCMD更新：进度解析、错误输出、取消，以及按已安装版本跳过或降级更新"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from fakes import FAKE_STEAMCMD, make_fake_binary, read_lines
+
+import dst_pipeline
+from dst_pipeline import DeployPipeline, DeploymentCancelled, SteamCMDProgress
+
+
+class SteamCMDProgressTest(unittest.TestCase):
+
+    def test_parses_download_and_verify_lines(self):
+        tracker = SteamCMDProgress()
+        self.assertFalse(tracker.feed("Redirecting stderr to 'logs/stderr.txt'"))
+        self.assertTrue(tracker.feed(" Update state (0x61) downloading, progress: 50.00 (2048 / 4096)"))
+        self.assertEqual((tracker.state, tracker.current, tracker.total), ("downloading", 2048, 4096))
+        self.assertTrue(tracker.state_changed)
+        self.assertAlmostEqual(tracker.fraction(), 0.35)
+        self.assertIn("下载中: 50.0%", tracker.describe())
+        # 下载占前70%，校验占后30%
+        self.assertTrue(tracker.feed(" Update state (0x81) verifying install, progress: 50.00 (1 / 2)"))
+        self.assertAlmostEqual(tracker.fraction(), 0.85)
+        self.assertIn("校验安装", tracker.describe())
+
+
+class RunSteamCMDTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_steamcmd_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.steamcmd_path = os.path.join(self.root, "steamcmd")
+        self.steamcmd_exe = make_fake_binary(self.steamcmd_path, "steamcmd", FAKE_STEAMCMD)
+        patches = [
+            mock.patch.object(dst_pipeline, "UPDATE_STATE_PATH", os.path.join(self.root, "update_state.json")),
+            mock.patch.dict(os.environ, {"FAKE_BUILDID": "100"}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.events = []
+
+    def make_pipeline(self, **overrides):
+        config = {"steamcmd_path": self.steamcmd_path, "steamcmd_exe": self.steamcmd_exe, "update_policy": "auto"}
+        config.update(overrides)
+        return DeployPipeline(config, on_event=self.events.append)
+
+    def logs(self, level=None):
+        return [e["message"] for e in self.events if e["type"] == "log" and level in (None, e["level"])]
+
+    def calls(self):
+        return read_lines(os.path.join(self.steamcmd_path, "calls.log"))
+
+    def app_update_calls(self):
+        return [call for call in self.calls() if "+app_update" in call]
+
+    def test_reports_progress_and_output(self):
+        fractions = []
+        cmd = [self.steamcmd_exe, "+login", "anonymous", "+app_update", "343050", "validate", "+quit"]
+        returncode = self.make_pipeline().run_steamcmd(cmd, progress=fractions.append)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(fractions, sorted(fractions))
+        self.assertAlmostEqual(fractions[-1], 1.0)
+        logs = self.logs()
+        self.assertTrue(any(message.startswith("SteamCMD 下载中") for message in logs))
+        self.assertTrue(any(message.startswith("SteamCMD 校验安装") for message in logs))
+        self.assertIn("输出: Success! App '343050' fully installed.", logs)
+
+    def test_error_line_and_exit_code(self):
+        with mock.patch.dict(os.environ, {"FAKE_STEAMCMD_MODE": "error"}):
+            self.make_pipeline(update_policy="update").update_steamcmd()
+        self.assertIn("输出: ERROR! Failed to install app '343050' (Disk write failure)", self.logs())
+        self.assertIn("SteamCMD返回非零退出码: 8", self.logs("WARNING"))
+        # 失败的更新不记录版本
+        self.assertFalse(os.path.exists(dst_pipeline.UPDATE_STATE_PATH))
+
+    def test_cancel_terminates_steamcmd(self):
+        pipeline = self.make_pipeline()
+        cmd = [self.steamcmd_exe, "+login", "anonymous", "+app_update", "343050", "+quit"]
+
+        def on_line(line):
+            if "progress" in line:
+                pipeline.cancel_event.set()
+
+        start = time.monotonic()
+        with mock.patch.dict(os.environ, {"FAKE_STEAMCMD_MODE": "hang"}):
+            with self.assertRaises(DeploymentCancelled):
+                pipeline.run_steamcmd(cmd, on_line=on_line)
+        self.assertLess(time.monotonic() - start, 15)
+        self.assertIn("已取消SteamCMD更新", self.logs("WARNING"))
+
+    def test_auto_policy_follows_installed_build(self):
+        # 没有安装时完整校验
+        self.make_pipeline().update_steamcmd()
+        self.assertEqual(len(self.app_update_calls()), 1)
+        self.assertIn("validate", self.app_update_calls()[0].split())
+        # 已是最新版本且近期校验过：跳过
+        self.make_pipeline().update_steamcmd()
+        self.assertEqual(len(self.app_update_calls()), 1)
+        self.assertIn("专用服务器已是最新版本，跳过SteamCMD更新", self.logs("SUCCESS"))
+        # 有新版本：普通更新，不带validate
+        with mock.patch.dict(os.environ, {"FAKE_BUILDID": "101"}):
+            self.make_pipeline().update_steamcmd()
+        self.assertEqual(len(self.app_update_calls()), 2)
+        self.assertNotIn("validate", self.app_update_calls()[1].split())
+        self.assertEqual(self.make_pipeline().load_update_state()["buildid"], "101")
+
+    def test_policy_overrides_auto(self):
+        pipeline = self.make_pipeline(update_policy="skip")
+        self.assertEqual(pipeline.choose_update_mode(self.steamcmd_exe, {}), "skip")
+        self.assertIn("更新策略: skip", self.logs())
+
+
+if __name__ == "__main__":
+    unittest.main()
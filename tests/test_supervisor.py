@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""分片进程管理：崩溃后按退避时间重启、重启次数过多时放弃、PID锁和停止"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fakes import make_fake_binary, read_lines, wait_until
+
+from dst_pipeline import DeployPipeline
+from dst_readiness import ReadinessMonitor
+from dst_supervisor import ShardSupervisor, read_shard_lock
+
+# 假的分片：每次启动记录一行；FAKE_SHARD_MODE为crash时立即以退出码3退出，
+# crash_once时只有第一次启动退出，ignore_term时忽略SIGTERM；其余情况等待控制台的c_shutdown(true)
+FAKE_SHARD = '''
+import os, signal, sys, time
+log = os.environ["FAKE_SHARD_LOG"]
+with open(log, "a") as f:
+    f.write(f"start {time.time()}\\n")
+mode = os.environ.get("FAKE_SHARD_MODE", "run")
+marker = log + ".crashed"
+if mode == "crash" or (mode == "crash_once" and not os.path.exists(marker)):
+    open(marker, "w").close()
+    sys.exit(3)
+if mode == "ignore_term":
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+for line in sys.stdin:
+    if line.strip() == "c_shutdown(true)":
+        with open(log, "a") as f:
+            f.write("shutdown\\n")
+        sys.exit(0)
+'''
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="dst_supervisor_test_")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.shard_exe = make_fake_binary(os.path.join(self.root, "bin"), "shard", FAKE_SHARD)
+        self.shard_log = os.path.join(self.root, "shard.log")
+        self.lock_path = os.path.join(self.root, "klei", ".dst_shards_Test.json")
+        self.messages = []
+        self.env = mock.patch.dict(os.environ, {"FAKE_SHARD_LOG": self.shard_log})
+        self.env.start()
+        self.addCleanup(self.env.stop)
+
+    def make_supervisor(self, shards=("Master",), **kwargs):
+        options = dict(backoff_base=0.2, backoff_max=1.0, poll_interval=0.05)
+        options.update(kwargs)
+        supervisor = ShardSupervisor(
+            [(name, [self.shard_exe, "-console", "-cluster", "Test", "-shard", name]) for name in shards],
+            cwd=self.root, lock_path=self.lock_path,
+            log=lambda message, level="INFO": self.messages.append((level, message)), **options)
+        self.addCleanup(supervisor.stop, 5, False)
+        return supervisor
+
+    def starts(self):
+        return [float(line.split()[1]) for line in read_lines(self.shard_log) if line.startswith("start")]
+
+    def test_crash_is_restarted_after_backoff(self):
+        os.environ["FAKE_SHARD_MODE"] = "crash_once"
+        supervisor = self.make_supervisor()
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        shard = supervisor.shard("Master")
+        self.assertTrue(wait_until(shard.alive))
+        self.assertEqual(shard.restarts, 1)
+        first, second = self.starts()
+        self.assertGreaterEqual(second - first, 0.2)
+        self.assertTrue(any("秒后重启" in message for _, message in self.messages))
+        # 重启后锁文件记录新进程的PID
+        self.assertEqual(read_shard_lock(self.lock_path), {"Master": shard.pid})
+
+    def test_gives_up_after_max_restarts(self):
+        os.environ["FAKE_SHARD_MODE"] = "crash"
+        supervisor = self.make_supervisor(max_restarts=2, backoff_base=0.05)
+        supervisor.start()
+        shard = supervisor.shard("Master")
+        self.assertTrue(wait_until(lambda: shard.gave_up))
+        self.assertEqual(len(self.starts()), 3)
+        self.assertFalse(supervisor.is_running())
+        self.assertIn(("ERROR", "Master服务器重启次数过多，不再自动重启"), self.messages)
+
+    def test_lock_refuses_second_start(self):
+        first = self.make_supervisor()
+        first.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 1))
+        second = self.make_supervisor()
+        with self.assertRaisesRegex(RuntimeError, "检测到分片已在运行"):
+            second.start()
+        self.assertIsNone(second.shard("Master").process)
+        self.assertEqual(len(self.starts()), 1)
+        # 没有拿到锁的管理器停止时不删除别人的锁
+        second.stop(timeout=1, graceful=False)
+        self.assertEqual(read_shard_lock(self.lock_path), {"Master": first.shard("Master").pid})
+
+    def test_stale_lock_with_reused_pid_is_replaced(self):
+        # PID仍存在但不是该集群的分片（重启电脑后被其他程序复用）
+        os.makedirs(os.path.dirname(self.lock_path))
+        with open(self.lock_path, 'w', encoding='utf-8') as f:
+            json.dump({"Master": os.getpid()}, f)
+        supervisor = self.make_supervisor()
+        supervisor.start()
+        self.assertEqual(read_shard_lock(self.lock_path), {"Master": supervisor.shard("Master").pid})
+
+    def test_lock_being_created_by_other_deploy_is_held(self):
+        os.makedirs(os.path.dirname(self.lock_path))
+        with open(self.lock_path, 'w', encoding='utf-8') as f:
+            json.dump({"owner": os.getppid(), "created": time.time(), "shards": {}}, f)
+        with self.assertRaisesRegex(RuntimeError, "正在启动分片"):
+            self.make_supervisor().start()
+
+    def test_stop_shuts_down_through_console(self):
+        supervisor = self.make_supervisor(shards=("Master", "Caves"))
+        stopped = []
+        supervisor.stop_callbacks.append(lambda: stopped.append(True))
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        supervisor.stop(timeout=5)
+        self.assertFalse(supervisor.is_running())
+        self.assertEqual(read_lines(self.shard_log).count("shutdown"), 2)
+        self.assertFalse(os.path.exists(self.lock_path))
+        self.assertEqual(stopped, [True])
+        # 主动停止的分片不会被监控线程重启
+        time.sleep(0.3)
+        self.assertEqual(len(self.starts()), 2)
+
+    @unittest.skipIf(sys.platform == "win32", "Windows上terminate直接结束进程")
+    def test_stop_without_console_terminates(self):
+        supervisor = self.make_supervisor()
+        supervisor.start()
+        process = supervisor.shard("Master").process
+        supervisor.stop(timeout=5, graceful=False)
+        self.assertIsNotNone(process.returncode)
+        self.assertNotIn("shutdown", read_lines(self.shard_log))
+
+    @unittest.skipIf(sys.platform == "win32", "Windows上terminate直接结束进程")
+    def test_snapshot_does_not_wait_for_stop(self):
+        os.environ["FAKE_SHARD_MODE"] = "ignore_term"
+        supervisor = self.make_supervisor()
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 1))
+        stopper = threading.Thread(target=supervisor.stop, kwargs={"timeout": 2, "graceful": False})
+        stopper.start()
+        self.addCleanup(stopper.join)
+        # 分片忽略SIGTERM，stop()要等满2秒才强制结束；期间刷新状态不能被阻塞
+        time.sleep(0.3)
+        start = time.monotonic()
+        supervisor.snapshot()
+        self.assertLess(time.monotonic() - start, 1)
+        stopper.join()
+        self.assertFalse(supervisor.is_running())
+        self.assertFalse(os.path.exists(self.lock_path))
+
+    def test_rolling_restart_ready_timeout(self):
+        supervisor = self.make_supervisor(shards=("Master", "Caves"))
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        with self.assertRaisesRegex(RuntimeError, "Caves服务器重启后 0.5 秒内未就绪"):
+            supervisor.rolling_restart(ready=lambda name: False, timeout=5, ready_timeout=0.5)
+        # 超时的分片之后的主分片没有重启
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 3))
+        time.sleep(0.3)
+        self.assertEqual(len(self.starts()), 3)
+
+    def test_rolling_restart_stops_at_stalled_shard(self):
+        # 假的分片不写启动日志，就绪检测在0.5秒没有输出后报告卡住
+        monitor = ReadinessMonitor(os.path.join(self.root, "klei", "Test"), ["Master", "Caves"],
+                                   stall_timeout=0.5, poll_interval=0.05)
+        monitor.start()
+        self.addCleanup(monitor.stop)
+        supervisor = self.make_supervisor(shards=("Master", "Caves"))
+        supervisor.spawn_callbacks.append(monitor.watch)
+        supervisor.ready_check = monitor.is_ready
+        supervisor.stall_check = monitor.is_stalled
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        with self.assertRaisesRegex(RuntimeError, "Caves服务器重启后卡住"):
+            supervisor.rolling_restart(timeout=5)
+        # 卡住的洞穴没有算作就绪，主分片保持运行、没有重启
+        time.sleep(0.3)
+        self.assertEqual(len(self.starts()), 3)
+        self.assertTrue(supervisor.shard("Master").alive())
+
+    def test_rolling_restart_cancel(self):
+        supervisor = self.make_supervisor(shards=("Master", "Caves"))
+        supervisor.start()
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 2))
+        cancel = threading.Event()
+        threading.Timer(0.5, cancel.set).start()
+        start = time.monotonic()
+        self.assertFalse(supervisor.rolling_restart(ready=lambda name: False, timeout=5, cancel_event=cancel))
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(len(self.starts()), 3)
+        # 未取消时全部分片重启完成
+        self.assertTrue(supervisor.rolling_restart(timeout=5, settle=0.2))
+        self.assertTrue(wait_until(lambda: len(self.starts()) == 5))
+
+    def test_deploy_refuses_shards_it_does_not_supervise(self):
+        supervisor = self.make_supervisor()
+        supervisor.start()
+        config = {"klei_path": os.path.dirname(self.lock_path), "cluster_name": "Test",
+                  "backup_path": os.path.join(self.root, "backups")}
+        # 部署和还原在存档、备份、切换目录之前就拒绝
+        with self.assertRaisesRegex(RuntimeError, "检测到分片仍在运行: Master"):
+            DeployPipeline(config).run()
+        with self.assertRaisesRegex(RuntimeError, "检测到分片仍在运行"):
+            DeployPipeline(config).restore_backup()
+        self.assertFalse(os.path.exists(os.path.join(self.root, "klei", "Test.staging")))
+        # 接手了这些分片的部署可以继续，但还原仍需先停止服务器
+        DeployPipeline(config, running_supervisor=supervisor).check_running_shards()
+        with self.assertRaisesRegex(RuntimeError, "检测到分片仍在运行"):
+            DeployPipeline(config, running_supervisor=supervisor).restore_backup()
+
+
+if __name__ == "__main__":
+    unittest.main()
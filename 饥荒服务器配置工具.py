@@ -5,20 +5,41 @@
 自动化配置饥荒联机版专用服务器
 """
 
+import time
+
+# 启动计时起点（--measure-startup模式使用），必须在导入tkinter之前记录
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from tkinter import ttk, scrolledtext
 import json
 import os
-import shutil
-import zipfile
-import subprocess
+import sys
 import threading
-import time
-from pathlib import Path
+import queue
 import getpass
+import logging
+
+# 部署流程（dst_pipeline）、文件对话框等较重的模块在第一次使用时才导入，
+# 窗口显示后由后台线程预先导入部署流程，不拖慢首帧
+from dst_paths import CONFIG_FILE_PATH
+
+# 日志：界面每隔LOG_FLUSH_INTERVAL毫秒批量刷新，最多保留LOG_MAX_LINES行，完整日志写入滚动文件
+LOG_FLUSH_INTERVAL = 100
+LOG_BATCH_SIZE = 500
+LOG_MAX_LINES = 5000
+LOG_LEVEL_COLORS = {
+    "INFO": "#3498db",
+    "SUCCESS": "#2ecc71",
+    "WARNING": "#f39c12",
+    "ERROR": "#e74c3c"
+}
+
+# 分片状态刷新间隔（毫秒）
+SHARD_STATUS_INTERVAL = 2000
 
-# 配置文件路径
-CONFIG_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dst_server_config.json")
+# 输入停止变化多久（毫秒）后在后台运行部署前检查
+PREFLIGHT_DEBOUNCE = 500
 
 class DSTServerConfigTool:
     def __init__(self, root):
@@ -27,6 +48,41 @@ class DSTServerConfigTool:
         self.root.geometry("1200x800")
         self.root.resizable(True, True)
         
+        # 启动各阶段的耗时（秒），--measure-startup模式下输出
+        self.startup_marks = {"imports": time.perf_counter() - STARTUP_T0}
+        # 预加载线程完成后置位，由flush_log_queue在主线程中输出启动耗时
+        self.pending_startup_report = False
+        
+        # 日志队列和待显示的进度，必须在load_config之前创建
+        self.log_queue = queue.Queue()
+        self.pending_progress = None
+        # 滚动日志文件在后台预加载完成后才创建，之前的日志先暂存
+        self.file_logger = None
+        self.file_log_levels = {}
+        self.file_log_backlog = []
+        
+        # 本工具启动的分片进程管理器，每个集群一个；只在Tk主循环中修改，
+        # 部署线程结束时把新的列表放入pending_finish，由flush_log_queue应用
+        self.supervisors = []
+        self.pending_finish = None
+        
+        # 滚动重启进行中时不恢复重启按钮；重启线程结束时设置pending_restart_done，
+        # 由flush_log_queue在主线程中恢复按钮。停止服务器时通过restart_cancel中止重启
+        self.restarting = False
+        self.pending_restart_done = False
+        self.restart_cancel = threading.Event()
+        
+        # 部署前检查：输入变化后延迟启动，在工作线程中运行，结果由flush_log_queue显示
+        self.preflight_checker = None
+        self.preflight_after = None
+        self.preflight_generation = 0
+        self.preflight_lock = threading.Lock()
+        self.preflight_result = None
+        self.pending_preflight = None
+        
+        # 取消标志，供工作线程检查
+        self.cancel_event = threading.Event()
+        
         # 获取当前用户 - 必须在create_widgets之前
         self.current_user = getpass.getuser()
         
@@ -38,6 +94,46 @@ class DSTServerConfigTool:
         
         # 创建界面
         self.create_widgets()
+        self.startup_marks["widgets"] = time.perf_counter() - STARTUP_T0
+        
+        # 输入变化时重新检查
+        for var in (self.config_file, self.steamcmd_path, self.steam_path, self.world_folder, self.steam_mod_var):
+            var.trace_add("write", self.schedule_preflight)
+        
+        # 首帧显示后再在后台导入部署流程
+        self.root.bind("<Map>", self.on_first_map)
+        
+    def on_first_map(self, event=None):
+        """窗口第一次显示：记录首帧时间并开始后台预加载"""
+        if event is not None and event.widget is not self.root:
+            return
+        self.root.unbind("<Map>")
+        # after_idle在本次绘制完成后才执行，此时才算真正显示出第一帧
+        self.root.after_idle(self.on_first_frame)
+        
+    def on_first_frame(self):
+        """记录首帧时间，启动后台预加载"""
+        self.startup_marks["first_frame"] = time.perf_counter() - STARTUP_T0
+        threading.Thread(target=self.preload, daemon=True).start()
+        self.schedule_preflight()
+        
+    def preload(self):
+        """后台导入部署流程并创建滚动日志文件（在工作线程中执行）"""
+        import dst_pipeline
+        self.file_log_levels = dst_pipeline.LOG_FILE_LEVELS
+        self.file_logger = dst_pipeline.create_file_logger()
+        self.startup_marks["preload"] = time.perf_counter() - STARTUP_T0
+        if "--measure-startup" in sys.argv:
+            # Tk不是线程安全的，不能在工作线程中调用root.after
+            self.pending_startup_report = True
+            
+    def report_startup(self):
+        """输出启动耗时并退出（--measure-startup模式）"""
+        marks = {name: round(value * 1000, 1) for name, value in self.startup_marks.items()}
+        print(json.dumps({"startup_ms": marks}), flush=True)
+        self.log_message(f"启动耗时: 导入 {marks['imports']} ms，界面 {marks['widgets']} ms，"
+                         f"首帧 {marks['first_frame']} ms，预加载完成 {marks['preload']} ms")
+        self.root.after(LOG_FLUSH_INTERVAL * 2, self.root.destroy)
         
     def setup_styles(self):
         """设置界面样式"""
@@ -137,12 +233,37 @@ class DSTServerConfigTool:
                                  command=self.reset_form)
         reset_button.pack(side=tk.LEFT)
         
+        # 取消按钮（仅在配置过程中可用）
+        self.cancel_button = ttk.Button(button_frame, text="⏹ 取消", 
+                                       command=self.cancel_configuration, state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 停止服务器按钮（服务器由本工具启动并管理时可用）
+        self.stop_button = ttk.Button(button_frame, text="⏹ 停止服务器", 
+                                     command=self.stop_servers, state='disabled')
+        self.stop_button.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 滚动重启按钮：逐个分片存档后重启，始终至少有一个分片在线
+        self.restart_button = ttk.Button(button_frame, text="🔁 滚动重启", 
+                                        command=self.restart_servers, state='disabled')
+        self.restart_button.pack(side=tk.LEFT, padx=(10, 0))
+        
         # 进度条
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(left_frame, variable=self.progress_var, 
                                            maximum=100, length=500)
         self.progress_bar.grid(row=23, column=0, pady=(5, 2), sticky=(tk.W, tk.E))
         
+        # 分片状态（PID、CPU、内存）
+        self.shard_status_var = tk.StringVar(value="服务器未运行")
+        shard_status_label = ttk.Label(left_frame, textvariable=self.shard_status_var, style='Info.TLabel')
+        shard_status_label.grid(row=24, column=0, sticky=tk.W, pady=(2, 5))
+        
+        # 部署前检查结果
+        self.preflight_var = tk.StringVar(value="正在等待部署前检查...")
+        preflight_label = ttk.Label(left_frame, textvariable=self.preflight_var, style='Info.TLabel')
+        preflight_label.grid(row=25, column=0, sticky=tk.W, pady=(2, 5))
+        
         # 日志区域 - 独占右框架
         log_label = ttk.Label(right_frame, text="输出日志:", style='Header.TLabel')
         log_label.grid(row=0, column=0, sticky=tk.W, pady=(2, 0))
@@ -151,6 +272,16 @@ class DSTServerConfigTool:
                                                  font=('Consolas', 8), bg='#2c3e50', fg='#ecf0f1')
         self.log_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # 配置标签颜色
+        self.log_text.tag_config("timestamp", foreground="#95a5a6")
+        self.log_text.tag_config("message", foreground="#ecf0f1")
+        for level, color in LOG_LEVEL_COLORS.items():
+            self.log_text.tag_config(level.lower(), foreground=color, font=('Consolas', 9, 'bold'))
+        
+        # 开始定时批量刷新日志和分片状态
+        self.root.after(LOG_FLUSH_INTERVAL, self.flush_log_queue)
+        self.root.after(SHARD_STATUS_INTERVAL, self.refresh_shard_status)
+        
         # 配置网格权重
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
@@ -159,8 +290,8 @@ class DSTServerConfigTool:
         # 初始化wraplength
         self.root.after(100, self.update_all_wraplengths)
         
-        # 配置滚动区域
-        self.configure_scroll_region()
+        # 配置滚动区域（在空闲时进行，不在首帧之前强制完成一次布局）
+        self.root.after_idle(self.configure_scroll_region)
         
     def create_scrollable_frame(self):
         """创建可滚动的框架"""
@@ -307,6 +438,7 @@ class DSTServerConfigTool:
             
     def browse_file(self, var_name, file_type):
         """浏览文件或文件夹"""
+        from tkinter import filedialog, messagebox
         var = getattr(self, var_name)
         
         if file_type == "folder":
@@ -338,6 +470,7 @@ class DSTServerConfigTool:
             
     def browse_folder(self, var_name):
         """浏览文件夹"""
+        from tkinter import filedialog, messagebox
         var = getattr(self, var_name)
         path = filedialog.askdirectory(title="选择文件夹")
         if path:
@@ -367,45 +500,81 @@ class DSTServerConfigTool:
         self.start_button.config(state='normal')
         
     def log_message(self, message, level="INFO"):
-        """添加日志消息（线程安全）"""
-        def _log():
-            timestamp = time.strftime("%H:%M:%S")
-            
-            # 根据级别设置颜色
-            color_map = {
-                "INFO": "#3498db",
-                "SUCCESS": "#2ecc71", 
-                "WARNING": "#f39c12",
-                "ERROR": "#e74c3c"
-            }
-            
-            color = color_map.get(level, "#3498db")
-            
-            # 插入带颜色的文本
-            self.log_text.insert(tk.END, f"[{timestamp}] ", "timestamp")
-            self.log_text.insert(tk.END, f"[{level}] ", level.lower())
-            self.log_text.insert(tk.END, f"{message}\n", "message")
-            
-            # 配置标签颜色
-            self.log_text.tag_config("timestamp", foreground="#95a5a6")
-            self.log_text.tag_config(level.lower(), foreground=color, font=('Consolas', 9, 'bold'))
-            self.log_text.tag_config("message", foreground="#ecf0f1")
-            
-            self.log_text.see(tk.END)
+        """添加日志消息（线程安全）
         
-        self.root.after(0, _log)
-        self.root.update_idletasks()
+        消息先放入队列，由Tk主循环定时批量写入界面和滚动日志文件
+        """
+        timestamp = time.strftime("%H:%M:%S")
+        self.log_queue.put((timestamp, level, message))
         
+    def flush_log_queue(self):
+        """在Tk主循环中批量写入排队的日志和最新进度，然后重新定时"""
+        batch = []
+        try:
+            while len(batch) < LOG_BATCH_SIZE:
+                batch.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+            
+        self.write_file_log(batch)
+        if batch:
+            for timestamp, level, message in batch:
+                # 插入带颜色的文本
+                self.log_text.insert(tk.END, f"[{timestamp}] ", "timestamp")
+                self.log_text.insert(tk.END, f"[{level}] ", level.lower())
+                self.log_text.insert(tk.END, f"{message}\n", "message")
+                
+            # 超出上限时删除最早的行，完整日志保存在日志文件中
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_MAX_LINES:
+                self.log_text.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
+            self.log_text.see(tk.END)
+            
+        progress = self.pending_progress
+        if progress is not None:
+            self.pending_progress = None
+            self.progress_var.set(progress)
+            
+        preflight = self.pending_preflight
+        if preflight is not None:
+            self.pending_preflight = None
+            self.apply_preflight(preflight)
+            
+        supervisors = self.pending_finish
+        if supervisors is not None:
+            self.pending_finish = None
+            self.finish_configuration(supervisors)
+            
+        if self.pending_restart_done:
+            self.pending_restart_done = False
+            self.finish_restart()
+            
+        if self.pending_startup_report:
+            self.pending_startup_report = False
+            self.report_startup()
+            
+        # 队列中还有积压时尽快继续处理
+        delay = 1 if self.log_queue.qsize() else LOG_FLUSH_INTERVAL
+        self.root.after(delay, self.flush_log_queue)
+        
+    def write_file_log(self, batch):
+        """把一批日志写入滚动日志文件；文件日志尚未创建时先暂存"""
+        if self.file_logger is None:
+            self.file_log_backlog.extend(batch)
+            return
+        if self.file_log_backlog:
+            batch = self.file_log_backlog + batch
+            self.file_log_backlog = []
+        for _, level, message in batch:
+            self.file_logger.log(self.file_log_levels.get(level, logging.INFO), f"[{level}] {message}")
+            
     def update_progress(self, value):
-        """更新进度条（线程安全）"""
-        def _update():
-            self.progress_var.set(value)
-        
-        self.root.after(0, _update)
-        self.root.update_idletasks()
+        """更新进度条（线程安全，由flush_log_queue在主线程中应用）"""
+        self.pending_progress = value
         
     def validate_inputs(self):
         """验证输入"""
+        from tkinter import messagebox
         if not self.config_file.get():
             messagebox.showerror("错误", "请选择配置文件！")
             return False
@@ -420,292 +589,195 @@ class DSTServerConfigTool:
             return False
         return True
         
+    def schedule_preflight(self, *args):
+        """输入变化后延迟PREFLIGHT_DEBOUNCE毫秒运行检查，连续输入时只检查最后一次"""
+        self.preflight_generation += 1
+        if self.preflight_after is not None:
+            self.root.after_cancel(self.preflight_after)
+        self.preflight_after = self.root.after(PREFLIGHT_DEBOUNCE, self.start_preflight)
+        
+    def start_preflight(self):
+        """在工作线程中检查当前输入"""
+        self.preflight_after = None
+        generation = self.preflight_generation
+        config = self.collect_config()
+        threading.Thread(target=self.run_preflight, args=(generation, config), daemon=True).start()
+        
+    def run_preflight(self, generation, config):
+        """运行部署前检查（在工作线程中执行），检查期间输入又变化时丢弃结果"""
+        with self.preflight_lock:
+            if generation != self.preflight_generation:
+                return
+            report = self.check_preflight(config)
+            self.pending_preflight = (generation, config, report)
+            
+    def check_preflight(self, config):
+        """用缓存的检查器检查配置，同一路径没有变化时不重复检查"""
+        if self.preflight_checker is None:
+            from dst_preflight import PreflightChecker
+            self.preflight_checker = PreflightChecker()
+        return self.preflight_checker.check(config)
+        
+    def apply_preflight(self, preflight):
+        """在Tk主循环中显示检查结果"""
+        generation, config, report = preflight
+        if generation != self.preflight_generation:
+            return
+        self.preflight_result = (config, report)
+        self.preflight_var.set(report.summary())
+        
     def start_configuration(self):
         """开始配置"""
         if not self.validate_inputs():
             return
             
+        # 输入没有变化且已检查出问题时直接提示，不启动部署
+        config = self.collect_config()
+        if self.preflight_result is not None and self.preflight_result[0] == config:
+            report = self.preflight_result[1]
+            if not report.ok:
+                from tkinter import messagebox
+                messagebox.showerror("错误", "部署前检查未通过：\n" + "\n".join(report.errors))
+                return
+            
         # 禁用开始按钮
         self.start_button.config(state='disabled')
+        self.cancel_event.clear()
+        self.cancel_button.config(state='normal')
+        
+        # 仍在运行的服务器：切换集群前存档并关闭，集群未变化时滚动重启
+        running = {name: supervisor for name, supervisor in self.supervisors if supervisor.is_running()}
         
         # 在新线程中运行配置过程
-        config_thread = threading.Thread(target=self.run_configuration)
+        config_thread = threading.Thread(target=self.run_configuration, args=(config, running))
         config_thread.daemon = True
         config_thread.start()
         
-    def run_configuration(self):
-        """运行配置过程"""
+    def cancel_configuration(self):
+        """请求取消正在进行的配置"""
+        self.cancel_event.set()
+        self.cancel_button.config(state='disabled')
+        self.log_message("正在取消配置...", "WARNING")
+        
+    def run_configuration(self, config, running):
+        """运行配置过程（在工作线程中执行部署流程，不直接操作控件）"""
+        from dst_pipeline import DeploymentCancelled, deploy_clusters
+        pipelines = []
         try:
-            self.log_message("开始配置饥荒联机版专用服务器...")
-            
-            # 步骤1: 设置路径
-            klei_path = f"C:\\Users\\{self.current_user}\\Documents\\Klei\\DoNotStarveTogether"
-            local_server_path = f"{klei_path}\\MyDediServer"
-            
-            self.log_message(f"设置Klei路径: {klei_path}")
-            self.update_progress(10)
-            
-            # 步骤2: 解压配置文件
-            self.log_message("正在解压配置文件...")
-            self.extract_config_file(klei_path)
-            self.log_message("配置文件解压完成", "SUCCESS")
-            self.update_progress(20)
-            
-            # 步骤3: 清理本地服务器文件夹
-            self.log_message("正在清理本地服务器文件夹...")
-            self.clean_server_folder(local_server_path)
-            self.log_message("保留cluster_token.txt文件", "WARNING")
-            self.log_message("其他文件已删除", "SUCCESS")
-            self.update_progress(35)
-            
-            # 步骤4: 复制世界文件
-            self.log_message("正在复制世界文件...")
-            self.copy_world_files(local_server_path)
-            self.log_message("世界文件复制完成", "SUCCESS")
-            self.update_progress(50)
-            
-            # 步骤5: 复制模组（仅当勾选时执行）
-            if self.steam_mod_var.get():
-                self.log_message("正在复制模组文件...")
-                self.copy_mods()
-                self.log_message("模组文件复制完成", "SUCCESS")
-            else:
-                self.log_message("跳过模组复制", "INFO")
-            self.update_progress(70)
-            
-            # 步骤6: 运行SteamCMD更新
-            self.log_message("正在运行SteamCMD更新...")
-            self.update_steamcmd()
-            self.log_message("SteamCMD更新完成", "SUCCESS")
-            self.update_progress(85)
-            
-            # 步骤7: 启动服务器
-            self.log_message("正在启动服务器...")
-            self.start_servers()
-            self.log_message("服务器启动完成！", "SUCCESS")
-            self.update_progress(100)
-            
-            self.log_message("🎉 配置完成！您的饥荒联机版本地服务器正在启动！", "SUCCESS")
-            
+            # 再检查一次以发现后台检查之后的变化，未变化的路径直接使用缓存
+            # 与后台检查共用同一个检查器和缓存，同一时间只能有一个线程在检查
+            with self.preflight_lock:
+                report = self.check_preflight(config)
+            for warning in report.warnings:
+                self.log_message(warning, "WARNING")
+            if not report.ok:
+                for error in report.errors:
+                    self.log_message(error, "ERROR")
+                self.log_message("部署前检查未通过，请修改后重试", "ERROR")
+                return
+            self.log_message(report.summary())
+            deploy_clusters(config, on_event=self.handle_pipeline_event,
+                            cancel_event=self.cancel_event, pipelines=pipelines, running=running)
+        except DeploymentCancelled:
+            self.log_message("配置已取消", "WARNING")
         except Exception as e:
             self.log_message(f"配置过程中出现错误: {str(e)}", "ERROR")
             import traceback
             self.log_message(f"详细错误信息: {traceback.format_exc()}", "ERROR")
         finally:
-            # 重新启用开始按钮
-            self.start_button.config(state='normal')
-            
-    def extract_config_file(self, target_path):
-        """解压配置文件"""
-        config_file = self.config_file.get()
-        if not os.path.exists(config_file):
-            raise FileNotFoundError(f"配置文件不存在: {config_file}")
-            
-        with zipfile.ZipFile(config_file, 'r') as zip_ref:
-            zip_ref.extractall(target_path)
-            
-    def clean_server_folder(self, server_path):
-        """清理服务器文件夹"""
-        if not os.path.exists(server_path):
-            os.makedirs(server_path)
-            return
-            
-        # 备份cluster_token.txt
-        cluster_token_path = os.path.join(server_path, "cluster_token.txt")
-        backup_path = os.path.join(server_path, "cluster_token.txt.bak")
-        
-        if os.path.exists(cluster_token_path):
-            shutil.copy2(cluster_token_path, backup_path)
-            
-        # 删除除cluster_token.txt外的所有文件和文件夹
-        for item in os.listdir(server_path):
-            item_path = os.path.join(server_path, item)
-            if item != "cluster_token.txt":
-                if os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-                else:
-                    os.remove(item_path)
-                    
-        # 恢复cluster_token.txt
-        if os.path.exists(backup_path):
-            shutil.move(backup_path, cluster_token_path)
-                    
-    def copy_world_files(self, target_path):
-        """复制世界文件"""
-        world_folder = self.world_folder.get()
-        if not os.path.exists(world_folder):
-            raise FileNotFoundError(f"世界文件夹不存在: {world_folder}")
-            
-        for item in os.listdir(world_folder):
-            src = os.path.join(world_folder, item)
-            dst = os.path.join(target_path, item)
-            
-            if os.path.isdir(src):
-                shutil.copytree(src, dst, dirs_exist_ok=True)
+            started = {name: supervisor for name, supervisor in running.items() if supervisor.is_running()}
+            started.update((p.cluster_name, p.supervisor) for p in pipelines if p.supervisor is not None)
+            # Tk不是线程安全的，按钮和分片列表交给主循环更新
+            self.pending_finish = list(started.items())
+            
+    def finish_configuration(self, supervisors):
+        """部署线程结束后在Tk主循环中记录分片管理器并恢复按钮"""
+        self.supervisors = supervisors
+        # 重新启用开始按钮
+        self.start_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+            
+    def handle_pipeline_event(self, event):
+        """把部署流程的事件转发到日志和进度条"""
+        if event["type"] == "log":
+            self.log_message(event["message"], event["level"])
+        elif event["type"] == "progress":
+            self.update_progress(event["value"])
+            
+    def refresh_shard_status(self):
+        """定时刷新分片状态显示"""
+        running = [(name, supervisor) for name, supervisor in self.supervisors if supervisor.is_running()]
+        if running:
+            from dst_supervisor import format_shard_stats
+            if len(self.supervisors) == 1:
+                text = format_shard_stats(running[0][1].snapshot())
             else:
-                shutil.copy2(src, dst)
-                
-    def copy_mods(self):
-        """复制模组文件"""
-        steam_path = self.steam_path.get()
-        steamcmd_path = self.steamcmd_path.get()
-        
-        workshop_path = f"{steam_path}\\steamapps\\workshop\\content\\322330"
-        mods_path = f"{steamcmd_path}\\steamapps\\common\\Don't Starve Together Dedicated Server\\mods"
-        
-        self.log_message(f"Workshop路径: {workshop_path}")
-        self.log_message(f"Mods目标路径: {mods_path}")
-        
-        if not os.path.exists(workshop_path):
-            self.log_message(f"警告: Steam Workshop路径不存在: {workshop_path}", "WARNING")
+                text = "\n".join(f"[{name}] {format_shard_stats(supervisor.snapshot())}"
+                                 for name, supervisor in running)
+            self.shard_status_var.set(text)
+            self.stop_button.config(state='normal')
+            self.restart_button.config(state='disabled' if self.restarting else 'normal')
+        else:
+            self.shard_status_var.set("服务器未运行")
+            self.stop_button.config(state='disabled')
+            self.restart_button.config(state='disabled')
+        self.root.after(SHARD_STATUS_INTERVAL, self.refresh_shard_status)
+        
+    def stop_servers(self):
+        """停止由本工具启动的分片进程"""
+        supervisors = [supervisor for _, supervisor in self.supervisors]
+        if not supervisors:
             return
-            
-        # 初始化计数器
-        workshop_count = 0
-        local_count = 0
-        
-        # 删除现有mods文件夹
-        if os.path.exists(mods_path):
-            self.log_message("删除现有mods文件夹...")
-            shutil.rmtree(mods_path)
-        os.makedirs(mods_path)
-        self.log_message("创建新的mods文件夹")
-        
-        # 复制workshop内容并重命名
-        if os.path.exists(workshop_path):
-            self.log_message("开始复制workshop模组...")
-            for item in os.listdir(workshop_path):
-                src = os.path.join(workshop_path, item)
-                dst = os.path.join(mods_path, f"workshop-{item}")
-                
-                if os.path.isdir(src):
+        self.stop_button.config(state='disabled')
+        self.restart_cancel.set()
+        self.log_message("正在停止服务器...", "WARNING")
+        
+        def _stop():
+            # 通过控制台让各分片存档后退出
+            for supervisor in supervisors:
+                supervisor.stop()
+            self.log_message("服务器已停止", "SUCCESS")
+            
+        threading.Thread(target=_stop, daemon=True).start()
+        
+    def restart_servers(self):
+        """逐个分片滚动重启由本工具启动的服务器"""
+        supervisors = [(name, supervisor) for name, supervisor in self.supervisors if supervisor.is_running()]
+        if not supervisors:
+            return
+        self.restarting = True
+        self.restart_cancel.clear()
+        self.restart_button.config(state='disabled')
+        
+        def _restart():
+            from dst_pipeline import READY_TIMEOUT
+            ready_timeout = self.saved_config.get('ready_timeout', READY_TIMEOUT)
+            completed = True
+            try:
+                for name, supervisor in supervisors:
                     try:
-                        shutil.copytree(src, dst)
-                        workshop_count += 1
-                        self.log_message(f"复制workshop模组: {item}")
-                    except Exception as e:
-                        self.log_message(f"复制workshop模组 {item} 时出错: {str(e)}", "WARNING")
-            
-            self.log_message(f"共复制 {workshop_count} 个workshop模组")
-                    
-        # 复制本地mods
-        local_mods_path = f"{steam_path}\\steamapps\\common\\Don't Starve Together\\mods"
-        if os.path.exists(local_mods_path):
-            self.log_message("开始复制本地模组...")
-            for item in os.listdir(local_mods_path):
-                src = os.path.join(local_mods_path, item)
-                dst = os.path.join(mods_path, item)
+                        if not supervisor.rolling_restart(ready_timeout=ready_timeout,
+                                                          cancel_event=self.restart_cancel):
+                            self.log_message(f"[{name}] 滚动重启已中止", "WARNING")
+                            completed = False
+                            break
+                    except RuntimeError as e:
+                        self.log_message(f"[{name}] 滚动重启失败: {str(e)}", "ERROR")
+                        completed = False
+                if completed:
+                    self.log_message("滚动重启完成", "SUCCESS")
+            finally:
+                # Tk不是线程安全的，按钮交给主循环恢复
+                self.pending_restart_done = True
                 
-                if os.path.isdir(src):
-                    try:
-                        shutil.copytree(src, dst, dirs_exist_ok=True)
-                        local_count += 1
-                        self.log_message(f"复制本地模组: {item}")
-                    except Exception as e:
-                        self.log_message(f"复制本地模组 {item} 时出错: {str(e)}", "WARNING")
-            
-            self.log_message(f"共复制 {local_count} 个本地模组")
+        threading.Thread(target=_restart, daemon=True).start()
         
-        total_count = workshop_count + local_count
-        self.log_message(f"模组复制完成，总计 {total_count} 个模组", "SUCCESS")
-            
-    def update_steamcmd(self):
-        """更新SteamCMD"""
-        steamcmd_path = self.steamcmd_path.get()
-        steamcmd_exe = f"{steamcmd_path}\\steamcmd.exe"
+    def finish_restart(self):
+        """滚动重启线程结束后在Tk主循环中恢复重启按钮"""
+        self.restarting = False
+        if any(supervisor.is_running() for _, supervisor in self.supervisors):
+            self.restart_button.config(state='normal')
         
-        if not os.path.exists(steamcmd_exe):
-            raise FileNotFoundError(f"SteamCMD不存在: {steamcmd_exe}")
-            
-        cmd = [steamcmd_exe, "+login", "anonymous", "+app_update", "343050", "validate", "+quit"]
-        self.log_message(f"执行命令: {' '.join(cmd)}")
-        
-        try:
-            # 使用更安全的方式执行命令
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                timeout=600,  # 增加超时时间到10分钟
-                encoding='utf-8',
-                errors='ignore'  # 忽略编码错误
-            )
-            
-            # 输出命令执行结果到日志
-            if result.stdout:
-                # 限制输出长度，避免日志过长
-                output_lines = result.stdout.split('\n')
-                for line in output_lines[:50]:  # 只显示前50行
-                    if line.strip():
-                        self.log_message(f"输出: {line}")
-                if len(output_lines) > 50:
-                    self.log_message(f"... 还有 {len(output_lines) - 50} 行输出被省略", "INFO")
-                    
-            if result.stderr:
-                error_lines = result.stderr.split('\n')
-                for line in error_lines[:20]:  # 只显示前20行错误
-                    if line.strip():
-                        self.log_message(f"错误: {line}", "WARNING")
-                if len(error_lines) > 20:
-                    self.log_message(f"... 还有 {len(error_lines) - 20} 行错误被省略", "WARNING")
-            
-            # 检查返回码
-            if result.returncode != 0:
-                self.log_message(f"SteamCMD返回非零退出码: {result.returncode}", "WARNING")
-                # 不抛出异常，继续执行，因为有些警告不影响使用
-            else:
-                self.log_message("SteamCMD更新成功完成", "SUCCESS")
-                
-        except subprocess.TimeoutExpired:
-            self.log_message("SteamCMD更新超时，但可能仍在运行中", "WARNING")
-        except Exception as e:
-            self.log_message(f"执行SteamCMD时发生错误: {str(e)}", "ERROR")
-            # 不抛出异常，继续执行
-            
-    def start_servers(self):
-        """启动服务器"""
-        steamcmd_path = self.steamcmd_path.get()
-        server_path = f"{steamcmd_path}\\steamapps\\common\\Don't Starve Together Dedicated Server\\bin"
-        
-        if not os.path.exists(server_path):
-            raise FileNotFoundError(f"服务器路径不存在: {server_path}")
-            
-        # 检查可执行文件是否存在
-        server_exe = f"{server_path}\\dontstarve_dedicated_server_nullrenderer.exe"
-        if not os.path.exists(server_exe):
-            raise FileNotFoundError(f"服务器可执行文件不存在: {server_exe}")
-            
-        # 启动Master服务器
-        master_cmd = [
-            server_exe,
-            "-console", "-cluster", "MyDediServer", "-shard", "Master"
-        ]
-        
-        # 启动Caves服务器
-        caves_cmd = [
-            server_exe,
-            "-console", "-cluster", "MyDediServer", "-shard", "Caves"
-        ]
-        
-        self.log_message(f"切换到目录: {server_path}")
-        self.log_message("启动Master服务器...")
-        self.log_message(f"Master命令: {' '.join(master_cmd)}")
-        
-        self.log_message("启动Caves服务器...")
-        self.log_message(f"Caves命令: {' '.join(caves_cmd)}")
-        
-        try:
-            # 启动服务器进程
-            master_process = subprocess.Popen(master_cmd, cwd=server_path)
-            caves_process = subprocess.Popen(caves_cmd, cwd=server_path)
-            
-            self.log_message(f"Master服务器进程ID: {master_process.pid}")
-            self.log_message(f"Caves服务器进程ID: {caves_process.pid}")
-            self.log_message("服务器启动命令已执行", "SUCCESS")
-        except Exception as e:
-            self.log_message(f"启动服务器时出错: {str(e)}", "ERROR")
-            # 不抛出异常，继续执行
-
     def update_wraplength(self, label, event=None):
         """动态更新Label的wraplength以适配左侧框架大小"""
         if event:
@@ -728,6 +800,7 @@ class DSTServerConfigTool:
             webbrowser.open(url)
             self.log_message(f"已打开浏览器访问: {url}", "INFO")
         except Exception as e:
+            from tkinter import messagebox
             messagebox.showerror("错误", f"无法打开浏览器: {str(e)}\n请手动访问以下链接：\n{url}")
             self.log_message(f"无法打开浏览器，请手动访问: {url}", "ERROR")
 
@@ -748,15 +821,22 @@ class DSTServerConfigTool:
         self.log_message("配置文件不存在，使用默认配置", "INFO")
         return {'steam_mod': True}
     
-    def save_config(self):
-        """保存当前配置到文件"""
-        config = {
+    def collect_config(self):
+        """收集界面上的当前配置"""
+        # 保留界面上没有对应输入项的高级配置（如mod_hash）
+        config = dict(self.saved_config)
+        config.update({
             'config_file': self.config_file.get(),
             'steamcmd_path': self.steamcmd_path.get(),
             'steam_path': self.steam_path.get(),
             'world_folder': self.world_folder.get(),
             'steam_mod': self.steam_mod_var.get()
-        }
+        })
+        return config
+    
+    def save_config(self):
+        """保存当前配置到文件"""
+        config = self.collect_config()
         
         try:
             with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f: